@@ -0,0 +1,303 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from Versao_Codigo import versao_modulos
+
+# ==========================================
+# Content-addressed cache of pipeline stages
+# ==========================================
+# A stage result is stored under the hash of everything that determines it: the
+# stage name, the source of the module defining the stage and of every project
+# module it imports (see Versao_Codigo), its arguments (arrays, DataFrames, dicts, seeds... hashed by
+# value; input files by content) and its keyword parameters. A changed input or a
+# changed line of code gives a new key, so only the stages that are really
+# affected run again.
+#
+# Arrays are saved as .npy and DataFrames as one .npy per column (text columns as
+# codes + categories), opened with mmap_mode='r'; everything else is pickled.
+# Entries live in <diretorio>/<ch>/<chave>/, written to a temporary folder and
+# renamed into place; every hit refreshes the entry's mtime and the oldest entries
+# are evicted once the cache grows past `limite_bytes` (LRU).
+
+DIRETORIO_PADRAO = os.environ.get(
+    'STATESIM_CACHE', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache_etapas')
+)
+LIMITE_PADRAO_BYTES = 2 * 1024 ** 3
+ARQUIVO_META = 'meta.json'
+
+class Arquivo:
+    """Marks an argument as an input file: hashed by content, passed to the stage as its path."""
+    _impressoes = {}
+
+    def __init__(self, caminho):
+        self.caminho = os.path.abspath(caminho)
+
+    def __repr__(self):
+        return f"Arquivo({self.caminho!r})"
+
+    def impressao(self):
+        """Content hash, memoized per (path, size, mtime)."""
+        estado = os.stat(self.caminho)
+        marca = (self.caminho, estado.st_size, estado.st_mtime_ns)
+        if marca not in Arquivo._impressoes:
+            resumo = hashlib.blake2b(digest_size=16)
+            with open(self.caminho, 'rb') as arquivo:
+                for bloco in iter(lambda: arquivo.read(1 << 20), b''):
+                    resumo.update(bloco)
+            Arquivo._impressoes[marca] = resumo.hexdigest()
+        return Arquivo._impressoes[marca]
+
+def _atualizar(resumo, valor):
+    """Feeds a value into the hash, recursively and by content."""
+    if isinstance(valor, Arquivo):
+        resumo.update(b'arquivo:' + valor.impressao().encode())
+    elif isinstance(valor, np.ndarray):
+        resumo.update(f'ndarray:{valor.dtype.str}:{valor.shape}:'.encode())
+        if valor.dtype.hasobject:
+            _atualizar(resumo, valor.tolist())
+        else:
+            resumo.update(np.ascontiguousarray(valor).tobytes())
+    elif isinstance(valor, (pd.DataFrame, pd.Series)):
+        resumo.update(f'{type(valor).__name__}:{valor.shape}:'.encode())
+        if isinstance(valor, pd.DataFrame):
+            _atualizar(resumo, [str(c) for c in valor.columns])
+            _atualizar(resumo, [str(t) for t in valor.dtypes])
+        else:
+            _atualizar(resumo, [str(valor.name), str(valor.dtype)])
+        resumo.update(pd.util.hash_pandas_object(valor, index=True).to_numpy().tobytes())
+    elif isinstance(valor, dict):
+        resumo.update(f'dict:{len(valor)}:'.encode())
+        for chave in sorted(valor, key=repr):
+            _atualizar(resumo, chave)
+            _atualizar(resumo, valor[chave])
+    elif isinstance(valor, (list, tuple)):
+        resumo.update(f'{type(valor).__name__}:{len(valor)}:'.encode())
+        for item in valor:
+            _atualizar(resumo, item)
+    elif isinstance(valor, (str, bytes, int, float, bool, complex, type(None), np.generic)):
+        resumo.update(f'{type(valor).__name__}:{valor!r};'.encode())
+    elif hasattr(valor, '__dict__'):
+        # Plain objects (Sementes, GrafoProdutos...): public attributes only
+        resumo.update(f'objeto:{type(valor).__qualname__}:'.encode())
+        _atualizar(resumo, {k: v for k, v in vars(valor).items() if not k.startswith('_')})
+    else:
+        resumo.update(pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL))
+
+def impressao(*valores):
+    """Content hash (hex) of any mix of arrays, DataFrames, containers, files and scalars."""
+    resumo = hashlib.blake2b(digest_size=20)
+    for valor in valores:
+        _atualizar(resumo, valor)
+    return resumo.hexdigest()
+
+def versao_codigo(*objetos):
+    """
+    Hash of the modules defining the given functions, classes or modules and of the project
+    modules they import, transitively: a change in a helper the stage reaches through
+    another module (e.g. Contagem_Unidades under construir_hierarquia) changes the key too.
+    """
+    return versao_modulos(*objetos)
+
+def _tamanho_pasta(caminho):
+    return sum(os.path.getsize(os.path.join(raiz, nome)) for raiz, _, nomes in os.walk(caminho) for nome in nomes)
+
+# ------------------------------------------
+# Storage formats
+# ------------------------------------------
+def _salvar(pasta, valor):
+    if isinstance(valor, np.ndarray) and not valor.dtype.hasobject:
+        np.save(os.path.join(pasta, 'valor.npy'), valor)
+        return {'formato': 'ndarray'}
+    if type(valor) is pd.DataFrame and valor.columns.is_unique:
+        # Columns holding unhashable cells (lists, dicts) cannot be coded: pickle instead
+        codificadas = {}
+        try:
+            for i, (nome, coluna) in enumerate(valor.items()):
+                if not (isinstance(coluna.dtype, np.dtype) and not coluna.dtype.hasobject):
+                    codificadas[i] = pd.factorize(coluna, use_na_sentinel=True)
+        except TypeError:
+            codificadas = None
+    if type(valor) is pd.DataFrame and valor.columns.is_unique and codificadas is not None:
+        colunas = []
+        for i, (nome, coluna) in enumerate(valor.items()):
+            arquivo = f'coluna_{i}.npy'
+            if i not in codificadas:
+                np.save(os.path.join(pasta, arquivo), coluna.to_numpy())
+                colunas.append({'tipo': 'numerico', 'arquivo': arquivo})
+            else:
+                codigos, categorias = codificadas[i]
+                np.save(os.path.join(pasta, arquivo), codigos)
+                with open(os.path.join(pasta, f'categorias_{i}.pkl'), 'wb') as saida:
+                    pickle.dump((categorias, coluna.dtype), saida, protocol=pickle.HIGHEST_PROTOCOL)
+                colunas.append({'tipo': 'codificado', 'arquivo': arquivo, 'categorias': f'categorias_{i}.pkl'})
+        with open(os.path.join(pasta, 'estrutura.pkl'), 'wb') as saida:
+            pickle.dump((list(valor.columns), valor.index), saida, protocol=pickle.HIGHEST_PROTOCOL)
+        return {'formato': 'dataframe', 'colunas': colunas}
+    with open(os.path.join(pasta, 'valor.pkl'), 'wb') as saida:
+        pickle.dump(valor, saida, protocol=pickle.HIGHEST_PROTOCOL)
+    return {'formato': 'pickle'}
+
+def _carregar(pasta, meta):
+    formato = meta['formato']
+    if formato == 'ndarray':
+        return np.load(os.path.join(pasta, 'valor.npy'), mmap_mode='c')
+    if formato == 'dataframe':
+        with open(os.path.join(pasta, 'estrutura.pkl'), 'rb') as entrada:
+            nomes, indice = pickle.load(entrada)
+        dados = {}
+        for nome, coluna in zip(nomes, meta['colunas']):
+            valores = np.load(os.path.join(pasta, coluna['arquivo']), mmap_mode='c')
+            if coluna['tipo'] == 'codificado':
+                with open(os.path.join(pasta, coluna['categorias']), 'rb') as entrada:
+                    categorias, dtype = pickle.load(entrada)
+                codigos = np.asarray(valores)
+                if dtype == object:
+                    # Rebuilt as plain objects: a Categorical cast would come back as a string dtype
+                    valores = np.where(codigos >= 0, np.asarray(categorias, dtype=object)[np.maximum(codigos, 0)], np.nan)
+                    valores = pd.Series(valores, index=indice, dtype=object)
+                else:
+                    valores = pd.Series(pd.Categorical.from_codes(codigos, categorias).astype(dtype), index=indice)
+            else:
+                valores = pd.Series(valores, index=indice, copy=False)
+            dados[nome] = valores
+        # Every column is a Series on the same index: no alignment (duplicate labels are fine)
+        return pd.DataFrame(dados, columns=nomes, copy=False)
+    with open(os.path.join(pasta, 'valor.pkl'), 'rb') as entrada:
+        return pickle.load(entrada)
+
+# ------------------------------------------
+# Cache
+# ------------------------------------------
+class CacheEtapas:
+    """
+    Disk cache of stage results keyed by content.
+
+    Args:
+        diretorio (str): Cache folder (default: $STATESIM_CACHE or Main/.cache_etapas).
+        limite_bytes (int): Size above which the least recently used entries are evicted.
+    """
+    def __init__(self, diretorio=None, limite_bytes=LIMITE_PADRAO_BYTES):
+        self.diretorio = os.path.abspath(diretorio or DIRETORIO_PADRAO)
+        self.limite_bytes = limite_bytes
+        self.acertos = 0
+        self.falhas = 0
+        os.makedirs(self.diretorio, exist_ok=True)
+
+    def __repr__(self):
+        return f"CacheEtapas({self.diretorio!r}, acertos={self.acertos}, falhas={self.falhas})"
+
+    def _pasta(self, chave):
+        return os.path.join(self.diretorio, chave[:2], chave)
+
+    def chave(self, nome, codigo, argumentos=(), parametros=None):
+        """Key of a stage run: name + code version + arguments + parameters."""
+        return impressao(nome, codigo, list(argumentos), parametros or {})
+
+    def obter(self, chave):
+        """Returns (True, value) on a hit, (False, None) otherwise."""
+        pasta = self._pasta(chave)
+        try:
+            with open(os.path.join(pasta, ARQUIVO_META), encoding='utf-8') as entrada:
+                meta = json.load(entrada)
+            valor = _carregar(pasta, meta)
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+            return False, None
+        os.utime(os.path.join(pasta, ARQUIVO_META))  # recently used
+        return True, valor
+
+    def guardar(self, chave, valor, nome=''):
+        """Stores a value under `chave` (atomic: written aside and renamed into place)."""
+        destino = self._pasta(chave)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        temporaria = tempfile.mkdtemp(prefix='.tmp_', dir=self.diretorio)
+        try:
+            meta = _salvar(temporaria, valor)
+            meta['nome'] = nome
+            with open(os.path.join(temporaria, ARQUIVO_META), 'w', encoding='utf-8') as saida:
+                json.dump(meta, saida)
+            if os.path.exists(destino):
+                shutil.rmtree(destino, ignore_errors=True)
+            os.replace(temporaria, destino)
+        except OSError:
+            shutil.rmtree(temporaria, ignore_errors=True)
+            if not os.path.exists(os.path.join(destino, ARQUIVO_META)):
+                raise
+        self.remover_excedente()
+
+    def executar(self, funcao, *argumentos, nome=None, dependencias=(), **parametros):
+        """
+        Runs `funcao(*argumentos, **parametros)` through the cache.
+
+        Args:
+            dependencias (tuple): Extra functions, classes or modules whose code is part of the
+                key, for code the stage's module does not import (its own imports are covered).
+            argumentos: Arquivo(...) arguments are hashed by content and passed as paths.
+
+        Returns:
+            The stage result as stored in the cache, on a hit or a miss alike (arrays and
+            numeric DataFrame columns memory-mapped copy-on-write: writable, the file is
+            never changed).
+        """
+        nome = nome or f"{funcao.__module__}.{funcao.__qualname__}"
+        chave = self.chave(nome, versao_codigo(funcao, *dependencias), argumentos, parametros)
+        encontrado, valor = self.obter(chave)
+        if encontrado:
+            self.acertos += 1
+            return valor
+        self.falhas += 1
+        reais = [a.caminho if isinstance(a, Arquivo) else a for a in argumentos]
+        valor = funcao(*reais, **parametros)
+        self.guardar(chave, valor, nome)
+        # The reloaded entry, so a miss returns exactly what a later hit will
+        encontrado, recarregado = self.obter(chave)
+        return recarregado if encontrado else valor
+
+    def entradas(self):
+        """DataFrame of the entries (Chave, Nome, Bytes, Usado_em), most recent first."""
+        linhas = []
+        for prefixo in os.listdir(self.diretorio):
+            base = os.path.join(self.diretorio, prefixo)
+            if prefixo.startswith('.') or not os.path.isdir(base):
+                continue
+            for chave in os.listdir(base):
+                pasta = os.path.join(base, chave)
+                try:
+                    with open(os.path.join(pasta, ARQUIVO_META), encoding='utf-8') as entrada:
+                        nome = json.load(entrada).get('nome', '')
+                    usado = os.path.getmtime(os.path.join(pasta, ARQUIVO_META))
+                except (OSError, ValueError):
+                    nome, usado = '', 0.0
+                linhas.append({'Chave': chave, 'Nome': nome, 'Bytes': _tamanho_pasta(pasta), 'Usado_em': usado})
+        tabela = pd.DataFrame(linhas, columns=['Chave', 'Nome', 'Bytes', 'Usado_em'])
+        return tabela.sort_values('Usado_em', ascending=False, kind='stable').reset_index(drop=True)
+
+    def tamanho(self):
+        return int(self.entradas()['Bytes'].sum())
+
+    def remover_excedente(self, limite_bytes=None):
+        """Evicts the least recently used entries until the cache fits the limit."""
+        limite = self.limite_bytes if limite_bytes is None else limite_bytes
+        tabela = self.entradas()
+        excedente = tabela['Bytes'].cumsum() > limite
+        for chave in tabela.loc[excedente, 'Chave']:
+            shutil.rmtree(self._pasta(chave), ignore_errors=True)
+        return int(excedente.sum())
+
+    def limpar(self):
+        shutil.rmtree(self.diretorio, ignore_errors=True)
+        os.makedirs(self.diretorio, exist_ok=True)
+
+def em_cache(cache, funcao, *argumentos, **opcoes):
+    """CacheEtapas.executar when a cache is given, a plain call otherwise."""
+    if cache is not None:
+        return cache.executar(funcao, *argumentos, **opcoes)
+    opcoes.pop('nome', None)
+    opcoes.pop('dependencias', None)
+    return funcao(*[a.caminho if isinstance(a, Arquivo) else a for a in argumentos], **opcoes)
@@ -0,0 +1,68 @@
+import hashlib
+
+import numpy as np
+
+# ==========================================
+# Central RNG service: independent, reproducible streams
+# ==========================================
+# Every random draw comes from a numpy Generator seeded with
+# SeedSequence(semente, spawn_key=<stable hash of the stream name>). A stream is
+# named after what it generates (subsystem, municipality, attribute...), never
+# after who generates it, so the same shard gets the same numbers whatever the
+# chunk size, order or number of processes, and can be regenerated alone.
+# Names are hashed with blake2b (not hash(), which changes per process).
+#
+#   sementes = Sementes(42)
+#   rng = sementes.gerador('nomes', 'Brasília')
+#   rng_atributos = sementes.sub('atributos').gerador('Atributo_Int', 'Brasília')
+
+SEMENTE_PADRAO = 0
+
+def chave_estavel(*partes):
+    """
+    Stable spawn key of a stream name: one 32-bit word per part, the same in every
+    process and Python version.
+    """
+    return tuple(
+        int.from_bytes(hashlib.blake2b(repr(parte).encode('utf-8'), digest_size=4).digest(), 'little')
+        for parte in partes
+    )
+
+class Sementes:
+    """
+    Hands out named, independent random streams derived from one root seed.
+
+    Args:
+        semente (int): Root seed of the whole run (None draws fresh OS entropy).
+        prefixo (tuple): Name parts prepended to every stream (see sub).
+    """
+    def __init__(self, semente=SEMENTE_PADRAO, prefixo=()):
+        if semente is None:
+            semente = np.random.SeedSequence().entropy
+        self.semente = int(semente)
+        self.prefixo = tuple(prefixo)
+
+    def __repr__(self):
+        return f"Sementes({self.semente}, prefixo={self.prefixo!r})"
+
+    def sub(self, *partes):
+        """Streams scoped under a subsystem (e.g. sementes.sub('populacao'))."""
+        return Sementes(self.semente, self.prefixo + partes)
+
+    def sequencia(self, *partes):
+        """SeedSequence of the stream `prefixo + partes`."""
+        return np.random.SeedSequence(self.semente, spawn_key=chave_estavel(*self.prefixo, *partes))
+
+    def gerador(self, *partes):
+        """numpy Generator of the stream `prefixo + partes`."""
+        return np.random.default_rng(self.sequencia(*partes))
+
+    def geradores(self, chaves, *partes):
+        """{chave: Generator} for many shards of the same stream (e.g. every municipality)."""
+        return {chave: self.gerador(*partes, chave) for chave in chaves}
+
+def como_sementes(sementes=None):
+    """Accepts a Sementes, an int seed or None (default seed)."""
+    if isinstance(sementes, Sementes):
+        return sementes
+    return Sementes(SEMENTE_PADRAO if sementes is None else sementes)
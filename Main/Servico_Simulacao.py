@@ -0,0 +1,473 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+# ==========================================
+# Simulation service: economy, population and military behind one HTTP endpoint
+# ==========================================
+# A long-running asyncio server. The models (compiled product graph,
+# municipalities, age distribution and, on first use, the military hierarchy) are
+# loaded once per worker process by the pool initializer; the event loop only
+# parses requests and routes them. Demand and production-tick requests that arrive
+# within a short window are merged into one vectorized call (one row per request)
+# and the results split back, so concurrent clients share the work.
+#
+# Requests and responses are JSON (POST body / response body). Routes:
+#   GET  /saude                     -> {"status": "ok"}
+#   GET  /economia/produtos         -> product names and stages
+#   POST /economia/demanda          {"populacao": 200000}
+#   POST /economia/tick             {"populacao": 200000, "taxa": 0.95, "estoque": {...}}
+#   POST /populacao/consulta        {"municipio": "Brasília", "idade_min": 18, "idade_max": 45}
+#                                   (+ "filtros": {"Atributo_Ath": [71, null]} with --populacao-mapeada)
+#   POST /militar/unidade           {"nome": "..."}
+#   POST /militar/kml               {"output_dir": "unidades_tiles"}   (relative to PASTA_KML)
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+PASTA_ECONOMIA = os.path.join(RAIZ, 'economy_sistem')
+PASTA_CIDADAOS = os.path.join(RAIZ, 'citizen_generator')
+PASTA_MILITAR = os.path.join(RAIZ, 'military_sistem')
+
+ARQUIVO_PRODUTOS = os.path.join(PASTA_ECONOMIA, 'Data_Products.ods')
+ARQUIVO_MUNICIPIOS = os.path.join(PASTA_CIDADAOS, 'Filtered_Pop_Municipio.ods')
+ARQUIVO_IDADES = os.path.join(PASTA_CIDADAOS, 'Data_Pop_Age_Name.ods')
+ARQUIVO_UNIDADES = os.path.join(PASTA_MILITAR, 'Data_Military_Units.ods')
+PASTA_KML = os.path.join(RAIZ, 'saida_servico')  # every /militar/kml output_dir lives under it
+
+JANELA_LOTE = 0.005   # seconds a batch waits for more requests
+MAXIMO_LOTE = 256     # requests merged into one vectorized call
+
+class ErroRequisicao(Exception):
+    """Invalid request (answered with HTTP 400)."""
+
+# ------------------------------------------
+# Worker side: models loaded once per process
+# ------------------------------------------
+_MODELOS = {}
+
+def _preparar_caminhos():
+    for pasta in (PASTA_ECONOMIA, PASTA_MILITAR, PASTA_CIDADAOS):
+        if pasta not in sys.path:
+            sys.path.append(pasta)
+
+def carregar_modelos(populacao_mapeada=None):
+    """
+    Pool initializer: compiles the product graph and loads the population tables. With
+    `populacao_mapeada` (a Population_Columnar directory) every worker maps the generated
+    citizens, sharing one copy of the columns through the page cache.
+    """
+    _preparar_caminhos()
+    from Grafo_Produtos import carregar_tabelas, compilar_grafo
+    from Demanda_Regional import carregar_fracoes_idade, carregar_municipios
+
+    _MODELOS['grafo'] = compilar_grafo(carregar_tabelas(ARQUIVO_PRODUTOS))
+    _MODELOS['municipios'] = carregar_municipios(ARQUIVO_MUNICIPIOS)
+    _MODELOS['fracoes_idade'] = carregar_fracoes_idade(ARQUIVO_IDADES)
+    if populacao_mapeada is not None:
+        from Population_Columnar import MappedPopulation
+
+        _MODELOS['cidadaos'] = MappedPopulation(populacao_mapeada).store()
+
+def _hierarquia():
+    """Military hierarchy, built on first use (it needs the military workbook)."""
+    if 'forcas' not in _MODELOS:
+        from Main import carregar_dados, construir_hierarquia
+
+        if not os.path.exists(ARQUIVO_UNIDADES):
+            raise ErroRequisicao(f"Arquivo de unidades militares não encontrado: {ARQUIVO_UNIDADES}")
+        _MODELOS['forcas'] = construir_hierarquia(*carregar_dados(ARQUIVO_UNIDADES, ARQUIVO_MUNICIPIOS))
+    return _MODELOS['forcas']
+
+def tarefa_produtos():
+    grafo = _MODELOS['grafo']
+    return {'produtos': grafo.produtos, 'etapas': [grafo.nomes_etapas[e] for e in grafo.etapa]}
+
+def tarefa_demanda(pedidos):
+    """Accumulated demand of a batch of requests (one row each)."""
+    import numpy as np
+    from Grafo_Produtos import calcular_demanda_vetorizada
+
+    grafo = _MODELOS['grafo']
+    populacoes = np.array([float(pedido['populacao']) for pedido in pedidos])
+    matriz = calcular_demanda_vetorizada(grafo, populacoes)
+    return [{'demanda': grafo.para_dict(linha)} for linha in matriz]
+
+def tarefa_tick(pedidos):
+    """One production tick per request, all requests in one vectorized simulation."""
+    import numpy as np
+    from Grafo_Produtos import calcular_demanda_vetorizada
+    from Simulador_Vetorizado import capacidade_produtos, produtividade_plena, simular_producao
+
+    grafo = _MODELOS['grafo']
+    populacoes = np.array([float(pedido['populacao']) for pedido in pedidos])
+    taxas = np.array([float(pedido.get('taxa', 1.0)) for pedido in pedidos])
+    demanda = calcular_demanda_vetorizada(grafo, populacoes)
+    capacidade = capacidade_produtos(grafo, produtividade_plena(grafo, demanda) * taxas[:, None])
+    estoque = np.array([grafo.vetor(pedido.get('estoque', {})) for pedido in pedidos])
+    resultado = simular_producao(grafo, estoque, capacidade, demanda)
+    return [
+        {'producao': grafo.para_dict(producao), 'estoque': grafo.para_dict(final)}
+        for producao, final in zip(resultado['producao'], estoque)
+    ]
+
+def _consulta_cidadaos(pedido):
+    """Generated citizens matching the request (municipality, age band and attribute filters)."""
+    store = _MODELOS['cidadaos']
+    filtros = dict(pedido.get('filtros') or {})
+    filtros['Idade'] = (pedido.get('idade_min'), pedido.get('idade_max'))
+    if pedido.get('municipio') is not None:
+        filtros['Municipio'] = pedido['municipio']
+    try:
+        return {
+            'cidadaos': store.count(**filtros),
+            'populacao': store.count(weighted=True, **filtros),
+            'populacao_total': store.count(weighted=True),
+        }
+    except ValueError as erro:
+        raise ErroRequisicao(str(erro)) from None
+
+def tarefa_populacao(pedido):
+    """Population of a municipality (or of all) in an age band, from the source tables."""
+    if 'cidadaos' in _MODELOS:
+        return _consulta_cidadaos(pedido)
+    if pedido.get('filtros'):
+        raise ErroRequisicao("Filtros de atributos exigem o serviço iniciado com --populacao-mapeada.")
+    from Demanda_Regional import COLUNA_POPULACAO
+
+    municipios = _MODELOS['municipios']
+    fracoes = _MODELOS['fracoes_idade']
+    coluna = pedido.get('coluna', COLUNA_POPULACAO)
+    if coluna not in municipios.columns:
+        raise ErroRequisicao(f"Coluna de população inválida: {coluna}")
+    if pedido.get('municipio') is not None:
+        municipios = municipios[municipios['Nome'] == pedido['municipio']]
+        if municipios.empty:
+            raise ErroRequisicao(f"Município desconhecido: {pedido['municipio']}")
+    idades = fracoes.index.to_numpy()
+    faixa = (idades >= pedido.get('idade_min', idades.min())) & (idades <= pedido.get('idade_max', idades.max()))
+    total = float(municipios[coluna].sum())
+    return {'municipios': len(municipios), 'populacao': total * float(fracoes[faixa].sum()), 'populacao_total': total}
+
+def tarefa_unidade(pedido):
+    """Units with a given name, with their subordinates and chain of command."""
+    pilha = list(_hierarquia().values())
+    encontrados = []
+    while pilha:
+        unidade = pilha.pop()
+        if unidade.nome == pedido['nome']:
+            cadeia = []
+            superior = unidade.superior
+            while superior is not None:
+                cadeia.append(superior.nome)
+                superior = superior.superior
+            encontrados.append({
+                'nome': unidade.nome, 'nivel': unidade.nivel, 'id_unico': unidade.id_unico,
+                'lat': unidade.lat, 'lon': unidade.lon, 'efetivo': int(unidade.efetivo),
+                'cidade': unidade.cidade, 'superiores': cadeia,
+                'subordinados': [sub.nome for sub in unidade.subordinados],
+            })
+        pilha.extend(unidade.subordinados)
+    return {'unidades': encontrados}
+
+def pasta_kml(output_dir):
+    """Folder under PASTA_KML for a client-supplied relative `output_dir` (absolute paths and '..' are rejected)."""
+    if not isinstance(output_dir, str) or not output_dir.strip():
+        raise ErroRequisicao(f"'output_dir' deve ser um caminho relativo não vazio, não {output_dir!r}")
+    partes = output_dir.replace('\\', '/').split('/')
+    if os.path.isabs(output_dir) or os.path.splitdrive(output_dir)[0] or '..' in partes:
+        raise ErroRequisicao(f"'output_dir' deve ser relativo e não conter '..': {output_dir!r}")
+    base = os.path.realpath(PASTA_KML)
+    pasta = os.path.realpath(os.path.join(base, *partes))
+    # A symlink inside PASTA_KML must not lead out of it either
+    if os.path.commonpath([base, pasta]) != base:
+        raise ErroRequisicao(f"'output_dir' fora da pasta de saída do serviço: {output_dir!r}")
+    return pasta
+
+def tarefa_kml(pedido):
+    """Writes the tiled KML of the hierarchy under PASTA_KML and returns the tile index."""
+    pasta = pasta_kml(pedido.get('output_dir', 'unidades_tiles'))
+    from Main import gerar_kml_em_tiles
+
+    niveis = pedido.get('niveis', ["Exército", "Divisão", "Brigada", "Regimento"])
+    # Already inside a pool worker: the tiles are written sequentially
+    indice = gerar_kml_em_tiles(_hierarquia(), niveis, output_dir=pasta, processos=1)
+    return {'tiles': {camada: sorted(map(list, chaves)) for camada, chaves in indice.items()}}
+
+# ------------------------------------------
+# Event-loop side
+# ------------------------------------------
+class AgrupadorRequisicoes:
+    """
+    Collects requests for `janela` seconds (or until `maximo` arrive) and runs them
+    as one batch in the pool; every caller awaits its own slice of the result.
+    """
+    def __init__(self, executor, funcao_lote, janela=JANELA_LOTE, maximo=MAXIMO_LOTE):
+        self.executor = executor
+        self.funcao_lote = funcao_lote
+        self.janela = janela
+        self.maximo = maximo
+        self._pendentes = []
+        self._temporizador = None
+
+    async def enviar(self, pedido):
+        futuro = asyncio.get_running_loop().create_future()
+        self._pendentes.append((pedido, futuro))
+        if len(self._pendentes) >= self.maximo:
+            self._despachar()
+        elif self._temporizador is None:
+            self._temporizador = asyncio.get_running_loop().call_later(self.janela, self._despachar)
+        return await futuro
+
+    def _despachar(self):
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+            self._temporizador = None
+        lote, self._pendentes = self._pendentes, []
+        if lote:
+            asyncio.ensure_future(self._executar(lote))
+
+    async def _executar(self, lote):
+        pedidos = [pedido for pedido, _ in lote]
+        try:
+            resultados = await asyncio.get_running_loop().run_in_executor(self.executor, self.funcao_lote, pedidos)
+        except Exception as erro:
+            if len(lote) > 1:
+                # One bad request must not fail the others: rerun every request alone
+                await asyncio.gather(*(self._executar([item]) for item in lote))
+                return
+            for _, futuro in lote:
+                if not futuro.done():
+                    futuro.set_exception(erro)
+            return
+        for (_, futuro), resultado in zip(lote, resultados):
+            if not futuro.done():
+                futuro.set_result(resultado)
+
+class ServicoSimulacao:
+    """
+    HTTP/JSON simulation service.
+
+    Args:
+        processos (int): Worker processes (each loads the models once).
+        janela (float): Batching window in seconds.
+        populacao_mapeada (str): Population_Columnar directory answered by /populacao/consulta.
+    """
+    def __init__(self, processos=None, janela=JANELA_LOTE, maximo_lote=MAXIMO_LOTE, populacao_mapeada=None):
+        self.executor = ProcessPoolExecutor(
+            max_workers=processos or os.cpu_count(), initializer=carregar_modelos,
+            initargs=(None if populacao_mapeada is None else os.path.abspath(populacao_mapeada),),
+        )
+        self.demanda = AgrupadorRequisicoes(self.executor, tarefa_demanda, janela, maximo_lote)
+        self.tick = AgrupadorRequisicoes(self.executor, tarefa_tick, janela, maximo_lote)
+        self.servidor = None
+        self.produtos = None  # catalogue names, fetched from a worker by iniciar()
+        self._conexoes = set()
+        self.rotas = {
+            ('GET', '/saude'): self._saude,
+            ('GET', '/economia/produtos'): lambda corpo: self._no_pool(tarefa_produtos),
+            ('POST', '/economia/demanda'): lambda corpo: self.demanda.enviar(self._pedido_economia(corpo)),
+            ('POST', '/economia/tick'): lambda corpo: self.tick.enviar(self._pedido_economia(corpo)),
+            ('POST', '/populacao/consulta'): lambda corpo: self._no_pool(tarefa_populacao, corpo),
+            ('POST', '/militar/unidade'): lambda corpo: self._no_pool(tarefa_unidade, self._exigir(corpo, 'nome')),
+            ('POST', '/militar/kml'): lambda corpo: self._no_pool(tarefa_kml, self._pedido_kml(corpo)),
+        }
+
+    @staticmethod
+    def _exigir(corpo, *campos):
+        faltando = [campo for campo in campos if campo not in corpo]
+        if faltando:
+            raise ErroRequisicao(f"Campos obrigatórios ausentes: {faltando}")
+        return corpo
+
+    @staticmethod
+    def _pedido_kml(corpo):
+        """Checks output_dir on the event loop, so a bad path is answered before reaching the pool."""
+        pasta_kml(corpo.get('output_dir', 'unidades_tiles'))
+        return corpo
+
+    def _pedido_economia(self, corpo):
+        """
+        Validates and converts populacao/taxa/estoque before the request joins a batch,
+        so an invalid request is answered alone instead of failing the whole batch.
+        Products in estoque must be in the catalogue (unknown names would be dropped).
+        """
+        self._exigir(corpo, 'populacao')
+
+        def numero(valor, campo):
+            if isinstance(valor, bool):
+                raise ErroRequisicao(f"'{campo}' deve ser um número, não {valor!r}")
+            try:
+                convertido = float(valor)
+            except (TypeError, ValueError):
+                raise ErroRequisicao(f"'{campo}' deve ser um número, não {valor!r}") from None
+            if not math.isfinite(convertido) or convertido < 0:
+                raise ErroRequisicao(f"'{campo}' deve ser um número finito e não negativo, não {valor!r}")
+            return convertido
+
+        pedido = dict(corpo)
+        pedido['populacao'] = numero(corpo['populacao'], 'populacao')
+        if 'taxa' in corpo:
+            pedido['taxa'] = numero(corpo['taxa'], 'taxa')
+        if 'estoque' in corpo:
+            if not isinstance(corpo['estoque'], dict):
+                raise ErroRequisicao("'estoque' deve ser um objeto {produto: quantidade}")
+            desconhecidos = sorted(set(corpo['estoque']) - self.produtos) if self.produtos is not None else []
+            if desconhecidos:
+                raise ErroRequisicao(f"Produtos desconhecidos em 'estoque': {desconhecidos}")
+            pedido['estoque'] = {str(produto): numero(valor, f"estoque.{produto}") for produto, valor in corpo['estoque'].items()}
+        return pedido
+
+    async def _saude(self, corpo):
+        return {'status': 'ok'}
+
+    async def _no_pool(self, funcao, *argumentos):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, funcao, *argumentos)
+
+    async def iniciar(self, host='127.0.0.1', porta=8765):
+        """Starts listening (porta=0 picks a free port); returns the bound (host, port)."""
+        if self.produtos is None:
+            self.produtos = set((await self._no_pool(tarefa_produtos))['produtos'])
+        self.servidor = await asyncio.start_server(self._atender, host, porta)
+        return self.servidor.sockets[0].getsockname()[:2]
+
+    async def fechar(self):
+        if self.servidor is not None:
+            self.servidor.close()
+            for escritor in list(self._conexoes):
+                escritor.close()
+            await self.servidor.wait_closed()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    async def _atender(self, leitor, escritor):
+        """One connection: HTTP/1.1 requests with keep-alive."""
+        self._conexoes.add(escritor)
+        try:
+            while True:
+                linha = await leitor.readline()
+                if not linha:
+                    break
+                try:
+                    metodo, caminho, _ = linha.decode('latin-1').split(' ', 2)
+                except ValueError:
+                    await self._responder(escritor, 400, {'erro': 'Linha de requisição inválida'}, manter=False)
+                    break
+                cabecalhos = {}
+                while True:
+                    cabecalho = await leitor.readline()
+                    if cabecalho in (b'\r\n', b'\n', b''):
+                        break
+                    nome, _, valor = cabecalho.decode('latin-1').partition(':')
+                    cabecalhos[nome.strip().lower()] = valor.strip()
+                tamanho = int(cabecalhos.get('content-length', 0) or 0)
+                corpo = await leitor.readexactly(tamanho) if tamanho else b''
+                manter = cabecalhos.get('connection', '').lower() != 'close'
+                status, resposta = await self._rotear(metodo.upper(), caminho.split('?', 1)[0], corpo)
+                await self._responder(escritor, status, resposta, manter)
+                if not manter:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._conexoes.discard(escritor)
+            escritor.close()
+
+    async def _rotear(self, metodo, caminho, corpo):
+        rota = self.rotas.get((metodo, caminho))
+        if rota is None:
+            return 404, {'erro': f"Rota desconhecida: {metodo} {caminho}"}
+        try:
+            dados = json.loads(corpo) if corpo else {}
+            if not isinstance(dados, dict):
+                raise ErroRequisicao("O corpo deve ser um objeto JSON")
+            return 200, await rota(dados)
+        except (ErroRequisicao, json.JSONDecodeError, KeyError, ValueError, TypeError) as erro:
+            return 400, {'erro': str(erro)}
+        except Exception as erro:
+            return 500, {'erro': f"{type(erro).__name__}: {erro}"}
+
+    @staticmethod
+    async def _responder(escritor, status, resposta, manter=True):
+        motivos = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+        corpo = json.dumps(resposta, ensure_ascii=False).encode('utf-8')
+        cabecalho = (
+            f"HTTP/1.1 {status} {motivos.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(corpo)}\r\n"
+            f"Connection: {'keep-alive' if manter else 'close'}\r\n\r\n"
+        )
+        escritor.write(cabecalho.encode('latin-1') + corpo)
+        await escritor.drain()
+
+# ------------------------------------------
+# Local client
+# ------------------------------------------
+class ClienteSimulacao:
+    """Minimal keep-alive HTTP/JSON client for the service (one request at a time per client)."""
+    def __init__(self, host='127.0.0.1', porta=8765):
+        self.host = host
+        self.porta = porta
+        self._conexao = None
+
+    async def requisitar(self, caminho, corpo=None, metodo=None):
+        """Sends a request; returns (status, decoded JSON)."""
+        if self._conexao is None:
+            self._conexao = await asyncio.open_connection(self.host, self.porta)
+        leitor, escritor = self._conexao
+        metodo = metodo or ('GET' if corpo is None else 'POST')
+        dados = json.dumps(corpo).encode('utf-8') if corpo is not None else b''
+        escritor.write(
+            f"{metodo} {caminho} HTTP/1.1\r\nHost: {self.host}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(dados)}\r\n\r\n".encode('latin-1') + dados
+        )
+        await escritor.drain()
+        status = int((await leitor.readline()).split()[1])
+        cabecalhos = {}
+        while True:
+            linha = await leitor.readline()
+            if linha in (b'\r\n', b'\n', b''):
+                break
+            nome, _, valor = linha.decode('latin-1').partition(':')
+            cabecalhos[nome.strip().lower()] = valor.strip()
+        resposta = await leitor.readexactly(int(cabecalhos.get('content-length', 0)))
+        if cabecalhos.get('connection', '').lower() == 'close':
+            await self.fechar()
+        return status, json.loads(resposta) if resposta else None
+
+    async def fechar(self):
+        if self._conexao is not None:
+            self._conexao[1].close()
+            self._conexao = None
+
+def requisitar(caminho, corpo=None, host='127.0.0.1', porta=8765):
+    """Synchronous one-off request (for scripts and the game client)."""
+    async def executar():
+        cliente = ClienteSimulacao(host, porta)
+        try:
+            return await cliente.requisitar(caminho, corpo)
+        finally:
+            await cliente.fechar()
+    return asyncio.run(executar())
+
+async def servir(host='127.0.0.1', porta=8765, processos=None, populacao_mapeada=None):
+    servico = ServicoSimulacao(processos, populacao_mapeada=populacao_mapeada)
+    endereco = await servico.iniciar(host, porta)
+    print(f"Serviço de simulação em http://{endereco[0]}:{endereco[1]}")
+    try:
+        await servico.servidor.serve_forever()
+    finally:
+        await servico.fechar()
+
+if __name__ == "__main__":
+    argumentos = argparse.ArgumentParser(description="Serviço HTTP/JSON de simulação")
+    argumentos.add_argument('--host', default='127.0.0.1')
+    argumentos.add_argument('--porta', type=int, default=8765)
+    argumentos.add_argument('--processos', type=int, default=None)
+    argumentos.add_argument('--populacao-mapeada', default=None, help="Pasta gerada por Population_Generator (mmap_dir)")
+    opcoes = argumentos.parse_args()
+    try:
+        asyncio.run(servir(opcoes.host, opcoes.porta, opcoes.processos, opcoes.populacao_mapeada))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,95 @@
+import ast
+import hashlib
+import os
+import sys
+
+# ==========================================
+# Code version of a module and of the project modules it imports
+# ==========================================
+# The version of a source file is the hash of its text and of every project file it
+# imports, directly or through other project files. Imports are read from the
+# syntax tree (including the ones inside functions), so nothing is imported and no
+# heavy dependency is loaded; names that do not resolve to a file of the project
+# folders (stdlib, pandas, ...) are left out.
+#
+#   versao_arquivos('military_sistem/Main.py')   # Main + Contagem_Unidades + KML_Tiles + Cache_Etapas ...
+#   versao_modulos(funcao, classe, modulo)       # the files that define them, same closure
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+PASTAS_PROJETO = [RAIZ] + [os.path.join(RAIZ, pasta) for pasta in ('economy_sistem', 'citizen_generator', 'military_sistem')]
+
+_IMPORTS = {}  # (path, size, mtime) -> (source bytes, imported module names)
+
+def _ler(caminho):
+    """Source and top-level names of the modules imported by a file, memoized per (path, size, mtime)."""
+    estado = os.stat(caminho)
+    marca = (caminho, estado.st_size, estado.st_mtime_ns)
+    if marca not in _IMPORTS:
+        with open(caminho, 'rb') as arquivo:
+            fonte = arquivo.read()
+        nomes = set()
+        try:
+            arvore = ast.parse(fonte, filename=caminho)
+        except SyntaxError:
+            arvore = None
+        for no in ast.walk(arvore) if arvore is not None else ():
+            if isinstance(no, ast.Import):
+                nomes.update(alias.name.split('.')[0] for alias in no.names)
+            elif isinstance(no, ast.ImportFrom) and no.level == 0 and no.module:
+                nomes.add(no.module.split('.')[0])
+        _IMPORTS[marca] = (fonte, sorted(nomes))
+    return _IMPORTS[marca]
+
+def _resolver(nome, pasta):
+    """Project file of a module name: the importing file's folder first, then the project folders."""
+    for candidata in [pasta] + PASTAS_PROJETO:
+        caminho = os.path.join(candidata, f"{nome}.py")
+        if os.path.isfile(caminho):
+            return caminho
+    return None
+
+def arquivos_importados(*caminhos):
+    """The given source files and every project file they import, transitively (sorted)."""
+    vistos = set()
+    pilha = [os.path.abspath(caminho) for caminho in caminhos]
+    while pilha:
+        caminho = pilha.pop()
+        if caminho in vistos:
+            continue
+        vistos.add(caminho)
+        for nome in _ler(caminho)[1]:
+            importado = _resolver(nome, os.path.dirname(caminho))
+            if importado is not None and importado not in vistos:
+                pilha.append(importado)
+    return sorted(vistos)
+
+def versao_arquivos(*caminhos):
+    """Hash of the given source files and of the project files they import."""
+    resumo = hashlib.blake2b(digest_size=16)
+    for caminho in arquivos_importados(*caminhos):
+        fonte = _ler(caminho)[0]
+        resumo.update(os.path.relpath(caminho, RAIZ).encode('utf-8') + b'\0')
+        resumo.update(len(fonte).to_bytes(8, 'little') + fonte)
+    return resumo.hexdigest()
+
+def arquivo_fonte(objeto):
+    """Source file of a module, or of the module defining a function/class (None when there is none)."""
+    modulo = objeto if hasattr(objeto, '__file__') else sys.modules.get(getattr(objeto, '__module__', None))
+    caminho = getattr(modulo, '__file__', None)
+    return caminho if caminho and caminho.endswith('.py') and os.path.isfile(caminho) else None
+
+def versao_modulos(*objetos):
+    """
+    Hash of the modules defining the given functions, classes or modules and of the
+    project modules they import. Objects without a source file count by name.
+    """
+    caminhos = [arquivo_fonte(objeto) for objeto in objetos]
+    sem_fonte = sorted(
+        f"{getattr(objeto, '__module__', '')}.{getattr(objeto, '__qualname__', repr(objeto))}"
+        for objeto, caminho in zip(objetos, caminhos) if caminho is None
+    )
+    arquivos = [caminho for caminho in caminhos if caminho is not None]
+    return hashlib.blake2b(
+        ((versao_arquivos(*arquivos) if arquivos else '') + '\0' + '\0'.join(sem_fonte)).encode('utf-8'),
+        digest_size=16,
+    ).hexdigest()
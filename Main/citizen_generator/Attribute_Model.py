@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+
+# ==========================================
+# Correlated attributes: Gaussian copula over the banded distributions
+# ==========================================
+# Each attribute of Atributos.ods is a list of bands (Start..End, Description,
+# Percentage). The model draws one latent normal vector per citizen, correlates it
+# with the Cholesky factor of the correlation matrix and maps every component to
+# its attribute through the standard normal CDF:
+#   u = Phi(z + deslocamento(idade))  ->  band = first band whose cumulative share reaches u
+#   value = Start + floor(position of u inside the band * band width)
+# With no age effect the marginals are exactly the sheet percentages; an age
+# effect shifts the latent mean (interpolated over age), so older or younger
+# citizens lean to higher or lower bands while the correlation is kept.
+# The value inside the band comes from the same u, so no extra draw is needed and
+# correlated citizens are also close inside the band.
+#
+#   modelo = CorrelatedAttributeModel.from_file('Atributos.ods', EFEITOS_IDADE_PADRAO)
+#   valores, faixas = modelo.sample(idades, rng)
+
+ATRIBUTOS = ("Atributo_Int", "Atributo_Ath", "Atributo_Cha")
+
+# Latent correlation between Int, Ath and Cha (same order as ATRIBUTOS)
+CORRELACAO_PADRAO = np.array([
+    [1.00, 0.15, 0.35],
+    [0.15, 1.00, 0.25],
+    [0.35, 0.25, 1.00],
+])
+
+# Optional latent shift by age: {attribute: (ages, shifts)}, linear between the points
+EFEITOS_IDADE_PADRAO = {
+    "Atributo_Int": ([0, 6, 12, 18, 100], [-1.5, -0.9, -0.4, 0.0, 0.0]),
+    "Atributo_Ath": ([0, 8, 16, 25, 40, 60, 80, 100], [-1.5, -0.8, -0.1, 0.3, 0.0, -0.6, -1.2, -1.5]),
+}
+
+TAMANHO_LOTE = 1 << 20
+
+
+def carregar_faixas(attribute_file, sheets=ATRIBUTOS):
+    """
+    Reads the band tables of Atributos.ods.
+
+    Returns:
+        dict: {sheet: DataFrame with Start, End, Description and Probability (normalized
+              to sum 1, percentages such as '2,5%' or '2.5%' accepted)}.
+    """
+    faixas = {}
+    for sheet in sheets:
+        data = pd.read_excel(attribute_file, sheet_name=sheet)
+        percentual = data['Percentage'].astype(str).str.replace('%', '', regex=False).str.replace(',', '.').astype(float)
+        if (percentual < 0).any() or percentual.sum() <= 0:
+            raise ValueError(f"Percentuais inválidos na aba '{sheet}'.")
+        faixas[sheet] = pd.DataFrame({
+            'Start': data['Start'].to_numpy(dtype=np.int64),
+            'End': data['End'].to_numpy(dtype=np.int64),
+            'Description': data['Description'].astype(str).to_numpy(dtype=object),
+            'Probability': (percentual / percentual.sum()).to_numpy(),
+        })
+    return faixas
+
+
+class CorrelatedAttributeModel:
+    """
+    Gaussian copula over banded attribute distributions.
+
+    Args:
+        faixas (dict): {attribute: band table} (see carregar_faixas), in column order.
+        correlation (array): (k, k) latent correlation matrix (None = independent attributes).
+        age_effects (dict): {attribute: (ages, shifts)} latent mean shift by age (None = no effect).
+    """
+    def __init__(self, faixas, correlation=CORRELACAO_PADRAO, age_effects=None):
+        self.nomes = list(faixas)
+        self.faixas = faixas
+        k = len(self.nomes)
+        correlation = np.eye(k) if correlation is None else np.asarray(correlation, dtype=np.float64)
+        if correlation.shape != (k, k) or not np.allclose(correlation, correlation.T) or not np.allclose(np.diag(correlation), 1.0):
+            raise ValueError(f"A matriz de correlação deve ser simétrica ({k}x{k}) com diagonal 1.")
+        try:
+            self.cholesky = np.linalg.cholesky(correlation)
+        except np.linalg.LinAlgError:
+            raise ValueError("A matriz de correlação não é positiva definida.") from None
+        self.correlation = correlation
+
+        desconhecidos = set(age_effects or {}) - set(self.nomes)
+        if desconhecidos:
+            raise ValueError(f"Efeito de idade para atributos inexistentes: {sorted(desconhecidos)}")
+        self.age_effects = {
+            nome: (np.asarray(idades, dtype=np.float64), np.asarray(deslocamentos, dtype=np.float64))
+            for nome, (idades, deslocamentos) in (age_effects or {}).items()
+        }
+
+        # Cumulative shares padded with 0, plus band start and width, per attribute
+        self._acumulado = [np.concatenate([[0.0], np.cumsum(faixas[n]['Probability'].to_numpy())]) for n in self.nomes]
+        for acumulado in self._acumulado:
+            acumulado[-1] = 1.0
+        self._inicio = [faixas[n]['Start'].to_numpy(dtype=np.int64) for n in self.nomes]
+        self._amplitude = [faixas[n]['End'].to_numpy(dtype=np.int64) - faixas[n]['Start'].to_numpy(dtype=np.int64) + 1
+                           for n in self.nomes]
+
+    @classmethod
+    def from_file(cls, attribute_file, age_effects=None, correlation=CORRELACAO_PADRAO, sheets=ATRIBUTOS):
+        return cls(carregar_faixas(attribute_file, sheets), correlation, age_effects)
+
+    def latent(self, rng, n):
+        """(n, k) independent standard normals from one stream (correlated later, in transform)."""
+        return rng.standard_normal((n, len(self.nomes)))
+
+    def transform(self, normais, idades=None, lote=TAMANHO_LOTE):
+        """
+        Maps independent standard normals to attribute values, in batches of `lote` rows.
+
+        Returns:
+            tuple: (values (n, k) int, bands (n, k) band index).
+        """
+        n, k = normais.shape
+        valores = np.empty((n, k), dtype=np.int64)
+        faixas = np.empty((n, k), dtype=np.int64)
+        idades = None if idades is None else np.asarray(idades, dtype=np.float64)
+        for inicio_lote in range(0, n, lote):
+            fatia = slice(inicio_lote, min(inicio_lote + lote, n))
+            z = normais[fatia] @ self.cholesky.T
+            for j, nome in enumerate(self.nomes):
+                if nome in self.age_effects and idades is not None:
+                    z[:, j] += np.interp(idades[fatia], *self.age_effects[nome])
+            u = ndtr(z)
+            for j in range(k):
+                acumulado = self._acumulado[j]
+                faixa = np.clip(np.searchsorted(acumulado, u[:, j], side='right') - 1, 0, len(acumulado) - 2)
+                largura = np.maximum(acumulado[faixa + 1] - acumulado[faixa], np.finfo(np.float64).tiny)
+                posicao = (u[:, j] - acumulado[faixa]) / largura
+                desvio = np.minimum((posicao * self._amplitude[j][faixa]).astype(np.int64), self._amplitude[j][faixa] - 1)
+                valores[fatia, j] = self._inicio[j][faixa] + desvio
+                faixas[fatia, j] = faixa
+        return valores, faixas
+
+    def sample(self, idades, rng, lote=TAMANHO_LOTE):
+        """Attributes of citizens with the given ages (one stream for the whole batch)."""
+        idades = np.asarray(idades)
+        return self.transform(self.latent(rng, len(idades)), idades, lote)
+
+    def descricoes(self, valores, faixas):
+        """
+        Labels 'value (Description)' per attribute. The bands only hold a few dozen
+        values, so the labels are built once per value and gathered with one take.
+        """
+        rotulos = {}
+        for j, nome in enumerate(self.nomes):
+            tabela = self.faixas[nome]
+            base = int(tabela['Start'].min())
+            rotulo = np.empty(int(tabela['End'].max()) - base + 1, dtype=object)
+            for inicio, fim, descricao in zip(tabela['Start'], tabela['End'], tabela['Description']):
+                rotulo[inicio - base:fim - base + 1] = [f"{v} ({descricao})" for v in range(inicio, fim + 1)]
+            rotulos[nome] = rotulo[valores[:, j] - base]
+        return rotulos
@@ -1,28 +1,37 @@
-import geopandas as gpd
 import pandas as pd
-from shapely.geometry import Point, Polygon
-from pykml import parser
 import zipfile
 import os
+import sys
 import ast  # To safely evaluate strings as dictionaries
-from lxml import etree  # Required for PyKML
+
+# geopandas, shapely, pykml (lxml) and simplekml are imported inside the functions
+# that use them, so loading this module (e.g. for the tiled output) stays cheap
+
+# The tiled KML writer is shared with the military hierarchy
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'military_sistem'))
+from KML_Tiles import gerar_kml_tiles
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Cache_Etapas import Arquivo, em_cache
 
 # Paths to files
 municipality_file = "Data_Pop_Age_Name.ods"
 kmz_file = "Polygon.kmz"
 kml_extracted_file = "2840_extracted.kml"  # Temporary file for extracted KML
+filtered_municipalities_file = "Filtered_Pop_Municipio.ods"
+output_kml_file = "Filtered_Municipalities.kml"
+
+# Marker style used by both the flat and the tiled output
+MARKER_ICON = "http://maps.google.com/mapfiles/kml/shapes/placemark_circle.png"
+MARKER_SCALE = 1.2
 
-# Step 1: Extract the KMZ file to a KML
-with zipfile.ZipFile(kmz_file, 'r') as kmz:
-    # Extract the first KML file found in the KMZ
-    for file_name in kmz.namelist():
-        if file_name.endswith('.kml'):
-            kmz.extract(file_name, ".")  # Extract KML in the current directory
-            os.rename(file_name, kml_extracted_file)  # Rename for consistent naming
-            break
+# Level-of-detail tiers for the tiled output: (minimum population, tile size in degrees,
+# minimum Lod pixels). Large cities are always loaded, small towns only when zoomed in.
+MUNICIPALITY_LOD_TIERS = [
+    (500000, 8.0, 0),
+    (100000, 2.0, 128),
+    (0, 0.5, 256),
+]
 
-# Step 2: Load municipality data
-municipalities = pd.read_excel(municipality_file, sheet_name = 'Municipio', engine = 'odf')
 
 # Extract latitude and longitude from the format {'lat': -23.5475, 'lon': -46.63611}
 def extract_coordinates(coord_str):
@@ -32,93 +41,174 @@ def extract_coordinates(coord_str):
     except (ValueError, KeyError, SyntaxError):
         return None, None
 
-municipalities['Latitude'], municipalities['Longitude'] = zip(
-    *municipalities['Coordenadas'].apply(extract_coordinates)
-)
 
-# Remove entries with invalid coordinates
-municipalities = municipalities.dropna(subset=['Latitude', 'Longitude'])
+def load_kmz_polygon(kmz_file, kml_extracted_file=kml_extracted_file):
+    """Extracts the first KML of a KMZ and returns its polygon as a Shapely Polygon."""
+    from pykml import parser
+    from shapely.geometry import Polygon
 
-# Create a GeoDataFrame for municipalities
-municipality_gdf = gpd.GeoDataFrame(
-    municipalities,
-    geometry=[Point(xy) for xy in zip(municipalities['Longitude'], municipalities['Latitude'])],
-    crs="EPSG:4326"  # WGS 84 coordinate system
-)
+    # Step 1: Extract the KMZ file to a KML
+    with zipfile.ZipFile(kmz_file, 'r') as kmz:
+        # Extract the first KML file found in the KMZ
+        for file_name in kmz.namelist():
+            if file_name.endswith('.kml'):
+                kmz.extract(file_name, ".")  # Extract KML in the current directory
+                os.rename(file_name, kml_extracted_file)  # Rename for consistent naming
+                break
 
-# Step 3: Use PyKML to parse the KML and extract the polygon
-with open(kml_extracted_file, 'rb') as file:  # Open in binary mode
-    kml_content = file.read()
+    # Step 3: Use PyKML to parse the KML and extract the polygon
+    with open(kml_extracted_file, 'rb') as file:  # Open in binary mode
+        kml_content = file.read()
 
-root = parser.fromstring(kml_content)  # Pass bytes to fromstring
+    # Clean up the extracted KML file
+    if os.path.exists(kml_extracted_file):
+        os.remove(kml_extracted_file)
 
-# Extract polygon coordinates (assumes simple KML structure)
-coordinates = root.Document.Placemark.Polygon.outerBoundaryIs.LinearRing.coordinates.text.strip()
-coords_list = [
-    tuple(map(float, coord.split(',')))
-    for coord in coordinates.split()
-]
+    root = parser.fromstring(kml_content)  # Pass bytes to fromstring
 
-# Convert coordinates to a Shapely Polygon
-polygon = Polygon(coords_list)
+    # Extract polygon coordinates (assumes simple KML structure)
+    coordinates = root.Document.Placemark.Polygon.outerBoundaryIs.LinearRing.coordinates.text.strip()
+    coords_list = [
+        tuple(map(float, coord.split(',')))
+        for coord in coordinates.split()
+    ]
 
-# Step 4: Filter municipalities within the polygon
-filtered_municipalities = municipality_gdf[municipality_gdf.geometry.within(polygon)]
+    # Convert coordinates to a Shapely Polygon
+    return Polygon(coords_list)
 
-# Print filtered municipalities
-print("\n--- Filtered Municipalities ---")
-print(filtered_municipalities)
 
-# Save the filtered results to a new file
-filtered_municipalities.to_excel("Filtered_Pop_Municipio.ods", sheet_name = 'Main',engine='odf', index=False)
+def filter_municipalities(municipality_file, kmz_file):
+    """Returns the municipalities (GeoDataFrame) located inside the KMZ polygon."""
+    import geopandas as gpd
+    from shapely.geometry import Point
 
-# Clean up the extracted KML file
-if os.path.exists(kml_extracted_file):
-    os.remove(kml_extracted_file)
+    # Step 2: Load municipality data
+    municipalities = pd.read_excel(municipality_file, sheet_name = 'Municipio', engine = 'odf')
 
-print("\n--- Process Completed: Filtered municipalities saved in 'Filtered_Pop_Municipio.ods' ---")
+    municipalities['Latitude'], municipalities['Longitude'] = zip(
+        *municipalities['Coordenadas'].apply(extract_coordinates)
+    )
 
+    # Remove entries with invalid coordinates
+    municipalities = municipalities.dropna(subset=['Latitude', 'Longitude'])
 
-import pandas as pd
-import simplekml
+    # Create a GeoDataFrame for municipalities
+    municipality_gdf = gpd.GeoDataFrame(
+        municipalities,
+        geometry=[Point(xy) for xy in zip(municipalities['Longitude'], municipalities['Latitude'])],
+        crs="EPSG:4326"  # WGS 84 coordinate system
+    )
 
-# Path to the filtered data file
-filtered_municipalities_file = "Filtered_Pop_Municipio.ods"
+    polygon = load_kmz_polygon(kmz_file)
 
-# Load the data
-filtered_municipalities = pd.read_excel(filtered_municipalities_file, engine='odf')
-
-# Ensure columns have the correct format
-filtered_municipalities['Latitude'] = filtered_municipalities['Latitude'].apply(
-    lambda x: float(str(x).replace(',', '.'))
-)
-filtered_municipalities['Longitude'] = filtered_municipalities['Longitude'].apply(
-    lambda x: float(str(x).replace(',', '.'))
-)
-
-# Create a KML object
-kml = simplekml.Kml()
-
-# Add a marker for each city
-for _, row in filtered_municipalities.iterrows():
-    name = row['Nome']
-    population = row['Pop']
-    latitude = row['Latitude']
-    longitude = row['Longitude']
-
-    # Create a marker
-    point = kml.newpoint(
-        name=name,
-        description=f"População: {population:,}",
-        coords=[(longitude, latitude)]  # Note: Longitude first, then Latitude
+    # Step 4: Filter municipalities within the polygon
+    return municipality_gdf[municipality_gdf.geometry.within(polygon)]
+
+
+def load_filtered_municipalities(filtered_municipalities_file):
+    """Loads the filtered municipalities with numeric coordinates."""
+    filtered_municipalities = pd.read_excel(filtered_municipalities_file, engine='odf')
+
+    # Ensure columns have the correct format
+    filtered_municipalities['Latitude'] = filtered_municipalities['Latitude'].apply(
+        lambda x: float(str(x).replace(',', '.'))
+    )
+    filtered_municipalities['Longitude'] = filtered_municipalities['Longitude'].apply(
+        lambda x: float(str(x).replace(',', '.'))
+    )
+    return filtered_municipalities
+
+
+def create_municipality_kml(filtered_municipalities, output_kml_file):
+    """Creates a single KML with a marker for each city."""
+    import simplekml
+
+    # Create a KML object
+    kml = simplekml.Kml()
+
+    # Add a marker for each city
+    for _, row in filtered_municipalities.iterrows():
+        name = row['Nome']
+        population = row['Pop']
+        latitude = row['Latitude']
+        longitude = row['Longitude']
+
+        # Create a marker
+        point = kml.newpoint(
+            name=name,
+            description=f"População: {population:,}",
+            coords=[(longitude, latitude)]  # Note: Longitude first, then Latitude
+        )
+
+        # Optional: Customize marker style
+        point.style.iconstyle.icon.href = MARKER_ICON
+        point.style.iconstyle.scale = MARKER_SCALE  # Adjust marker size
+
+    # Save the KML file
+    kml.save(output_kml_file)
+
+    print(f"KML file created successfully: {output_kml_file}")
+
+
+def create_municipality_kml_tiles(filtered_municipalities, output_dir, lod_tiers=None, processes=None):
+    """Creates a tiled KML (root doc.kml + Region/Lod NetworkLinks) of the city markers."""
+    lod_tiers = sorted(lod_tiers or MUNICIPALITY_LOD_TIERS, reverse=True)
+
+    layers = {}
+    upper_bound = None
+    for min_pop, tile_size, min_lod in lod_tiers:
+        in_tier = filtered_municipalities['Pop'] >= min_pop
+        if upper_bound is not None:
+            in_tier &= filtered_municipalities['Pop'] < upper_bound
+        tier = filtered_municipalities[in_tier]
+        layers[f"Pop >= {min_pop:,}"] = {
+            'tamanho_tile': tile_size,
+            'min_lod': min_lod,
+            'pontos': [
+                {
+                    'name': name,
+                    'lat': latitude,
+                    'lon': longitude,
+                    'description': f"População: {population:,}",
+                    'icon': MARKER_ICON,
+                    'scale': MARKER_SCALE,
+                }
+                for name, population, latitude, longitude in zip(
+                    tier['Nome'], tier['Pop'], tier['Latitude'], tier['Longitude']
+                )
+            ],
+        }
+        upper_bound = min_pop
+
+    index = gerar_kml_tiles(layers, output_dir, processos=processes)
+    print(f"Tiled KML created successfully in '{output_dir}' ({sum(len(t) for t in index.values())} tiles)")
+    return index
+
+
+def main(tiles=False, cache=None):
+    filtered_municipalities = em_cache(
+        cache, filter_municipalities, Arquivo(municipality_file), Arquivo(kmz_file),
     )
 
-    # Optional: Customize marker style
-    point.style.iconstyle.icon.href = "http://maps.google.com/mapfiles/kml/shapes/placemark_circle.png"
-    point.style.iconstyle.scale = 1.2  # Adjust marker size
+    # Print filtered municipalities
+    print("\n--- Filtered Municipalities ---")
+    print(filtered_municipalities)
+
+    # Save the filtered results to a new file
+    filtered_municipalities.to_excel(filtered_municipalities_file, sheet_name = 'Main',engine='odf', index=False)
+
+    print(f"\n--- Process Completed: Filtered municipalities saved in '{filtered_municipalities_file}' ---")
+
+    # Load the data
+    filtered_municipalities = load_filtered_municipalities(filtered_municipalities_file)
+
+    # The tiled output (Region/Lod) replaces the single flat file
+    if tiles:
+        create_municipality_kml_tiles(filtered_municipalities, "Filtered_Municipalities_tiles")
+    else:
+        create_municipality_kml(filtered_municipalities, output_kml_file)
+    return filtered_municipalities
 
-# Save the KML file
-output_kml_file = "Filtered_Municipalities.kml"
-kml.save(output_kml_file)
 
-print(f"KML file created successfully: {output_kml_file}")
+if __name__ == "__main__":
+    main(tiles="--tiles" in sys.argv)
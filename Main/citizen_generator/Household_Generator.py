@@ -0,0 +1,191 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from Population_Generator import NameGenerator, por_municipio, sortear_sobrenomes
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Sementes import como_sementes
+
+# ==========================================
+# Household formation
+# ==========================================
+# Citizens are grouped into households one municipality at a time, with array
+# operations on the block (no per-person loop):
+#   1. adults are sorted by a noisy age and consecutive pairs become couples (so
+#      partners have close ages); the other adults head single-adult households;
+#   2. every minor draws a parent age (own age + generation gap) and joins a random
+#      household whose head has that age (or the nearest one in the municipality);
+#   3. every household draws its surnames from the NameGenerator vocabulary and all
+#      its members take them.
+# Random draws come from one Sementes stream per municipality, so any municipality
+# can be regenerated alone.
+
+PAPEIS = np.array(['Responsavel', 'Conjuge', 'Filho'], dtype=object)
+RESPONSAVEL, CONJUGE, FILHO = 0, 1, 2
+
+
+def formar_domicilios_bloco(idades, rng, couple_rate=0.6, gap_mean=28.0, gap_std=6.0,
+                            min_gap=16, max_gap=50, adult_age=18, partner_noise=3.0):
+    """
+    Households of one municipality.
+
+    Args:
+        idades (ndarray): (n,) ages of the municipality's citizens.
+        couple_rate (float): Share of adults living as a couple.
+        gap_mean, gap_std (float): Parent - child age gap (normal, clipped to [min_gap, max_gap]).
+        partner_noise (float): Std of the noise added to ages before pairing partners.
+
+    Returns:
+        tuple: (household (n,) local household index, role (n,) code, heads (h,) citizen index
+               of every household's head).
+    """
+    idades = np.asarray(idades, dtype=np.int64)
+    n = len(idades)
+    adultos = np.flatnonzero(idades >= adult_age)
+    menores = np.flatnonzero(idades < adult_age)
+    domicilio = np.empty(n, dtype=np.int64)
+    papel = np.empty(n, dtype=np.int64)
+
+    # 1. Couples: consecutive adults in noisy-age order, a couple_rate share of the pairs
+    ordem = adultos[np.argsort(idades[adultos] + rng.normal(0.0, partner_noise, len(adultos)), kind='stable')]
+    pares = len(ordem) // 2
+    casal = rng.random(pares) < couple_rate
+    primeiro, segundo = ordem[0:2 * pares:2], ordem[1:2 * pares:2]
+    casados = np.zeros(len(ordem), dtype=bool)
+    casados[0:2 * pares:2] = casal
+    casados[1:2 * pares:2] = casal
+    # The older partner heads the household
+    troca = casal & (idades[segundo] > idades[primeiro])
+    chefe_casal = np.where(troca, segundo, primeiro)[casal]
+    conjuge = np.where(troca, primeiro, segundo)[casal]
+    sozinhos = ordem[~casados]
+    chefes = np.concatenate([chefe_casal, sozinhos])
+    domicilio[chefes] = np.arange(len(chefes))
+    papel[chefes] = RESPONSAVEL
+    domicilio[conjuge] = np.arange(len(conjuge))
+    papel[conjuge] = CONJUGE
+
+    # 2. Minors join a household whose head has (close to) the drawn parent age
+    if len(menores):
+        if len(chefes) == 0:
+            # No adult in the sample: every minor heads its own household
+            extra = np.arange(len(menores))
+            domicilio[menores] = extra
+            papel[menores] = RESPONSAVEL
+            return domicilio, papel, menores.copy()
+        alvo = idades[menores] + np.clip(np.rint(rng.normal(gap_mean, gap_std, len(menores))), min_gap, max_gap)
+        por_idade = np.argsort(idades[chefes], kind='stable')
+        idade_chefe = idades[chefes][por_idade]
+        inicio = np.searchsorted(idade_chefe, alvo, side='left')
+        fim = np.searchsorted(idade_chefe, alvo, side='right')
+        # No head of that exact age: nearest age (ties go to the older head)
+        vazio = inicio == fim
+        abaixo = np.clip(inicio - 1, 0, len(chefes) - 1)
+        acima = np.clip(inicio, 0, len(chefes) - 1)
+        mais_perto = np.where(np.abs(idade_chefe[abaixo] - alvo) < np.abs(idade_chefe[acima] - alvo), abaixo, acima)
+        inicio = np.where(vazio, np.searchsorted(idade_chefe, idade_chefe[mais_perto], side='left'), inicio)
+        fim = np.where(vazio, np.searchsorted(idade_chefe, idade_chefe[mais_perto], side='right'), fim)
+        escolhido = inicio + (rng.random(len(menores)) * (fim - inicio)).astype(np.int64)
+        domicilio[menores] = por_idade[escolhido]
+        papel[menores] = FILHO
+
+    return domicilio, papel, chefes
+
+
+class HouseholdGenerator:
+    """
+    Groups generated citizens into households with shared surnames.
+
+    Args:
+        surnames (array): Surname vocabulary (NameGenerator.surnames).
+        sementes (Sementes or int): RNG service (streams 'domicilios'/<municipio>).
+        max_surnames (int): Surnames of a family (1..max_surnames).
+        **parametros: Passed to formar_domicilios_bloco (couple_rate, gap_mean, ...).
+    """
+    def __init__(self, surnames, sementes=None, max_surnames=2, **parametros):
+        self.surnames = np.asarray(surnames, dtype=object)
+        self.sementes = como_sementes(sementes).sub('domicilios')
+        self.max_surnames = max_surnames
+        self.parametros = parametros
+
+    @classmethod
+    def from_name_file(cls, name_file, sementes=None, **opcoes):
+        return cls(NameGenerator(name_file).surnames, sementes, **opcoes)
+
+    def form_households(self, population_data):
+        """
+        Adds Domicilio (global household id), Papel and Sobrenome to the citizens and
+        rewrites Nome as first name + family surnames.
+
+        Returns:
+            tuple: (citizens DataFrame, households DataFrame with Domicilio, Municipio,
+                   Sobrenome, Tamanho, Idade_Responsavel and Peso).
+        """
+        print("\n--- Step 6: Formando domicílios ---")
+        population_data = population_data.copy()
+        idades = population_data['Idade'].to_numpy(dtype=np.int64)
+        domicilio = np.empty(len(population_data), dtype=np.int64)
+        papel = np.empty(len(population_data), dtype=np.int64)
+        blocos = []
+        total = 0
+        for municipio, posicoes in por_municipio(population_data['Municipio']):
+            rng = self.sementes.gerador(municipio)
+            local, papeis, chefes = formar_domicilios_bloco(idades[posicoes], rng, **self.parametros)
+            domicilio[posicoes] = local + total
+            papel[posicoes] = papeis
+            codigos, quantidade = sortear_sobrenomes(rng, len(chefes), len(self.surnames), self.max_surnames)
+            blocos.append((municipio, posicoes[chefes], codigos, quantidade))
+            total += len(chefes)
+
+        # Family surnames, one row per household
+        chefes = np.concatenate([b[1] for b in blocos]) if blocos else np.zeros(0, dtype=np.int64)
+        codigos = np.concatenate([b[2] for b in blocos]) if blocos else np.zeros((0, self.max_surnames), dtype=np.int64)
+        quantidade = np.concatenate([b[3] for b in blocos]) if blocos else np.zeros(0, dtype=np.int64)
+        sobrenome = self.surnames[codigos[:, 0]] if len(codigos) else np.zeros(0, dtype=object)
+        for k in range(1, self.max_surnames):
+            sobrenome = np.where(quantidade > k, sobrenome + ' ' + self.surnames[codigos[:, k]], sobrenome)
+
+        population_data['Domicilio'] = domicilio
+        population_data['Papel'] = PAPEIS[papel]
+        population_data['Sobrenome'] = sobrenome[domicilio] if len(sobrenome) else np.zeros(0, dtype=object)
+        if 'Nome' in population_data.columns:
+            # numpy string ufuncs: first name + family surnames without a Python loop
+            primeiro = np.strings.partition(population_data['Nome'].to_numpy(dtype=str), ' ')[0]
+            familia = population_data['Sobrenome'].to_numpy(dtype=str)
+            population_data['Nome'] = np.strings.add(np.strings.add(primeiro, ' '), familia)
+
+        tamanho = np.bincount(domicilio, minlength=total)
+        peso = population_data['Peso'].to_numpy(dtype=np.float64)[chefes] if 'Peso' in population_data.columns else np.ones(total)
+        households = pd.DataFrame({
+            'Domicilio': np.arange(total),
+            'Municipio': population_data['Municipio'].to_numpy()[chefes],
+            'Sobrenome': sobrenome,
+            'Tamanho': tamanho,
+            'Idade_Responsavel': idades[chefes],
+            'Peso': peso,
+        })
+        print(f"{total} domicílios formados (média de {len(population_data) / max(total, 1):.2f} pessoas).")
+        return population_data, households
+
+
+def resumo_domicilios(households):
+    """Weighted households and residents per municipality (Domicilios, Moradores, Tamanho_Medio)."""
+    ponderado = households.assign(Moradores=households['Tamanho'] * households['Peso'])
+    resumo = ponderado.groupby('Municipio', sort=False).agg(Domicilios=('Peso', 'sum'), Moradores=('Moradores', 'sum'))
+    resumo['Tamanho_Medio'] = resumo['Moradores'] / resumo['Domicilios']
+    return resumo
+
+
+def etapa_domicilios(population_data, name_file, sementes):
+    return HouseholdGenerator.from_name_file(name_file, sementes).form_households(population_data)
+
+
+if __name__ == "__main__":
+    from Population_Generator import main
+
+    cidadaos, domicilios = etapa_domicilios(main(), 'Data_Pop_Age_Name.ods', None)
+    print(cidadaos.head(10))
+    print(resumo_domicilios(domicilios).head())
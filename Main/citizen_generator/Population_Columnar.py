@@ -0,0 +1,271 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# On-disk columnar population: preallocated memory-mapped arrays
+# ==========================================
+# One directory per population:
+#   manifesto.json          rows, columns (kind and dtype) and the municipality partitions
+#   <coluna>.npy            fixed-width values (numbers) or vocabulary codes (strings)
+#   <coluna>.<k>.npy        token k of a tokenized column (Nome: first name, surnames...), -1 = none
+#   <coluna>.vocab.json     vocabulary of a string / tokenized column
+# The .npy files are allocated with the final row count up front and filled one
+# block of whole municipalities at a time, so the generator never holds the full
+# population in memory. Rows are sorted by municipality (in generation order) and
+# age, and every municipality is one contiguous partition.
+# Readers open the arrays with np.load(mmap_mode='r'): nothing is copied, and
+# every process mapping the same files shares one copy through the page cache.
+# The directory is written under a temporary name and swapped in when complete,
+# so readers never see a partial population (open maps keep the old files alive).
+#
+#   escritor = PopulationWriter('populacao_mmap', total)
+#   for bloco in blocos: escritor.write(bloco)
+#   populacao = escritor.close()            # MappedPopulation
+#   populacao.to_frame(municipio='Brasília')
+#   populacao.store().count(Idade=(18, 30), Atributo_Ath=(71, None))
+
+MANIFESTO = 'manifesto.json'
+VERSAO_FORMATO = 1
+
+# Narrower dtypes for known columns; other numbers keep the dtype of the first block
+TIPOS_PADRAO = {'Idade': np.int16, 'ID_State': np.int32, 'ID_City': np.int32}
+COLUNAS_TOKENS = ('Nome', 'Sobrenome')
+
+
+def _tokens(valores):
+    """
+    Words of every string split on ' ' in one pass (join + split, no fixed-width copies).
+
+    Returns:
+        tuple: (words (t,) object array, row (t,) index of each word's string, position (t,)
+               of each word inside its string).
+    """
+    textos = pd.Series(valores, dtype=object).fillna('').astype(str).tolist()
+    quantidade = np.fromiter((texto.count(' ') + 1 for texto in textos), dtype=np.int64, count=len(textos))
+    palavras = np.array(' '.join(textos).split(' '), dtype=object)
+    linha = np.repeat(np.arange(len(textos)), quantidade)
+    posicao = np.arange(len(palavras)) - np.repeat(np.cumsum(quantidade) - quantidade, quantidade)
+    return palavras, linha, posicao
+
+
+class PopulationWriter:
+    """
+    Writes a population block by block into preallocated memory-mapped columns.
+
+    Args:
+        diretorio (str): Destination folder (replaced when close() succeeds).
+        total (int): Final number of rows (sum of Numero_Pessoas).
+        tipos (dict): dtype per numeric column (TIPOS_PADRAO by default).
+        colunas_tokens (tuple): String columns stored as word codes (high-cardinality names).
+    """
+    def __init__(self, diretorio, total, tipos=None, colunas_tokens=COLUNAS_TOKENS):
+        self.diretorio = os.path.abspath(diretorio)
+        self.parcial = self.diretorio + '.parcial'
+        self.total = int(total)
+        self.tipos = dict(TIPOS_PADRAO if tipos is None else tipos)
+        self.colunas_tokens = tuple(colunas_tokens)
+        self.colunas = None
+        self.arrays = {}
+        self.vocabularios = {}
+        self.particoes = []
+        self.cursor = 0
+        shutil.rmtree(self.parcial, ignore_errors=True)
+        os.makedirs(self.parcial)
+
+    def _alocar(self, nome, dtype, preenchimento=None):
+        array = np.lib.format.open_memmap(os.path.join(self.parcial, f"{nome}.npy"), mode='w+', dtype=dtype, shape=(self.total,))
+        if preenchimento is not None:
+            array[:] = preenchimento
+        self.arrays[nome] = array
+        return array
+
+    def _esquema(self, bloco):
+        """Column kinds from the first block: numero, codigo (vocabulary) or tokens."""
+        self.colunas = {}
+        for coluna in bloco.columns:
+            serie = bloco[coluna]
+            if coluna in self.colunas_tokens:
+                self.colunas[coluna] = {'tipo': 'tokens', 'partes': 0}
+                self.vocabularios[coluna] = {}
+            elif pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_bool_dtype(serie):
+                dtype = np.dtype(self.tipos.get(coluna, serie.to_numpy().dtype))
+                self.colunas[coluna] = {'tipo': 'numero', 'dtype': dtype.str}
+                self._alocar(coluna, dtype)
+            else:
+                self.colunas[coluna] = {'tipo': 'codigo', 'dtype': '<i4'}
+                self.vocabularios[coluna] = {}
+                self._alocar(coluna, np.int32, -1)
+        if 'Municipio' not in self.colunas or self.colunas['Municipio']['tipo'] != 'codigo':
+            raise ValueError("A população precisa da coluna de texto 'Municipio' (chave das partições).")
+
+    def _codificar(self, coluna, valores):
+        """Vocabulary codes of `valores`, growing the column vocabulary (one dict lookup per distinct value)."""
+        codigos, distintos = pd.factorize(pd.Series(valores, dtype=object))
+        vocabulario = self.vocabularios[coluna]
+        traducao = np.array([vocabulario.setdefault(valor, len(vocabulario)) for valor in distintos], dtype=np.int32)
+        return np.where(codigos >= 0, traducao[np.maximum(codigos, 0)] if len(traducao) else -1, -1).astype(np.int32)
+
+    def write(self, bloco):
+        """
+        Appends a block of whole municipalities (a municipality cannot continue in a later block).
+        """
+        if len(bloco) == 0:
+            return
+        if self.colunas is None:
+            self._esquema(bloco)
+        if set(bloco.columns) != set(self.colunas):
+            raise ValueError(f"Colunas do bloco diferem das do primeiro bloco: {sorted(set(bloco.columns) ^ set(self.colunas))}")
+        if self.cursor + len(bloco) > self.total:
+            raise ValueError(f"Mais linhas do que o total alocado ({self.total}).")
+
+        # Municipalities in order of first appearance, ages ascending inside each one
+        codigo_local, municipios = pd.factorize(bloco['Municipio'])
+        vistos = {p['Municipio'] for p in self.particoes}
+        repetidos = [m for m in municipios if m in vistos]
+        if repetidos:
+            raise ValueError(f"Município já gravado em um bloco anterior: {', '.join(map(str, repetidos[:5]))}")
+        ordem = np.lexsort((bloco['Idade'].to_numpy(), codigo_local)) if 'Idade' in bloco.columns else np.argsort(codigo_local, kind='stable')
+        bloco = bloco.iloc[ordem]
+        linhas = slice(self.cursor, self.cursor + len(bloco))
+
+        for coluna, info in self.colunas.items():
+            valores = bloco[coluna].to_numpy()
+            if info['tipo'] == 'numero':
+                self.arrays[coluna][linhas] = valores
+            elif info['tipo'] == 'codigo':
+                self.arrays[coluna][linhas] = self._codificar(coluna, valores)
+            else:
+                palavras, linha, posicao = _tokens(valores)
+                cheias = palavras != ''
+                palavras, linha, posicao = palavras[cheias], linha[cheias], posicao[cheias]
+                codigos = self._codificar(coluna, palavras)
+                for k in range(int(posicao.max()) + 1 if len(posicao) else 0):
+                    nome = f"{coluna}.{k}"
+                    if nome not in self.arrays:
+                        # A longer name than any before: a new token column, empty for the rows already written
+                        self._alocar(nome, np.int32, -1)
+                        info['partes'] = k + 1
+                    desta = posicao == k
+                    self.arrays[nome][self.cursor + linha[desta]] = codigos[desta]
+
+        contagem = np.bincount(codigo_local, minlength=len(municipios))
+        inicio = self.cursor + np.concatenate([[0], np.cumsum(contagem)[:-1]])
+        self.particoes.extend(
+            {'Municipio': str(m), 'Inicio': int(i), 'Fim': int(i + c)} for m, i, c in zip(municipios, inicio, contagem)
+        )
+        self.cursor += len(bloco)
+
+    def close(self):
+        """Flushes the arrays, writes vocabularies and manifest and swaps the directory in."""
+        if self.cursor != self.total:
+            raise ValueError(f"Foram gravadas {self.cursor} linhas de {self.total} alocadas.")
+        for array in self.arrays.values():
+            array.flush()
+        self.arrays.clear()
+        for coluna, vocabulario in self.vocabularios.items():
+            with open(os.path.join(self.parcial, f"{coluna}.vocab.json"), 'w', encoding='utf-8') as arquivo:
+                json.dump(list(vocabulario), arquivo, ensure_ascii=False)
+        with open(os.path.join(self.parcial, MANIFESTO), 'w', encoding='utf-8') as arquivo:
+            json.dump({'versao': VERSAO_FORMATO, 'linhas': self.total, 'colunas': self.colunas or {},
+                       'particoes': self.particoes}, arquivo, ensure_ascii=False, indent=1)
+
+        antigo = self.diretorio + '.antigo'
+        shutil.rmtree(antigo, ignore_errors=True)
+        if os.path.exists(self.diretorio):
+            os.replace(self.diretorio, antigo)
+        os.replace(self.parcial, self.diretorio)
+        shutil.rmtree(antigo, ignore_errors=True)
+        return MappedPopulation(self.diretorio)
+
+
+class MappedPopulation:
+    """
+    Read-only view of a population written by PopulationWriter (arrays mapped, never copied).
+
+    Args:
+        diretorio (str): Folder with manifesto.json.
+    """
+    def __init__(self, diretorio):
+        self.diretorio = os.path.abspath(diretorio)
+        caminho = os.path.join(self.diretorio, MANIFESTO)
+        if not os.path.exists(caminho):
+            raise ValueError(f"População mapeada não encontrada (ou incompleta) em '{self.diretorio}'.")
+        with open(caminho, encoding='utf-8') as arquivo:
+            manifesto = json.load(arquivo)
+        if manifesto.get('versao') != VERSAO_FORMATO:
+            raise ValueError(f"Versão de formato não suportada: {manifesto.get('versao')}")
+        self.n = manifesto['linhas']
+        self.colunas = manifesto['colunas']
+        self.particoes = pd.DataFrame(manifesto['particoes'], columns=['Municipio', 'Inicio', 'Fim'])
+        self._particao = {m: (i, f) for m, i, f in self.particoes.itertuples(index=False)}
+        self._arrays = {}
+        self._vocabularios = {}
+
+    def __len__(self):
+        return self.n
+
+    def __repr__(self):
+        return f"MappedPopulation('{self.diretorio}', {self.n} cidadãos, {len(self.particoes)} municípios)"
+
+    def array(self, nome):
+        """Raw mapped array (values or codes) of a column or token column ('Nome.0')."""
+        if nome not in self._arrays:
+            self._arrays[nome] = np.load(os.path.join(self.diretorio, f"{nome}.npy"), mmap_mode='r')
+        return self._arrays[nome]
+
+    def vocabulario(self, coluna):
+        if coluna not in self._vocabularios:
+            with open(os.path.join(self.diretorio, f"{coluna}.vocab.json"), encoding='utf-8') as arquivo:
+                self._vocabularios[coluna] = np.array(json.load(arquivo), dtype=object)
+        return self._vocabularios[coluna]
+
+    def particao(self, municipio):
+        """Row slice of a municipality."""
+        if municipio not in self._particao:
+            raise ValueError(f"Município desconhecido: {municipio}")
+        return slice(*self._particao[municipio])
+
+    def values(self, coluna, linhas=slice(None)):
+        """Decoded values of a column for `linhas` (slice or row numbers)."""
+        if coluna not in self.colunas:
+            raise ValueError(f"Coluna inexistente: '{coluna}'")
+        info = self.colunas[coluna]
+        if info['tipo'] == 'numero':
+            return np.asarray(self.array(coluna)[linhas])
+        vocabulario = self.vocabulario(coluna)
+        if info['tipo'] == 'codigo':
+            codigos = np.asarray(self.array(coluna)[linhas])
+            return np.where(codigos >= 0, vocabulario[np.maximum(codigos, 0)], None)
+        texto = None
+        vocabulario = vocabulario.astype(str)
+        for k in range(info['partes']):
+            codigos = np.asarray(self.array(f"{coluna}.{k}")[linhas])
+            parte = np.where(codigos >= 0, vocabulario[np.maximum(codigos, 0)], '')
+            texto = parte if texto is None else np.where(codigos >= 0, np.strings.add(np.strings.add(texto, ' '), parte), texto)
+        return (texto if texto is not None else np.full(len(np.arange(self.n)[linhas]), '')).astype(object)
+
+    def to_frame(self, columns=None, linhas=None, municipio=None):
+        """DataFrame of some rows (a municipality, a slice or row numbers) and columns."""
+        if municipio is not None:
+            linhas = self.particao(municipio)
+        linhas = slice(None) if linhas is None else linhas
+        return pd.DataFrame({coluna: self.values(coluna, linhas) for coluna in (columns or list(self.colunas))})
+
+    def blocks(self, linhas_por_bloco=1_000_000):
+        """Yields DataFrames of whole municipalities with about `linhas_por_bloco` rows."""
+        fins = self.particoes['Fim'].to_numpy()
+        inicio = 0
+        while inicio < self.n:
+            fim = int(fins[min(np.searchsorted(fins, inicio + linhas_por_bloco), len(fins) - 1)])
+            yield self.to_frame(linhas=slice(inicio, fim))
+            inicio = fim
+
+    def store(self, weight_column='Peso'):
+        """PopulationStore over the mapped columns (no sort and no DataFrame needed)."""
+        from Population_Store import PopulationStore
+
+        return PopulationStore.from_mapped(self, weight_column)
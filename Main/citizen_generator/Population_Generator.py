@@ -1,6 +1,14 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
-import random
+
+# The RNG service is shared by every generator of the simulation
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Sementes import como_sementes
+from Cache_Etapas import Arquivo, em_cache
+from Attribute_Model import CORRELACAO_PADRAO, EFEITOS_IDADE_PADRAO, CorrelatedAttributeModel
 
 
 class AgePopulationProcessor:
@@ -37,133 +45,373 @@ class MunicipalityProcessor:
         return self.municipalities
 
 
+def largest_remainder(quotas, totals):
+    """
+    Exact integer apportionment (largest-remainder / Hamilton method) of every row.
+
+    Args:
+        quotas (ndarray): (R, C) non-negative real quotas.
+        totals (ndarray): (R,) integer total of every row (normally round(quotas.sum(1))).
+
+    Returns:
+        ndarray: (R, C) int64 counts with counts.sum(axis=1) == totals; every cell is
+            floor(quota) or floor(quota) + 1.
+    """
+    quotas = np.atleast_2d(np.asarray(quotas, dtype=np.float64))
+    totals = np.broadcast_to(np.asarray(totals, dtype=np.int64), (len(quotas),))
+    counts = np.floor(quotas).astype(np.int64)
+    missing = totals - counts.sum(axis=1)
+    if np.any(missing < 0) or np.any(missing > quotas.shape[1]):
+        raise ValueError("Totais incompatíveis com as cotas (use o total arredondado de cada linha)")
+    # The `missing` largest remainders of each row get one more unit (ties: lowest column)
+    order = np.argsort(-(quotas - counts), axis=1, kind='stable')
+    extra = np.arange(quotas.shape[1])[None, :] < missing[:, None]
+    np.put_along_axis(counts, order, np.take_along_axis(counts, order, axis=1) + extra, axis=1)
+    return counts
+
+
+def population_by_age(municipality_population, age_population, reduction=1000):
+    """
+    Population of every (municipality, age), as an exact integer apportionment.
+
+    The reduced total round(sum / reduction) is split over the municipalities and each
+    municipality's share over the ages by largest remainder, so no person is lost to
+    truncation and the same inputs always give the same table (no state, no mutation).
+
+    Args:
+        municipality_population (array): (M,) population of every municipality.
+        age_population (array): (A,) population (or share) of every age.
+        reduction (int): Scale divisor of the simulated population (1 = full size).
+
+    Returns:
+        ndarray: (M, A) int64 people per municipality and age.
+    """
+    municipality_population = np.asarray(municipality_population, dtype=np.float64)
+    age_population = np.asarray(age_population, dtype=np.float64)
+    if np.any(municipality_population < 0) or np.any(age_population < 0) or age_population.sum() <= 0:
+        raise ValueError("Populações devem ser não negativas e a distribuição etária não pode ser vazia")
+
+    scaled = municipality_population / reduction
+    total = int(np.rint(scaled.sum()))
+    per_municipality = largest_remainder(scaled[None, :], total)[0]
+    age_shares = age_population / age_population.sum()
+    return largest_remainder(per_municipality[:, None] * age_shares[None, :], per_municipality)
+
+
+def sample_population_by_age(municipality_population, age_population, scale=1000, starts=None):
+    """
+    Systematic stratified sample of the population: about one citizen per `scale`
+    people, drawn separately in every municipality (at least one citizen in any
+    inhabited town) along its age-ordered population, so every age band is
+    represented in proportion.
+
+    Inside a municipality with N people and n = max(1, round(N / scale)) samples, the
+    citizens sit at positions (start + i) * N / n of the age-ordered population, and
+    each one stands for N / n people (equal inclusion probability), so weighted
+    totals are unbiased for any age or municipality aggregate and exact for the
+    municipality totals.
+
+    Args:
+        municipality_population (array): (M,) population of every municipality.
+        age_population (array): (A,) population (or share) of every age.
+        scale (float): People represented by one sampled citizen (1 = full population).
+        starts (array): (M,) random starts in [0, 1) (default 0.5: the middle of each interval).
+
+    Returns:
+        tuple: (counts (M, A) int64 sampled citizens, weights (M,) people per citizen).
+    """
+    if scale < 1:
+        raise ValueError(f"Escala inválida: {scale} (deve ser >= 1)")
+    full = population_by_age(municipality_population, age_population, reduction=1)
+    people = full.sum(axis=1)
+    samples = np.where(people > 0, np.maximum(np.rint(people / scale), 1), 0).astype(np.int64)
+    starts = np.full(len(full), 0.5) if starts is None else np.asarray(starts, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = np.where(samples > 0, people / samples, 0.0)
+    # Sample positions in the concatenated (municipality, age) population
+    municipality = np.repeat(np.arange(len(full)), samples)
+    rank = np.arange(samples.sum()) - np.repeat(np.cumsum(samples) - samples, samples)
+    offsets = np.cumsum(people) - people
+    positions = offsets[municipality] + (starts[municipality] + rank) * weights[municipality]
+    cells = np.searchsorted(np.cumsum(full.ravel()), positions, side='right')
+    counts = np.bincount(cells, minlength=full.size).reshape(full.shape)
+    return counts, weights
+
+
 class PopulationProcessor:
-    def __init__(self, municipalities, age_percentages):
+    def __init__(self, municipalities, age_percentages, population_column='Pop_div100', scale=1000, sementes=None):
         self.municipalities = municipalities
         self.age_percentages = age_percentages
+        self.population_column = population_column
+        self.scale = scale  # Redução do volume de dados: pessoas por cidadão simulado
+        self.sementes = como_sementes(sementes).sub('amostragem')
         self.population = None
 
     def calculate_population_by_age(self):
-        """Calcula a população por faixa etária para cada município."""
+        """
+        Calcula a população amostrada por faixa etária para cada município (sem alterar
+        as entradas). 'Peso' é o número de pessoas que cada cidadão simulado representa.
+        """
         print("\n--- Step 4: Calculando população por faixa etária para cada município ---")
-        self.age_percentages['Percentage'] /= 100  # Converte para fração
-
-        merged_data = self.municipalities[['Nome', 'Pop_div100']].merge(self.age_percentages, how='cross')
-        merged_data['Numero_Pessoas'] = (merged_data['Pop_div100'] * merged_data['Percentage']).astype(int)
-        merged_data['Numero_Pessoas'] = [int(i/1000) for i in merged_data['Numero_Pessoas']] ################       REdução do volume de dados
-
-        self.population = merged_data[['Nome', 'Age', 'Numero_Pessoas']].rename(
-            columns={'Nome': 'Municipio', 'Age': 'Idade'}
+        municipios = self.municipalities['Nome'].to_numpy()
+        idades = self.age_percentages['Age'].to_numpy()
+        starts = np.array([self.sementes.gerador(municipio).random() for municipio in municipios])
+        counts, weights = sample_population_by_age(
+            self.municipalities[self.population_column].to_numpy(),
+            self.age_percentages['Pop'].to_numpy(),
+            self.scale, starts,
         )
+        self.population = pd.DataFrame({
+            'Municipio': np.repeat(municipios, len(idades)),
+            'Idade': np.tile(idades, len(municipios)),
+            'Numero_Pessoas': counts.ravel(),
+            'Peso': np.repeat(weights, len(idades)),
+        })
         print("População por faixa etária para cada município calculada com sucesso.")
         return self.population
 
 
+def sortear_sobrenomes(rng, num_names, num_surnames_total, max_surnames=3):
+    """
+    Draws up to `max_surnames` distinct surname indices per person (without replacement
+    inside a name) plus how many of them are used (1..max_surnames).
+
+    Returns:
+        tuple: (indices (n, max_surnames), quantidade (n,)).
+    """
+    quantidade = rng.integers(1, max_surnames + 1, size=num_names)
+    indices = np.empty((num_names, max_surnames), dtype=np.int64)
+    for k in range(max_surnames):
+        # k-th draw among the S - k surnames left, shifted past the ones already taken
+        sorteio = rng.integers(0, num_surnames_total - k, size=num_names)
+        for anterior in np.sort(indices[:, :k], axis=1).T:
+            sorteio += sorteio >= anterior
+        indices[:, k] = sorteio
+    return indices, quantidade
+
+
 class NameGenerator:
-    def __init__(self, name_file):
+    def __init__(self, name_file, sementes=None):
         self.name_file = name_file
         self.names_df = pd.read_excel(name_file, sheet_name="Names")
-        self.first_names = self.names_df['First_Name'].dropna().astype(str).tolist()
-        self.surnames = self.names_df['Surname'].dropna().astype(str).tolist()
-
-    def generate_name(self, num_names=10):
-        """Gera nomes aleatórios para uma população."""
-        names = []
-        for _ in range(num_names):
-            first_name = random.choice(self.first_names)
-            num_surnames = random.randint(1, 3)
-            selected_surnames = random.sample(self.surnames, num_surnames)
-            full_name = f"{first_name} {' '.join(selected_surnames)}"
-            names.append(full_name)
-        return names
+        self.first_names = np.array(self.names_df['First_Name'].dropna().astype(str).tolist(), dtype=object)
+        self.surnames = np.array(self.names_df['Surname'].dropna().astype(str).tolist(), dtype=object)
+        self.sementes = como_sementes(sementes).sub('nomes')
+        # Fallback stream for calls without rng, created once so successive calls differ
+        self.rng = self.sementes.gerador('avulso')
+
+    def generate_name(self, num_names=10, rng=None):
+        """Gera nomes aleatórios (primeiro nome + 1 a 3 sobrenomes distintos)."""
+        rng = rng if rng is not None else self.rng
+        primeiro = rng.integers(0, len(self.first_names), size=num_names)
+        sobrenomes, quantidade = sortear_sobrenomes(rng, num_names, len(self.surnames))
+
+        nomes = self.first_names[primeiro] + ' ' + self.surnames[sobrenomes[:, 0]]
+        for k in range(1, sobrenomes.shape[1]):
+            nomes = np.where(quantidade > k, nomes + ' ' + self.surnames[sobrenomes[:, k]], nomes)
+        return nomes.tolist()
 
     def generate_names_for_population(self, population_data):
-        """Gera nomes para a população."""
+        """Gera nomes para a população (um fluxo aleatório por município)."""
         print("\n--- Step 5: Gerando nomes para a população ---")
         population_data = population_data[population_data['Numero_Pessoas'] > 0]  # Filtra para números positivos
-        expanded_population = []
-
-        for _, row in population_data.iterrows():
-            municipio = row['Municipio']
-            idade = row['Idade']
-            numero_pessoas = row['Numero_Pessoas']
 
-            print(f"Processando município {municipio}, Idade {idade}")
-            nomes = self.generate_name(num_names=numero_pessoas)
-            expanded_population.extend(
-                {'Municipio': municipio, 'Idade': idade, 'Nome': nome} for nome in nomes
-            )
+        repeticoes = population_data['Numero_Pessoas'].to_numpy(dtype=np.int64)
+        expanded_population = pd.DataFrame({
+            'Municipio': np.repeat(population_data['Municipio'].to_numpy(), repeticoes),
+            'Idade': np.repeat(population_data['Idade'].to_numpy(), repeticoes),
+        })
+        if 'Peso' in population_data.columns:
+            expanded_population['Peso'] = np.repeat(population_data['Peso'].to_numpy(dtype=np.float64), repeticoes)
+        nomes = np.empty(len(expanded_population), dtype=object)
+        for municipio, posicoes in por_municipio(expanded_population['Municipio']):
+            nomes[posicoes] = self.generate_name(len(posicoes), rng=self.sementes.gerador(municipio))
+        expanded_population['Nome'] = nomes
 
         print("Nomes gerados para a população com sucesso.")
-        return pd.DataFrame(expanded_population)
+        return expanded_population
+
+
+def por_municipio(municipios):
+    """Yields (municipio, positions) for every municipality, in order of first appearance."""
+    codigos, nomes = pd.factorize(municipios)
+    ordem = np.argsort(codigos, kind='stable')
+    limites = np.searchsorted(codigos[ordem], np.arange(len(nomes) + 1))
+    for i, municipio in enumerate(nomes):
+        yield municipio, ordem[limites[i]:limites[i + 1]]
 
 
 class AttributeAssigner:
-    def __init__(self, attribute_file):
+    """
+    Int, Ath and Cha from the bands of Atributos.ods, correlated through a Gaussian
+    copula (see Attribute_Model). `correlation=None` draws them independently and
+    `age_effects` (e.g. EFEITOS_IDADE_PADRAO) makes the bands depend on Idade.
+    """
+    def __init__(self, attribute_file, sementes=None, correlation=CORRELACAO_PADRAO, age_effects=None):
         self.attribute_file = attribute_file
+        self.sementes = como_sementes(sementes).sub('atributos')
+        self.correlation = correlation
+        self.age_effects = age_effects
+        self.modelo = None
 
     def generate_attributes(self, population_data):
-        """Gera e adiciona atributos para cada linha do DataFrame."""
+        """Gera e adiciona atributos para cada linha do DataFrame (um fluxo por município, transformação em lotes)."""
         print("\n--- Step 8: Gerando e adicionando atributos para cada linha da população ---")
-        sheet_names = ["Atributo_Int", "Atributo_Ath", "Atributo_Cha"]
-
-        for sheet in sheet_names:
-            data = pd.read_excel(self.attribute_file, sheet_name=sheet)
-            data['Percentage'] = data['Percentage'].str.replace('%', '', regex=False).str.replace(',', '.').astype(float) / 100
-            data['Cumulative'] = data['Percentage'].cumsum()
-
-            population_data[sheet] = None
-            for idx in population_data.index:
-                rand_num = np.random.rand()
-                for _, row in data.iterrows():
-                    if rand_num <= row['Cumulative']:
-                        random_value = random.randint(row['Start'], row['End'])
-                        population_data.at[idx, sheet] = f"{random_value} ({row['Description']})"
-                        break
+        if self.modelo is None:
+            self.modelo = CorrelatedAttributeModel.from_file(self.attribute_file, self.age_effects, self.correlation)
+        modelo = self.modelo
+
+        normais = np.empty((len(population_data), len(modelo.nomes)))
+        for municipio, posicoes in por_municipio(population_data['Municipio']):
+            normais[posicoes] = modelo.latent(self.sementes.gerador(municipio), len(posicoes))
+        valores, faixas = modelo.transform(normais, population_data['Idade'].to_numpy())
+
+        for nome, rotulo in modelo.descricoes(valores, faixas).items():
+            population_data[nome] = rotulo
 
         print("Atributos adicionados com sucesso.")
         return population_data
 
 
 class IdentityGenerator:
+    def __init__(self, sementes=None):
+        self.sementes = como_sementes(sementes).sub('identidade')
+        self.rng = self.sementes.gerador('avulso')
+
     @staticmethod
-    def generate_identity_number(row):
+    def initials_numbers(nome):
+        """Iniciais do nome convertidas em números (A=0, B=1, ...)."""
+        return ''.join(str(ord(part[0].upper()) - ord('A')) for part in nome.split())
+
+    def generate_identity_number(self, row, rng=None):
         """Gera um número de identidade fictício."""
-        name_parts = row['Nome'].split()
-        initials = ''.join(part[0].upper() for part in name_parts)
-        initials_numbers = ''.join(str(ord(char) - ord('A')) for char in initials)
-        state_id = str(row['ID_State'])
-        random_digits = f"{random.randint(0, 9)}{random.randint(0, 9)}"
-        city_id = str(row['ID_City'])
-        age = row['Idade']
-        return f"{initials_numbers}.{state_id}{random_digits}.{city_id}-{age}"
+        rng = rng if rng is not None else self.rng
+        random_digits = ''.join(map(str, rng.integers(0, 10, size=2)))
+        return (
+            f"{self.initials_numbers(row['Nome'])}.{row['ID_State']}{random_digits}"
+            f".{row['ID_City']}-{row['Idade']}"
+        )
+
+
+# --- Etapas (unidades do cache de resultados) ---
+def etapa_idades(age_file):
+    return AgePopulationProcessor(age_file).calculate_age_population_percentage()
+
+
+def etapa_municipios(municipality_file):
+    return MunicipalityProcessor(municipality_file).load_population_data_by_municipality()
+
+
+def etapa_populacao_por_idade(municipalities, age_percentages, scale, sementes):
+    return PopulationProcessor(municipalities, age_percentages, scale=scale, sementes=sementes).calculate_population_by_age()
+
+
+def etapa_cidadaos(population_by_age, age_file, attributes_file, sementes, age_effects=False):
+    population_with_names = NameGenerator(age_file, sementes).generate_names_for_population(population_by_age)
+    assigner = AttributeAssigner(attributes_file, sementes, age_effects=EFEITOS_IDADE_PADRAO if age_effects else None)
+    return assigner.generate_attributes(population_with_names)
+
+
+def blocos_municipios(population_by_age, linhas_por_bloco=1_000_000):
+    """Splits the population table into blocks of whole municipalities with about `linhas_por_bloco` citizens."""
+    pessoas = population_by_age.groupby('Municipio', sort=False)['Numero_Pessoas'].sum().clip(lower=0)
+    bloco = (pessoas.cumsum() - pessoas) // linhas_por_bloco
+    numero = population_by_age['Municipio'].map(bloco).to_numpy()
+    for _, linhas in population_by_age.groupby(numero, sort=True).indices.items():
+        yield population_by_age.iloc[linhas]
+
+
+def gerar_em_disco(population_by_age, diretorio, age_file, attributes_file, sementes, age_effects=False,
+                   households=False, linhas_por_bloco=1_000_000):
+    """
+    Generates the citizens block by block (whole municipalities) straight into a memory-mapped
+    columnar directory (see Population_Columnar), so the full population is never in memory.
+    Every generator draws from per-municipality streams, so the result is the same as main()'s.
+
+    Returns:
+        MappedPopulation: The written population.
+    """
+    from Population_Columnar import PopulationWriter
+
+    names = NameGenerator(age_file, sementes)
+    assigner = AttributeAssigner(attributes_file, sementes, age_effects=EFEITOS_IDADE_PADRAO if age_effects else None)
+    householder = None
+    if households:
+        # Imported here: Household_Generator builds on this module
+        from Household_Generator import HouseholdGenerator
+
+        householder = HouseholdGenerator(names.surnames, sementes)
+
+    writer = PopulationWriter(diretorio, population_by_age['Numero_Pessoas'].clip(lower=0).sum())
+    total_domicilios = 0
+    for bloco in blocos_municipios(population_by_age, linhas_por_bloco):
+        citizens = assigner.generate_attributes(names.generate_names_for_population(bloco))
+        if householder is not None:
+            citizens, household_table = householder.form_households(citizens)
+            citizens['Domicilio'] += total_domicilios
+            total_domicilios += len(household_table)
+        writer.write(citizens)
+    return writer.close()
 
 
 # --- Script Principal ---
-if __name__ == "__main__":
+def main(age_file='Data_Pop_Age_Name.ods', municipality_file='Filtered_Pop_Municipio.ods',
+         attributes_file="Atributos.ods", output_file=None, semente=None, cache=None, scale=1000,
+         households=False, age_effects=False, mmap_dir=None, block_rows=1_000_000):
+    """
+    Runs the whole generator; with a CacheEtapas only the stages whose inputs changed run.
+    `scale` is the number of people each generated citizen stands for (column 'Peso');
+    `households` groups the citizens into families (Domicilio, Papel, Sobrenome);
+    `age_effects` makes the attributes depend on age (EFEITOS_IDADE_PADRAO).
+    With `mmap_dir` the citizens are written block by block to that memory-mapped directory
+    (blocks of about `block_rows` citizens) and a MappedPopulation is returned.
+    """
+    sementes = como_sementes(semente).sub('populacao')
+
     # Etapa 1: Processamento da população por faixa etária
-    age_processor = AgePopulationProcessor('Data_Pop_Age_Name.ods')
-    age_percentages = age_processor.calculate_age_population_percentage()
+    age_percentages = em_cache(cache, etapa_idades, Arquivo(age_file))
 
     # Etapa 2: Processamento de municípios
-    municipality_processor = MunicipalityProcessor('Filtered_Pop_Municipio.ods')
-    municipalities = municipality_processor.load_population_data_by_municipality()
+    municipalities = em_cache(cache, etapa_municipios, Arquivo(municipality_file))
 
     # Etapa 3: Processamento da população
-    population_processor = PopulationProcessor(municipalities, age_percentages)
-    population_by_age = population_processor.calculate_population_by_age()
-
-    # Etapa 4: Geração de nomes
-    name_generator = NameGenerator('Data_Pop_Age_Name.ods')
-    population_with_names = name_generator.generate_names_for_population(population_by_age)
-
-    # Etapa 5: Atribuição de atributos
-    attribute_assigner = AttributeAssigner("Atributos.ods")
-    population_with_attributes = attribute_assigner.generate_attributes(population_with_names)
+    population_table = em_cache(
+        cache, etapa_populacao_por_idade, municipalities, age_percentages, scale, sementes,
+    )
+
+    if mmap_dir is not None:
+        if output_file is not None:
+            raise ValueError("Use output_file ou mmap_dir, não os dois.")
+        populacao = gerar_em_disco(population_table, mmap_dir, age_file, attributes_file, sementes,
+                                   age_effects, households, block_rows)
+        print(f"\n--- População gravada em '{populacao.diretorio}' ---")
+        print(populacao.to_frame(linhas=slice(0, 5)))
+        print(len(populacao))
+        return populacao
+
+    # Etapas 4 e 5: Geração de nomes e atribuição de atributos
+    population_with_attributes = em_cache(
+        cache, etapa_cidadaos, population_table, Arquivo(age_file), Arquivo(attributes_file), sementes, age_effects,
+    )
+
+    if households:
+        # Imported here: Household_Generator builds on this module
+        import Household_Generator
+
+        population_with_attributes, household_table = em_cache(
+            cache, Household_Generator.etapa_domicilios, population_with_attributes, Arquivo(age_file), sementes,
+        )
+        print(Household_Generator.resumo_domicilios(household_table).head())
 
-    #population_with_attributes.to_excel('population_data.ods')
+    if output_file is not None:
+        population_with_attributes.to_excel(output_file)
 
     # Etapa 6: Exibir resultado final
     print("\n--- População com nomes e atributos ---")
     print(population_with_attributes.head())
     print(len(population_with_attributes))
+    return population_with_attributes
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# Indexed population store: filter, count and group without full scans
+# ==========================================
+# The citizens are sorted once by (municipality, age). An offset table then gives
+# the contiguous row range of any municipality/age interval in O(1), and prefix
+# sums of Peso answer weighted totals of those ranges without touching the rows.
+# Every attribute band (Atributo_* labels "value (Description)") gets a bitmap over
+# the sorted rows, packed in 64-bit words: a band filter is an OR of band words, a
+# filter on several attributes an AND, and counting is a popcount over the words
+# of the selected ranges (64 rows per operation). Only rows of bands cut by a
+# value bound (e.g. Ath > 72 inside the 70-80 band) are checked one by one.
+#
+#   store = PopulationStore(populacao)
+#   store.count(Municipio='Brasília', Idade=(18, 30), Atributo_Ath=(71, None))
+#   store.count(Idade=(18, 30), Atributo_Ath='High', weighted=True)
+#   store.group_by('Municipio', Atributo_Int=['High', 'Above Average'])
+#   store.select(['Nome', 'Idade'], Municipio=['Salvador', 'Recife'], Atributo_Cha=(60, 80))
+
+BITS = 64
+
+
+def _palavras(mascara):
+    """Packs a boolean row mask into little-endian uint64 words (bit i of word w = row 64w + i)."""
+    bytes_ = np.packbits(mascara, bitorder='little')
+    bytes_ = np.concatenate([bytes_, np.zeros(-len(bytes_) % 8, dtype=np.uint8)])
+    return bytes_.view('<u8')
+
+
+def _bits_para_linhas(palavras, indices):
+    """Rows whose bit is set in `palavras` (words `indices` of the full bitmap)."""
+    cheias = np.flatnonzero(palavras)
+    if len(cheias) == 0:
+        return np.zeros(0, dtype=np.int64)
+    bits = np.flatnonzero(np.unpackbits(palavras[cheias].view(np.uint8), bitorder='little'))
+    return indices[cheias[bits // BITS]] * BITS + bits % BITS
+
+
+def _uniao(bitmaps, faixas, indices):
+    """OR of the band bitmaps `faixas` over the words `indices` (a slice when they are contiguous)."""
+    if len(indices) and indices[-1] - indices[0] + 1 == len(indices):
+        indices = slice(int(indices[0]), int(indices[-1]) + 1)
+    uniao = np.zeros(len(bitmaps[0][indices]) if len(bitmaps) else 0, dtype=np.uint64)
+    for faixa in faixas:
+        uniao |= bitmaps[faixa][indices]
+    return uniao
+
+
+def _intervalo(valor, nome):
+    """(low, high) inclusive bounds of a filter value: int, (low, high) or (low, None)."""
+    if isinstance(valor, (tuple, list)) and len(valor) == 2 and not any(isinstance(v, str) for v in valor):
+        baixo, alto = valor
+        return (-np.inf if baixo is None else baixo), (np.inf if alto is None else alto)
+    if isinstance(valor, (int, np.integer)):
+        return valor, valor
+    raise ValueError(f"Filtro inválido para '{nome}': use um valor, (mínimo, máximo) ou faixas por descrição.")
+
+
+class PopulationStore:
+    """
+    Citizens sorted by (Municipio, Idade) with offset tables and band bitmaps.
+
+    Args:
+        population_data (DataFrame): Output of the generator (Municipio, Idade, Atributo_* labels
+            and, optionally, Peso and any other columns, kept for select).
+        weight_column (str): Column with the people each row stands for (1 when missing).
+    """
+    def __init__(self, population_data, weight_column='Peso'):
+        municipio, municipios = pd.factorize(population_data['Municipio'], sort=True)
+        idade = population_data['Idade'].to_numpy(dtype=np.int64)
+        ordem = np.lexsort((idade, municipio))
+        self.data = population_data.iloc[ordem].reset_index(drop=True)
+        peso = (self.data[weight_column].to_numpy(dtype=np.float64) if weight_column in self.data.columns
+                else np.ones(len(ordem)))
+        atributos = {}
+        for coluna in [c for c in self.data.columns if str(c).startswith('Atributo_')]:
+            atributos[coluna] = pd.factorize(self.data[coluna])
+        self._indexar(municipio[ordem], municipios, idade[ordem], peso, atributos)
+
+    @classmethod
+    def from_mapped(cls, populacao, weight_column='Peso'):
+        """
+        Store over a MappedPopulation (Population_Columnar): its rows are already sorted by
+        municipality and age and its string columns are vocabulary codes, so the mapped
+        arrays are used as they are; only the offsets, prefix sums and bitmaps are built.
+        """
+        store = cls.__new__(cls)
+        store.data = None
+        store.mapeada = populacao
+        peso = populacao.array(weight_column) if weight_column in populacao.colunas else np.ones(len(populacao))
+        atributos = {
+            coluna: (populacao.array(coluna), populacao.vocabulario(coluna))
+            for coluna, info in populacao.colunas.items() if coluna.startswith('Atributo_') and info['tipo'] == 'codigo'
+        }
+        store._indexar(populacao.array('Municipio'), populacao.vocabulario('Municipio'),
+                       populacao.array('Idade'), peso, atributos)
+        return store
+
+    def _indexar(self, municipio, municipios, idade, peso, atributos):
+        """
+        Builds the indexes over rows sorted by (municipality code, age).
+
+        Args:
+            municipio, idade, peso (array): Sorted columns (memory-mapped arrays are not copied).
+            atributos (dict): {column: (codes, labels)} of the Atributo_* columns.
+        """
+        self.n = len(municipio)
+        self.municipios = municipios
+        self.municipio = municipio.astype(np.int32, copy=False)
+        self.idade = idade.astype(np.int16, copy=False)
+        if self.n and self.idade.min() < 0:
+            raise ValueError("Idades negativas na população.")
+        self.idade_maxima = int(self.idade.max()) if self.n else 0
+        self._codigo_municipio = {nome: i for i, nome in enumerate(self.municipios)}
+
+        # offsets[m, a] = first row of municipality m with age >= a (a = 0..idade_maxima + 1)
+        largura = self.idade_maxima + 1
+        chave = self.municipio.astype(np.int64) * largura + self.idade
+        if np.any(chave[1:] < chave[:-1]):
+            raise ValueError("As linhas precisam estar ordenadas por município e idade.")
+        contagem = np.bincount(chave, minlength=len(self.municipios) * largura)
+        self.offsets = np.concatenate([[0], np.cumsum(contagem)]).astype(np.int64)
+
+        self.peso = peso.astype(np.float64, copy=False)
+        self._peso_acumulado = np.concatenate([[0.0], np.cumsum(self.peso)])
+
+        # Attribute values, band codes and one bitmap per band
+        self.atributos = {}
+        for coluna, (codigos, rotulos) in atributos.items():
+            partes = pd.Series(rotulos).astype(str).str.extract(r'^\s*(-?\d+)\s*\((.*)\)\s*$')
+            if partes.isna().any().any():
+                raise ValueError(f"Rótulos inesperados na coluna '{coluna}' (esperado 'valor (Descrição)').")
+            valor_rotulo = partes[0].astype(np.int64).to_numpy()
+            # Bands ordered by their lowest value
+            faixas = pd.Series(valor_rotulo).groupby(partes[1].to_numpy()).min().sort_values().index.to_numpy(dtype=object)
+            faixa_rotulo = pd.Index(faixas).get_indexer(partes[1])
+            faixa = faixa_rotulo[codigos].astype(np.int8)
+            valor = valor_rotulo[codigos].astype(np.int16)
+            self.atributos[coluna] = {
+                'valor': valor,
+                'faixa': faixa,
+                'faixas': faixas,
+                'minimo': np.array([valor_rotulo[faixa_rotulo == b].min() for b in range(len(faixas))]),
+                'maximo': np.array([valor_rotulo[faixa_rotulo == b].max() for b in range(len(faixas))]),
+                'bitmaps': np.stack([_palavras(faixa == b) for b in range(len(faixas))]) if self.n else
+                           np.zeros((len(faixas), 0), dtype='<u8'),
+            }
+
+    def __len__(self):
+        return self.n
+
+    def __repr__(self):
+        return (f"PopulationStore({self.n} cidadãos, {len(self.municipios)} municípios, "
+                f"atributos={list(self.atributos)})")
+
+    # ------------------------------------------
+    # Query planning
+    # ------------------------------------------
+    def _faixas_linhas(self, municipio=None, idade=None):
+        """(starts, ends) of the sorted row ranges matching the municipality and age filters."""
+        if municipio is None:
+            codigos = np.arange(len(self.municipios))
+        else:
+            nomes = [municipio] if isinstance(municipio, str) else list(municipio)
+            desconhecidos = [m for m in nomes if m not in self._codigo_municipio]
+            if desconhecidos:
+                raise ValueError(f"Município desconhecido: {', '.join(map(str, desconhecidos))}")
+            codigos = np.unique([self._codigo_municipio[m] for m in nomes])
+        baixo, alto = (0, self.idade_maxima) if idade is None else _intervalo(idade, 'Idade')
+        baixo = int(np.clip(np.ceil(baixo), 0, self.idade_maxima + 1))
+        alto = int(np.clip(np.floor(alto), -1, self.idade_maxima))
+        largura = self.idade_maxima + 1
+        if alto < baixo:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        inicio = self.offsets[codigos * largura + baixo]
+        fim = self.offsets[codigos * largura + alto + 1]
+        cheias = fim > inicio
+        inicio, fim = inicio[cheias], fim[cheias]
+        if len(inicio) == 0:
+            return inicio, fim
+        # Ranges that touch (e.g. consecutive municipalities with every age) are merged
+        novo = np.concatenate([[True], inicio[1:] != fim[:-1]])
+        return inicio[novo], fim[np.concatenate([novo[1:], [True]])]
+
+    def _filtros_atributos(self, filtros):
+        """[(attribute, full bands, partial bands, low, high)] from the keyword filters."""
+        plano = []
+        for coluna, valor in filtros.items():
+            if coluna not in self.atributos:
+                raise ValueError(f"Filtro em coluna não indexada: '{coluna}' (use Municipio, Idade ou Atributo_*).")
+            indice = self.atributos[coluna]
+            if isinstance(valor, str) or (isinstance(valor, (list, tuple, set)) and all(isinstance(v, str) for v in valor)):
+                nomes = [valor] if isinstance(valor, str) else list(valor)
+                desconhecidas = set(nomes) - set(indice['faixas'])
+                if desconhecidas:
+                    raise ValueError(f"Faixa desconhecida em '{coluna}': {sorted(desconhecidas)}")
+                plano.append((coluna, np.flatnonzero(np.isin(indice['faixas'], nomes)), np.zeros(0, dtype=np.int64), None, None))
+                continue
+            baixo, alto = _intervalo(valor, coluna)
+            inteiras = np.flatnonzero((indice['minimo'] >= baixo) & (indice['maximo'] <= alto))
+            parciais = np.flatnonzero((indice['maximo'] >= baixo) & (indice['minimo'] <= alto)
+                                      & ~((indice['minimo'] >= baixo) & (indice['maximo'] <= alto)))
+            plano.append((coluna, inteiras, parciais, baixo, alto))
+        return plano
+
+    def _palavras_intervalos(self, inicio, fim):
+        """Word indices covering the row ranges and the mask of the rows inside them."""
+        primeira, ultima = inicio // BITS, (fim - 1) // BITS
+        quantidade = ultima - primeira + 1
+        indices = np.repeat(primeira - np.cumsum(np.concatenate([[0], quantidade[:-1]])), quantidade) + np.arange(quantidade.sum())
+        mascara = np.full(len(indices), np.uint64(0xFFFFFFFFFFFFFFFF), dtype=np.uint64)
+        posicao_primeira = np.concatenate([[0], np.cumsum(quantidade)[:-1]])
+        posicao_ultima = posicao_primeira + quantidade - 1
+        deslocamento = (inicio % BITS).astype(np.uint64)
+        mascara[posicao_primeira] &= ~((np.uint64(1) << deslocamento) - np.uint64(1))
+        sobra = (fim - ultima * BITS).astype(np.uint64)  # rows used in the last word (1..64)
+        completa = sobra == BITS
+        mascara[posicao_ultima] &= np.where(completa, np.uint64(0xFFFFFFFFFFFFFFFF),
+                                            (np.uint64(1) << np.where(completa, np.uint64(0), sobra)) - np.uint64(1))
+        # Ranges never share rows, but consecutive ranges can share an edge word: merge them
+        grupos = np.flatnonzero(np.concatenate([[True], indices[1:] != indices[:-1]]))
+        return indices[grupos], np.bitwise_or.reduceat(mascara, grupos)
+
+    def _linhas(self, Municipio=None, Idade=None, **filtros):
+        """Sorted row numbers of the citizens matching the filters."""
+        inicio, fim = self._faixas_linhas(Municipio, Idade)
+        if len(inicio) == 0:
+            return np.zeros(0, dtype=np.int64)
+        if not filtros:
+            quantidade = fim - inicio
+            return np.repeat(inicio - np.cumsum(np.concatenate([[0], quantidade[:-1]])), quantidade) + np.arange(quantidade.sum())
+        indices, mascara = self._palavras_intervalos(inicio, fim)
+        return _bits_para_linhas(self._mascara(indices, mascara, filtros), indices)
+
+    def _mascara(self, indices, mascara, filtros):
+        """AND of the attribute filters over the selected words."""
+        for coluna, inteiras, parciais, baixo, alto in self._filtros_atributos(filtros):
+            indice = self.atributos[coluna]
+            bitmaps = indice['bitmaps']
+            aceitas = _uniao(bitmaps, inteiras, indices) if len(inteiras) else np.zeros_like(mascara)
+            if len(parciais):
+                candidatas = _uniao(bitmaps, parciais, indices) & mascara
+                linhas = _bits_para_linhas(candidatas, indices)
+                valor = indice['valor'][linhas]
+                linhas = linhas[(valor >= baixo) & (valor <= alto)]
+                posicao = np.searchsorted(indices, linhas // BITS)
+                np.bitwise_or.at(aceitas, posicao, np.uint64(1) << (linhas % BITS).astype(np.uint64))
+            mascara = mascara & aceitas
+        return mascara
+
+    # ------------------------------------------
+    # Public API
+    # ------------------------------------------
+    def count(self, weighted=False, **filtros):
+        """
+        Citizens matching the filters (Peso sum with weighted=True).
+
+        Filters: Municipio (name or list), Idade (age or (min, max)), Atributo_* as a value,
+        (min, max) with None for an open bound, or band descriptions ('High' or a list).
+        """
+        municipio, idade = filtros.pop('Municipio', None), filtros.pop('Idade', None)
+        inicio, fim = self._faixas_linhas(municipio, idade)
+        if not filtros:
+            # Offsets and prefix sums only
+            if weighted:
+                return float((self._peso_acumulado[fim] - self._peso_acumulado[inicio]).sum())
+            return int((fim - inicio).sum())
+        if len(inicio) == 0:
+            return 0.0 if weighted else 0
+        indices, mascara = self._palavras_intervalos(inicio, fim)
+        mascara = self._mascara(indices, mascara, filtros)
+        if weighted:
+            return float(self.peso[_bits_para_linhas(mascara, indices)].sum())
+        return int(np.bitwise_count(mascara).sum())
+
+    def select(self, columns=None, **filtros):
+        """Rows matching the filters (all columns or `columns`), sorted by municipality and age."""
+        linhas = self._linhas(**filtros)
+        if self.data is None:
+            return self.mapeada.to_frame(columns, linhas)
+        data = self.data if columns is None else self.data[list(columns)]
+        return data.iloc[linhas].reset_index(drop=True)
+
+    def group_by(self, by, weighted=False, **filtros):
+        """
+        Citizens per value of `by` (Municipio, Idade or an Atributo_* band) among the rows
+        matching the filters; groups without citizens are left out.
+        """
+        linhas = self._linhas(**filtros)
+        if by == 'Municipio':
+            codigos, rotulos = self.municipio[linhas], np.asarray(self.municipios, dtype=object)
+        elif by == 'Idade':
+            codigos, rotulos = self.idade[linhas], np.arange(self.idade_maxima + 1)
+        elif by in self.atributos:
+            codigos, rotulos = self.atributos[by]['faixa'][linhas], self.atributos[by]['faixas']
+        else:
+            raise ValueError(f"Agrupamento não suportado: '{by}' (use Municipio, Idade ou Atributo_*).")
+        total = np.bincount(codigos, weights=self.peso[linhas] if weighted else None, minlength=len(rotulos))
+        resultado = pd.Series(total if weighted else total.astype(np.int64), index=pd.Index(rotulos, name=by),
+                              name='Peso' if weighted else 'Cidadaos')
+        return resultado[resultado > 0]
+
+
+def interpretar_filtros(texto):
+    """
+    Filters from a command line expression such as
+    "Municipio=Belo Horizonte Idade=18:30 Atributo_Ath=71: Atributo_Int=High,Above Average".
+    Bounds are inclusive, either side of ':' may be empty and ',' separates names.
+    """
+    filtros = {}
+    for chave, valor in re.findall(r'(\w+)=(.*?)(?=\s+\w+=|\s*$)', texto.strip()):
+        if ':' in valor:
+            baixo, alto = valor.split(':', 1)
+            filtros[chave] = (int(baixo) if baixo else None, int(alto) if alto else None)
+        elif valor.lstrip('-').isdigit():
+            filtros[chave] = int(valor)
+        else:
+            nomes = [nome.strip() for nome in valor.split(',')]
+            filtros[chave] = nomes if len(nomes) > 1 else nomes[0]
+    if not filtros and texto.strip():
+        raise ValueError(f"Filtro inválido: '{texto}' (use Coluna=valor)")
+    return filtros
+
+
+if __name__ == "__main__":
+    from Population_Generator import main
+
+    # Regression: a municipality/age cell with no citizens counts as zero (used to raise IndexError)
+    vazia = PopulationStore(pd.DataFrame({
+        'Municipio': ['Araci', 'Araci', 'Salvador'], 'Idade': [10, 40, 92],
+        'Atributo_Int': ['9 (Low)', '27 (Low Average)', '69 (Above Average)'],
+    }))
+    assert vazia.count(Municipio='Araci', Idade=(90, 95)) == 0
+    assert vazia.count(Municipio=['Araci', 'Salvador'], Idade=(90, 95)) == 1
+    assert len(vazia.select(Municipio='Araci', Idade=(90, 95))) == 0
+    assert vazia.group_by('Atributo_Int', Municipio='Araci', Idade=(90, 95)).sum() == 0
+
+    store = PopulationStore(main(scale=100))
+    print(store)
+    print(store.count(Municipio='Brasília', Idade=(18, 30), Atributo_Ath=(71, None)))
+    print(store.count(Idade=(18, 30), Atributo_Ath='High', weighted=True))
+    print(store.group_by('Atributo_Int', Municipio='Salvador').head())
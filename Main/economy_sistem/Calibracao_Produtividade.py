@@ -0,0 +1,243 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from Grafo_Produtos import carregar_tabelas, compilar_grafo, calcular_demanda_vetorizada
+from Simulador_Vetorizado import capacidade_produtos, produtividade_plena, simular_producao
+
+# ==========================================
+# Productivity calibration (replaces the hand-tuned taxa_pp)
+# ==========================================
+# The unknown is the fraction of full productivity (taxa) of every industry. The
+# satisfaction of an industry (production / accumulated demand of its products) is
+# non-decreasing in its own taxa, so each industry is solved by k-section: k
+# candidate taxas per industry are evaluated at once, one simulator row per
+# (industry, candidate), with every other industry at its current estimate. Since
+# industries feed each other, the sweep is repeated (Jacobi style) until the taxas
+# stop moving, and a final correction pass raises the industries that still fall
+# short in the joint evaluation. An industry held back by its inputs gets the
+# smallest taxa that reaches the satisfaction its inputs allow. Candidate rows are
+# split over a process pool when requested.
+
+_GRAFO = None
+_CONTEXTO = None
+
+def _iniciar_worker(grafo, contexto):
+    """Process pool initializer: the compiled graph and the fixed arrays are sent once per worker."""
+    global _GRAFO, _CONTEXTO
+    _GRAFO = grafo
+    _CONTEXTO = contexto
+
+def _avaliar_bloco(taxas):
+    return avaliar_taxas(_GRAFO, taxas, **_CONTEXTO)
+
+def satisfacao_industrias(grafo, producao, demanda):
+    """
+    Satisfaction of every industry: production / accumulated demand summed over its
+    products (extractive output above demand counts as 100%).
+
+    Returns:
+        ndarray: (R, I) satisfaction (NaN for industries without demand).
+    """
+    producao = np.atleast_2d(producao)
+    demanda = np.broadcast_to(demanda, producao.shape)
+    tem_industria = grafo.industria_de >= 0
+    industria = grafo.industria_de[tem_industria]
+    n = len(grafo.industrias)
+    atendida = np.minimum(producao, demanda)[:, tem_industria]
+    numerador = np.zeros((len(producao), n))
+    denominador = np.zeros((len(producao), n))
+    np.add.at(numerador.T, industria, atendida.T)
+    np.add.at(denominador.T, industria, demanda[:, tem_industria].T)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominador > 0, numerador / denominador, np.nan)
+
+def avaliar_taxas(grafo, taxas, plena, demanda, estoque=None):
+    """
+    Runs one production tick per row of taxas and returns the satisfaction per industry.
+
+    Args:
+        taxas (ndarray): (R, I) fraction of the full productivity of every industry.
+        plena (ndarray): (I,) full productivity (see produtividade_plena).
+        demanda (ndarray): (P,) accumulated demand.
+        estoque (ndarray): (P,) initial stock (default: empty).
+
+    Returns:
+        ndarray: (R, I) satisfaction.
+    """
+    taxas = np.atleast_2d(taxas)
+    inicial = np.zeros(len(grafo)) if estoque is None else estoque
+    estoques = np.repeat(np.asarray(inicial, dtype=np.float64)[None], len(taxas), axis=0)
+    capacidade = capacidade_produtos(grafo, taxas * plena)
+    resultado = simular_producao(grafo, estoques, capacidade, demanda)
+    return satisfacao_industrias(grafo, resultado['producao'], demanda)
+
+def industrias_fornecedoras(grafo):
+    """
+    Supplier matrix between industries, direct or through other industries.
+
+    Returns:
+        ndarray: (I, I) bool, [j, s] True when industry j depends on a product of industry s.
+    """
+    A = grafo.A.tocoo()
+    cliente = grafo.industria_de[A.row]
+    fornecedor = grafo.industria_de[A.col]
+    valido = (cliente >= 0) & (fornecedor >= 0) & (cliente != fornecedor) & (A.data > 0)
+    n = len(grafo.industrias)
+    matriz = np.zeros((n, n), dtype=bool)
+    matriz[cliente[valido], fornecedor[valido]] = True
+    while True:
+        fechamento = matriz | ((matriz.astype(np.int64) @ matriz.astype(np.int64)) > 0)
+        if np.array_equal(fechamento, matriz):
+            return matriz
+        matriz = fechamento
+
+def calibrar_produtividade(grafo, demanda, alvo=0.95, taxa_max=2.0, candidatos=8, passos=4,
+                           iteracoes=10, tolerancia=1e-3, estoque=None, processos=None):
+    """
+    Searches the smallest taxa of every industry that reaches the target satisfaction
+    (or, when its inputs do not allow it, the highest satisfaction reachable).
+
+    Args:
+        demanda (ndarray): (P,) accumulated demand (calcular_demanda_vetorizada).
+        alvo (float or dict): Target satisfaction, global or per industry name.
+        taxa_max (float): Upper bound of the search (multiple of the full productivity).
+        candidatos (int): Points evaluated per industry in each k-section step.
+        passos (int): k-section steps per sweep (interval shrinks by `candidatos` each step).
+        iteracoes (int): Maximum Jacobi sweeps (and correction passes); reaching it is reported.
+        tolerancia (float): Stops when no taxa moves more than this between sweeps.
+        processos (int): Worker processes for the candidate rows (None/1 = serial).
+
+    Returns:
+        DataFrame: Industria, Taxa, Produtividade, Produtividade_Plena, Alvo,
+            Satisfacao and Atingido, one row per industry.
+    """
+    demanda = np.asarray(demanda, dtype=np.float64)
+    plena = produtividade_plena(grafo, demanda)
+    n = len(grafo.industrias)
+    if isinstance(alvo, dict):
+        alvos = np.array([alvo.get(nome, 0.95) for nome in grafo.industrias], dtype=np.float64)
+    else:
+        alvos = np.full(n, float(alvo))
+    contexto = {'plena': plena, 'demanda': demanda, 'estoque': estoque}
+
+    executor = None
+    if processos is not None and processos > 1:
+        executor = ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_worker, initargs=(grafo, contexto))
+
+    def avaliar(taxas):
+        if executor is None:
+            return avaliar_taxas(grafo, taxas, **contexto)
+        blocos = np.array_split(taxas, min(processos, len(taxas)))
+        return np.concatenate(list(executor.map(_avaliar_bloco, blocos)))
+
+    industrias = np.arange(n)
+
+    def conjunta(taxa):
+        """
+        Joint satisfaction of the taxas and the effective target of every industry: its
+        satisfaction ceiling (own taxa at taxa_max, the others as given) caps the target,
+        so an industry held back by its inputs only needs the taxa that reaches it.
+        """
+        linhas = np.repeat(taxa[None], n + 1, axis=0)
+        linhas[industrias + 1, industrias] = taxa_max
+        satisfacao = avaliar(linhas)
+        teto = satisfacao[industrias + 1, industrias]
+        return satisfacao[0], np.where(np.isnan(teto), alvos, np.minimum(alvos, teto * (1 - 1e-6)))
+
+    try:
+        taxa = np.full(n, min(1.0, taxa_max))
+        fracoes = np.arange(1, candidatos + 1) / candidatos
+        for _ in range(iteracoes):
+            anterior = taxa.copy()
+            base = taxa.copy()
+            alvo_efetivo = conjunta(base)[1]
+            inferior = np.zeros(n)
+            superior = np.full(n, float(taxa_max))
+            for _ in range(passos):
+                pontos = inferior[:, None] + (superior - inferior)[:, None] * fracoes  # (I, k)
+                # Row (j, m): every industry at its current taxa, industry j at pontos[j, m]
+                linhas = np.repeat(base[None], n * candidatos, axis=0)
+                linhas[np.arange(n * candidatos), np.repeat(industrias, candidatos)] = pontos.ravel()
+                satisfacao = avaliar(linhas)
+                propria = satisfacao[np.arange(n * candidatos), np.repeat(industrias, candidatos)].reshape(n, candidatos)
+                atinge = np.isnan(propria) | (propria >= alvo_efetivo[:, None])
+                primeiro = np.where(atinge.any(axis=1), atinge.argmax(axis=1), candidatos - 1)
+                novo_superior = pontos[industrias, primeiro]
+                inferior = np.where(primeiro > 0, pontos[industrias, np.maximum(primeiro - 1, 0)], inferior)
+                inferior = np.where(atinge.any(axis=1), inferior, novo_superior)
+                superior = novo_superior
+            taxa = superior
+            variacao = np.max(np.abs(taxa - anterior))
+            if variacao < tolerancia:
+                break
+        else:
+            if iteracoes > 0:  # With no sweeps there is nothing to converge
+                print(f"Calibração: {iteracoes} varreduras sem convergir (variação máxima da taxa {variacao:.4g})")
+
+        # Correction pass: each sweep solved every industry against the previous taxas of
+        # the others and capped its target at what its inputs allowed, so the joint result
+        # can still fall short. A short industry is raised in proportion to the shortfall
+        # (satisfaction is linear in the own taxa below the ceiling); one held back by its
+        # inputs raises its suppliers (all the way upstream) instead, until the joint evaluation reaches the target
+        # (or the satisfaction reached with every industry at taxa_max, when that is lower).
+        fornecedores = industrias_fornecedoras(grafo)
+        teto_global = avaliar(np.full((1, n), float(taxa_max)))[0]
+        alcancavel = np.where(np.isnan(teto_global), alvos, np.minimum(alvos, teto_global * (1 - 1e-6)))
+        for _ in range(iteracoes):
+            final, alvo_efetivo = conjunta(taxa)
+            curta = ~np.isnan(final) & (final < alcancavel)
+            if not curta.any():
+                break
+            with np.errstate(divide='ignore', invalid='ignore'):
+                fator = np.where(final > 0, alcancavel / final * (1 + 1e-4), np.inf)
+            propria = curta & (final < alvo_efetivo) & (taxa < taxa_max)
+            limitada = curta & ~propria
+            ganho = np.max(np.where(fornecedores[limitada], fator[limitada, None], 1.0), axis=0, initial=1.0)
+            nova = np.where(propria, taxa * fator, taxa * ganho)
+            nova = np.minimum(np.where(np.isinf(nova) | ((taxa == 0) & (ganho > 1)), taxa_max, nova), taxa_max)
+            if np.array_equal(nova, taxa):
+                break  # Nothing left to raise: the remaining shortfalls are out of reach
+            taxa = nova
+        else:
+            final = conjunta(taxa)[0]
+            curta = ~np.isnan(final) & (final < alcancavel)
+            if curta.any():
+                print(f"Calibração: correção parou após {iteracoes} passos sem atingir o alvo: "
+                      f"{', '.join(np.asarray(grafo.industrias, dtype=object)[curta])}")
+        final = conjunta(taxa)[0]
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    sem_demanda = np.isnan(final)
+    taxa = np.where(sem_demanda, 0.0, taxa)
+    return pd.DataFrame({
+        'Industria': grafo.industrias,
+        'Taxa': taxa,
+        'Produtividade': taxa * plena,
+        'Produtividade_Plena': plena,
+        'Alvo': alvos,
+        'Satisfacao': final,
+        'Atingido': sem_demanda | (final >= alvos - 1e-9),
+    })
+
+def taxas_por_industria(calibracao):
+    """Calibration table -> {industria: taxa}, the taxa_pp accepted by processar_industrias."""
+    return dict(zip(calibracao['Industria'], calibracao['Taxa']))
+
+def calibrar_tabelas(tabelas, populacao, alvo=0.95, processos=None):
+    """Stage form of the calibration: stage tables and population -> {industria: taxa}."""
+    grafo = compilar_grafo(tabelas)
+    demanda = calcular_demanda_vetorizada(grafo, populacao)
+    return taxas_por_industria(calibrar_produtividade(grafo, demanda, alvo=alvo, processos=processos))
+
+if __name__ == "__main__":
+    from Demanda_Regional import populacao_total
+
+    grafo = compilar_grafo(carregar_tabelas('Data_Products.ods'))
+    demanda = calcular_demanda_vetorizada(grafo, populacao_total())
+    calibracao = calibrar_produtividade(grafo, demanda, alvo=0.95, processos=os.cpu_count())
+    print(calibracao.to_string(index=False))
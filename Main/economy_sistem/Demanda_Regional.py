@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+from Grafo_Produtos import carregar_tabelas, compilar_grafo, demanda_final, propagar_demanda
+
+# ==========================================
+# Regional demand from the generated population
+# ==========================================
+# The population is aggregated per municipality and age straight from the source
+# tables (municipality totals x national age distribution), one block of
+# municipalities at a time, so no citizen is ever materialized.
+
+ARQUIVO_MUNICIPIOS = '../citizen_generator/Filtered_Pop_Municipio.ods'
+ARQUIVO_IDADES = '../citizen_generator/Data_Pop_Age_Name.ods'
+# Same scale as the generated citizens (PopulationProcessor.population_column)
+COLUNA_POPULACAO = 'Pop_div100'
+
+def carregar_municipios(arquivo=ARQUIVO_MUNICIPIOS, sheet_name='Main'):
+    """Loads the municipalities used by the population generator."""
+    return pd.read_excel(arquivo, sheet_name=sheet_name, engine='odf')
+
+def carregar_fracoes_idade(arquivo=ARQUIVO_IDADES, sheet_name='Age_Pop'):
+    """Loads the national age distribution as fractions (Series indexed by age)."""
+    data = pd.read_excel(arquivo, sheet_name=sheet_name, engine='odf')
+    return pd.Series((data['Pop'] / data['Pop'].sum()).values, index=data['Age'].values, name='Fracao')
+
+def iterar_populacao_por_idade(municipios, fracoes_idade, coluna=COLUNA_POPULACAO, tamanho_bloco=1024):
+    """
+    Yields (names, matrix) blocks with the population of every (municipality, age).
+
+    Args:
+        municipios (DataFrame): Municipalities with 'Nome' and the population column.
+        fracoes_idade (Series): Fraction of the population at each age.
+        coluna (str): Population column ('Pop' = inhabitants, 'Pop_div100' = generator scale).
+        tamanho_bloco (int): Municipalities per block.
+    """
+    fracoes = fracoes_idade.to_numpy(dtype=np.float64)
+    nomes = municipios['Nome'].to_numpy()
+    populacao = municipios[coluna].to_numpy(dtype=np.float64)
+    for inicio in range(0, len(municipios), tamanho_bloco):
+        fim = inicio + tamanho_bloco
+        yield nomes[inicio:fim], np.multiply.outer(populacao[inicio:fim], fracoes)
+
+def pesos_demanda(municipios, fracoes_idade, consumo_por_idade=None, coluna=COLUNA_POPULACAO, tamanho_bloco=1024):
+    """
+    Demand weight of every municipality: its population weighted by the relative
+    consumption of each age (1.0 for every age when not given).
+
+    Returns:
+        tuple: (Series of weights per municipality, Series of population per age).
+    """
+    if consumo_por_idade is None:
+        consumo = np.ones(len(fracoes_idade))
+    else:
+        consumo = pd.Series(consumo_por_idade).reindex(fracoes_idade.index, fill_value=1.0).to_numpy(dtype=np.float64)
+
+    nomes, pesos = [], []
+    por_idade = np.zeros(len(fracoes_idade))
+    for bloco_nomes, bloco in iterar_populacao_por_idade(municipios, fracoes_idade, coluna, tamanho_bloco):
+        nomes.append(bloco_nomes)
+        pesos.append(bloco @ consumo)
+        por_idade += bloco.sum(axis=0)
+
+    pesos = pd.Series(np.concatenate(pesos) if pesos else [], index=np.concatenate(nomes) if nomes else [], name='Peso')
+    return pesos, pd.Series(por_idade, index=fracoes_idade.index, name='Populacao')
+
+def pesos_demanda_cidadaos(populacao, consumo_por_idade=None):
+    """
+    Demand weights from generated citizens ('Municipio', 'Idade' and optionally 'Peso',
+    the people each sampled citizen stands for), so a downscaled population gives the
+    same regional demand as the full one.
+
+    Returns:
+        tuple: (Series of weights per municipality, Series of population per age).
+    """
+    peso = populacao['Peso'].to_numpy(dtype=np.float64) if 'Peso' in populacao.columns else np.ones(len(populacao))
+    if consumo_por_idade is None:
+        consumo = np.ones(len(populacao))
+    else:
+        consumo = populacao['Idade'].map(pd.Series(consumo_por_idade)).fillna(1.0).to_numpy(dtype=np.float64)
+    pesos = pd.Series(peso * consumo).groupby(populacao['Municipio'].to_numpy(), sort=False).sum().rename('Peso')
+    por_idade = pd.Series(peso).groupby(populacao['Idade'].to_numpy()).sum().rename('Populacao')
+    return pesos, por_idade
+
+def demanda_regional(grafo, pesos, incluir_direta=False, propagar=True):
+    """
+    Regional demand matrix (municipalities x products) from the demand weights.
+
+    Args:
+        grafo (GrafoProdutos): Compiled product graph.
+        pesos (Series): Demand weight (consumption-equivalent inhabitants) per municipality.
+        incluir_direta (bool): Splits the national direct 'Demanda' proportionally to the weights.
+        propagar (bool): Propagates the final demand to every input.
+    """
+    pesos_array = pesos.to_numpy(dtype=np.float64)
+    demanda = demanda_final(grafo, pesos_array, incluir_direta=False)
+    if incluir_direta and pesos_array.sum() > 0:
+        demanda += np.multiply.outer(pesos_array / pesos_array.sum(), grafo.demanda_direta)
+    if propagar:
+        demanda = propagar_demanda(grafo, demanda)
+    return pd.DataFrame(demanda, index=pesos.index, columns=grafo.produtos)
+
+def populacao_total(arquivo_municipios=ARQUIVO_MUNICIPIOS, arquivo_idades=ARQUIVO_IDADES, consumo_por_idade=None,
+                    coluna=COLUNA_POPULACAO):
+    """Total demand-weighted population (of the `coluna` scale), used instead of a hardcoded constant."""
+    pesos, _ = pesos_demanda(carregar_municipios(arquivo_municipios), carregar_fracoes_idade(arquivo_idades),
+                             consumo_por_idade, coluna)
+    return float(pesos.sum())
+
+if __name__ == "__main__":
+    grafo = compilar_grafo(carregar_tabelas('Data_Products.ods'))
+    pesos, por_idade = pesos_demanda(carregar_municipios(), carregar_fracoes_idade())
+    matriz = demanda_regional(grafo, pesos)
+    print(f"Demanda regional: {matriz.shape[0]} municípios x {matriz.shape[1]} produtos")
+    print(matriz.sum().sort_values(ascending=False).head(10))
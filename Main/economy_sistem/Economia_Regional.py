@@ -0,0 +1,209 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from Grafo_Produtos import carregar_tabelas, compilar_grafo, demanda_final, propagar_demanda
+from Demanda_Regional import COLUNA_POPULACAO, carregar_municipios
+from Simulador_Vetorizado import capacidade_produtos, produtividade_plena, simular_producao
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'military_sistem'))
+from Indice_Espacial import IndiceEspacial
+
+# ==========================================
+# Regional economy: one stock vector per municipality
+# ==========================================
+# Stocks are a (regions x products) matrix. Industries are placed in regions through a
+# (regions x industries) share matrix that splits their capacity and natural
+# availability. After production, a trade step moves part of every surplus along a
+# sparse distance-weighted network towards the regions in deficit:
+#   sent from a to b  ~  W[a, b] * (deficit of b and, damped, of the regions beyond it)
+# so a tick is a few sparse (R x R) @ (R x P) products.
+
+def participacao_industrias(grafo, pesos, participacao=None):
+    """
+    Share of every industry located in each region (columns sum to 1).
+
+    Args:
+        pesos (Series): Demand weight per region (default placement: proportional to it).
+        participacao (DataFrame): Optional explicit placement (regions x industry names);
+            industries missing from it keep the default placement.
+
+    Returns:
+        ndarray: (R, I) share matrix in grafo.industrias order.
+    """
+    base = pesos.to_numpy(dtype=np.float64)
+    base = base / base.sum() if base.sum() > 0 else np.full(len(base), 1.0 / max(len(base), 1))
+    matriz = np.repeat(base[:, None], len(grafo.industrias), axis=1)
+    if participacao is not None:
+        participacao = participacao.reindex(index=pesos.index).fillna(0.0)
+        for j, industria in enumerate(grafo.industrias):
+            if industria in participacao.columns:
+                coluna = participacao[industria].to_numpy(dtype=np.float64)
+                if coluna.sum() > 0:
+                    matriz[:, j] = coluna / coluna.sum()
+    return matriz
+
+def rede_comercio(lat, lon, k_vizinhos=8, escala_km=300.0, raio_max_km=None):
+    """
+    Sparse trade network between regions: each region is linked to its k nearest
+    neighbours with weight exp(-distance / escala_km).
+
+    Returns:
+        csr_matrix: (R x R) weights W[a, b] (a ships to b), symmetric, zero diagonal.
+    """
+    indice = IndiceEspacial(lat, lon)
+    n = len(indice)
+    k = min(k_vizinhos + 1, n)
+    if k < 2:
+        return sparse.csr_matrix((n, n))
+    distancias, vizinhos = indice.k_proximos(indice.lat, indice.lon, k=k, raio_max_km=raio_max_km)
+    origem = np.repeat(np.arange(n), k)
+    destino = vizinhos.ravel()
+    distancias = distancias.ravel()
+    validos = (destino < n) & (destino != origem)
+    pesos = np.exp(-distancias[validos] / escala_km)
+    W = sparse.csr_matrix((pesos, (origem[validos], destino[validos])), shape=(n, n))
+    return W.maximum(W.T).tocsr()
+
+def sinal_deficit(W, deficit, alcance=3, amortecimento=0.5):
+    """
+    Deficit seen from every region: its own deficit plus the damped deficit of the
+    regions up to `alcance` hops away, so goods also move through regions in balance.
+    """
+    soma = np.asarray(W.sum(axis=1)).ravel()
+    W_norm = sparse.diags(np.where(soma > 0, 1.0 / np.where(soma > 0, soma, 1.0), 0.0)) @ W
+    sinal = deficit
+    for _ in range(alcance):
+        sinal = deficit + amortecimento * (W_norm @ sinal)
+    return sinal
+
+def comercio(estoque, necessidade, W, fracao=0.5, alcance=3, amortecimento=0.5):
+    """
+    One trade step, updating `estoque` in place.
+
+    Every region ships `fracao` of its surplus (stock above its need) to its neighbours,
+    split by W[a, b] * sinal[b] (see sinal_deficit). A region never receives more than
+    its signal: the excess goes back to the senders, so the total stock is conserved.
+
+    Returns:
+        tuple: (received, sent), both (R x P).
+    """
+    excedente = np.maximum(estoque - necessidade, 0.0)
+    sinal = sinal_deficit(W, np.maximum(necessidade - estoque, 0.0), alcance, amortecimento)
+    denominador = W @ sinal
+    with np.errstate(divide='ignore', invalid='ignore'):
+        razao = np.where(denominador > 0, fracao * excedente / denominador, 0.0)
+    bruto = sinal * (W.T @ razao)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        aceite = np.where(bruto > sinal, sinal / bruto, 1.0)
+    recebido = bruto * aceite
+    enviado = razao * (W @ (sinal * aceite))
+    estoque += recebido - enviado
+    np.maximum(estoque, 0.0, out=estoque)
+    return recebido, enviado
+
+class EconomiaRegional:
+    """
+    Economy split into regions (one per municipality by default).
+
+    Args:
+        grafo (GrafoProdutos): Compiled product graph.
+        municipios (DataFrame): Regions with 'Nome', 'Latitude', 'Longitude' and the population column.
+        produtividade (array): (I,) national productivity per industry (grafo.industrias order);
+            defaults to the full productivity for the regional demand.
+        pesos (Series): Demand weight per region (default: the population column).
+        participacao (DataFrame): Explicit industry placement (see participacao_industrias).
+        coluna (str): Population column of `municipios`.
+        k_vizinhos, escala_km (int, float): Trade network (see rede_comercio).
+        fracao_comercio (float): Fraction of the surplus shipped per tick.
+        alcance (int): Hops over which a deficit attracts goods (see sinal_deficit).
+    """
+    def __init__(self, grafo, municipios, produtividade=None, pesos=None, participacao=None,
+                 coluna=COLUNA_POPULACAO, k_vizinhos=8, escala_km=300.0, fracao_comercio=0.5, alcance=3):
+        municipios = municipios.dropna(subset=['Latitude', 'Longitude']).reset_index(drop=True)
+        self.grafo = grafo
+        self.regioes = municipios['Nome'].tolist()
+        if pesos is None:
+            pesos = pd.Series(municipios[coluna].to_numpy(dtype=np.float64), index=self.regioes)
+        else:
+            pesos = pesos.reindex(self.regioes).fillna(0.0)
+        self.pesos = pesos
+
+        # Final demand (national direct demand split by weight) and accumulated demand
+        self.demanda_final = demanda_final(grafo, pesos.to_numpy(dtype=np.float64), incluir_direta=False)
+        if pesos.sum() > 0:
+            self.demanda_final += np.multiply.outer(pesos.to_numpy() / pesos.sum(), grafo.demanda_direta)
+        self.demanda_acumulada = propagar_demanda(grafo, self.demanda_final)
+
+        if produtividade is None:
+            produtividade = produtividade_plena(grafo, self.demanda_acumulada.sum(axis=0))
+        self.participacao = participacao_industrias(grafo, pesos, participacao)
+        self.capacidade = capacidade_produtos(grafo, self.participacao * np.asarray(produtividade, dtype=np.float64))
+
+        # Natural availability goes with the extractive industry that owns it
+        tem_industria = grafo.industria_de >= 0
+        parcela = np.zeros((len(self.regioes), len(grafo)))
+        parcela[:, tem_industria] = self.participacao[:, grafo.industria_de[tem_industria]]
+        parcela[:, ~tem_industria] = (self.pesos.to_numpy() / max(self.pesos.sum(), 1e-300))[:, None]
+        self.disponibilidade = parcela * grafo.disponibilidade
+
+        self.rede = rede_comercio(municipios['Latitude'].to_numpy(), municipios['Longitude'].to_numpy(), k_vizinhos, escala_km)
+        self.fracao_comercio = fracao_comercio
+        self.alcance = alcance
+        self.estoque = np.zeros((len(self.regioes), len(grafo)))
+        self.ticks = 0
+
+    def passo(self, consumir=True):
+        """
+        Runs one tick: production in every region, trade, then final consumption.
+
+        Returns:
+            dict: 'producao', 'recebido', 'enviado', 'consumo' and 'atendimento'
+                  (consumption / final demand), all (R x P).
+        """
+        resultado = simular_producao(
+            self.grafo, self.estoque, self.capacidade, self.demanda_acumulada, self.disponibilidade,
+        )
+        recebido, enviado = comercio(self.estoque, self.demanda_acumulada, self.rede, self.fracao_comercio, self.alcance)
+
+        consumo = np.zeros_like(self.estoque)
+        if consumir:
+            consumo = np.minimum(self.estoque, self.demanda_final)
+            self.estoque -= consumo
+        with np.errstate(divide='ignore', invalid='ignore'):
+            atendimento = np.where(self.demanda_final > 0, consumo / self.demanda_final, np.nan)
+
+        self.ticks += 1
+        return {
+            'producao': resultado['producao'],
+            'recebido': recebido,
+            'enviado': enviado,
+            'consumo': consumo,
+            'atendimento': atendimento,
+        }
+
+    def estoque_df(self):
+        """Current stock as a DataFrame (regions x products)."""
+        return pd.DataFrame(self.estoque, index=self.regioes, columns=self.grafo.produtos)
+
+    def resumo(self, resultado):
+        """National totals per product of a tick result."""
+        return pd.DataFrame({
+            'Producao': resultado['producao'].sum(axis=0),
+            'Comercio': resultado['recebido'].sum(axis=0),
+            'Consumo': resultado['consumo'].sum(axis=0),
+            'Demanda_Final': self.demanda_final.sum(axis=0),
+            'Estoque': self.estoque.sum(axis=0),
+        }, index=self.grafo.produtos)
+
+if __name__ == "__main__":
+    grafo = compilar_grafo(carregar_tabelas('Data_Products.ods'))
+    economia = EconomiaRegional(grafo, carregar_municipios())
+    for _ in range(3):
+        resultado = economia.passo()
+    resumo = economia.resumo(resultado)
+    print(f"Economia regional: {len(economia.regioes)} regiões x {len(grafo)} produtos, {economia.rede.nnz} rotas")
+    print(resumo[resumo['Demanda_Final'] > 0].sort_values('Demanda_Final', ascending=False).head(10))
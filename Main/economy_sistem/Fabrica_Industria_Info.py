@@ -1,5 +1,8 @@
 import pandas as pd
 
+from Demanda_Regional import populacao_total
+from Grafo_Produtos import calcular_demanda_vetorizada, compilar_grafo
+
 # Classes Básicas
 class Produto:
     def __init__(self, nome, dificuldade, disponibilidade, mao_de_obra):
@@ -56,45 +59,11 @@ class Estoque:
 def calcular_demanda(tabelas, populacao):
     """
     Calcula a demanda acumulada para cada produto, incluindo Água e Energia.
+    Usa o grafo compilado, então insumos da mesma etapa (ou de etapas posteriores)
+    e ciclos de receitas são contabilizados, independente da ordem das linhas.
     """
-    demanda_acumulada = {}
-    fator_populacao = populacao / 1000
-
-    # Incluir demanda popular e direta
-    for tabela in tabelas.values():
-        for _, linha in tabela.iterrows():
-            produto = linha['Produto']
-            demanda_popular = linha.get('Demanda_Popular', 0)
-            if pd.notna(demanda_popular):
-                demanda_acumulada[produto] = demanda_acumulada.get(produto, 0) + demanda_popular * fator_populacao
-
-    # Propagar demandas através das etapas
-    for etapa in reversed(list(tabelas.keys())):
-        tabela = tabelas[etapa]
-        for _, linha in tabela.iterrows():
-            produto = linha['Produto']
-            demanda_direta = linha.get('Demanda', 0)
-            if pd.notna(demanda_direta):
-                demanda_acumulada[produto] = demanda_acumulada.get(produto, 0) + demanda_direta
-
-            # Água e Energia (Insumo1 e Insumo2)
-            insumo1, qtd1 = linha.get('Insumo1'), linha.get('Qtd1', 0)
-            insumo2, qtd2 = linha.get('Insumo2'), linha.get('Qtd2', 0)
-            if pd.notna(insumo1):
-                demanda_acumulada[insumo1] = demanda_acumulada.get(insumo1, 0) + demanda_acumulada.get(produto, 0) * qtd1
-            if pd.notna(insumo2):
-                demanda_acumulada[insumo2] = demanda_acumulada.get(insumo2, 0) + demanda_acumulada.get(produto, 0) * qtd2
-
-            # Outras matérias-primas
-            materia_colunas = [col for col in tabela.columns if col.startswith("Materia")]
-            qtd_colunas = [f"Qtd{col[-1]}" for col in materia_colunas]
-            for materia_coluna, qtd_coluna in zip(materia_colunas, qtd_colunas):
-                materia = linha.get(materia_coluna, None)
-                qtd = linha.get(qtd_coluna, 0)
-                if pd.notna(materia):
-                    demanda_acumulada[materia] = demanda_acumulada.get(materia, 0) + demanda_acumulada.get(produto, 0) * qtd
-
-    return demanda_acumulada
+    grafo = compilar_grafo(tabelas)
+    return grafo.para_dict(calcular_demanda_vetorizada(grafo, populacao), apenas_positivos=False)
 
 def calcular_produtividade_minima(tabelas, demanda_acumulada):
     """
@@ -135,9 +104,13 @@ def calcular_produtividade_minima(tabelas, demanda_acumulada):
 
     return produtividade_minima
 
-def processar_industrias(tabelas, produtividade_minima):
+def processar_industrias(tabelas, produtividade_minima, taxa_pp=1):
     """
     Cria um DataFrame consolidado com informações das indústrias, incluindo Água e Energia.
+
+    Args:
+        taxa_pp (float or dict): Fração da produtividade plena usada como produtividade,
+            única ou por indústria ({industria: taxa}, ex.: Calibracao_Produtividade).
     """
     industrias_info = []
 
@@ -159,7 +132,7 @@ def processar_industrias(tabelas, produtividade_minima):
                 produtividade_minima['Industria'] == industria_nome
             ]['Produtividade_Minima'].max()
 
-            taxa_pp = 1                              #############Setando Produtividade como metade da PP
+            taxa = taxa_pp.get(industria_nome, 1) if isinstance(taxa_pp, dict) else taxa_pp
             
             max_prod = max_produtividade if not pd.isna(max_produtividade) else 0
             industrias_info.append({
@@ -170,7 +143,7 @@ def processar_industrias(tabelas, produtividade_minima):
                 "Insumos": list(insumos),
                 "Len_Insumos": len(insumos),
                 "Produtividade_Plena": max_prod,
-                "Produtividade" : max_prod * taxa_pp    ############Setando Produtividade como metade da produtividade plena
+                "Produtividade" : max_prod * taxa    ############Setando Produtividade como fração da produtividade plena
             })
 
     # Adicionar Água e Energia como indústrias separadas
@@ -190,11 +163,13 @@ def processar_industrias(tabelas, produtividade_minima):
 
     return pd.DataFrame(industrias_info)
 
-def main_integrado():
+def main_integrado(populacao=None):
     """
     Combina o cálculo de produtividade mínima e a análise das indústrias em um único fluxo.
+    A população vem dos municípios do gerador de cidadãos quando não é informada.
     """
-    populacao = 193000
+    if populacao is None:
+        populacao = populacao_total()
     tabelas = {
         'Extrativism': pd.read_excel('Data_Products.ods', sheet_name='Extrativism'),
         'Beneficiamento': pd.read_excel('Data_Products.ods', sheet_name='Beneficiamento'),
@@ -214,4 +189,5 @@ def main_integrado():
     print("Arquivo 'industrias_info.ods' salvo com sucesso!")
 
 # Executar o fluxo integrado
-main_integrado()
+if __name__ == "__main__":
+    main_integrado()
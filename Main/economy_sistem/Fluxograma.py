@@ -0,0 +1,253 @@
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from Grafo_Produtos import carregar_tabelas, compilar_grafo
+
+# ==========================================
+# Production flowchart: layered layout and batched rendering
+# ==========================================
+# One row per stage (ETAPAS order, "Sem Etapa" last), nodes centred in their row.
+# The layout is plain arrays computed once per compiled graph; drawing uses one
+# LineCollection for the edges and one scatter for the nodes, so thousands of
+# products cost the same handful of artists. With `arquivo` the figure is rendered
+# on the Agg canvas (PNG/SVG/PDF) without touching any GUI backend.
+# Subgraphs (the neighbourhood of a few products, or the bottlenecks of a run) are
+# cut with hop distances over the same visible edges, cached per graph.
+
+INSUMOS_BASICOS = ('Agua', 'Energia')  # Insumo1/Insumo2 of every recipe, hidden by default
+ESPACO_HORIZONTAL = 5
+ESPACO_VERTICAL = 3
+LIMITE_ROTULOS = 300
+LIMITE_ALCANCE_DENSO = 2000  # up to this many products all hop distances are cached
+
+def layout_camadas(codigos_etapa, espaco_horizontal=ESPACO_HORIZONTAL, espaco_vertical=ESPACO_VERTICAL):
+    """
+    Layered positions: one row per stage code (0 on top), nodes centred in their row
+    in the given order.
+
+    Args:
+        codigos_etapa (array): Stage code of every node.
+
+    Returns:
+        ndarray: (N, 2) x, y positions.
+    """
+    codigos = np.asarray(codigos_etapa, dtype=np.int64)
+    if not len(codigos):
+        return np.zeros((0, 2))
+    presentes, linha = np.unique(codigos, return_inverse=True)
+    contagem = np.bincount(linha)
+    ordem = np.argsort(linha, kind='stable')
+    inicio = np.concatenate([[0], np.cumsum(contagem)[:-1]])
+    coluna = np.empty(len(codigos), dtype=np.float64)
+    coluna[ordem] = np.arange(len(codigos)) - np.repeat(inicio, contagem)
+    deslocamento = (contagem.max() - contagem) / 2
+    x = (coluna + deslocamento[linha]) * espaco_horizontal
+    y = -linha * espaco_vertical
+    return np.column_stack([x, y])
+
+def layout_fluxograma(grafo, ocultar=INSUMOS_BASICOS):
+    """
+    Layout of the compiled product graph, cached on it.
+
+    Returns:
+        dict: 'nos' (visible product indices), 'posicoes' (P, 2; NaN for hidden products),
+              'arestas' (E, 2) of (input, product) indices between visible products.
+    """
+    def construir():
+        visiveis = np.ones(len(grafo), dtype=bool)
+        visiveis[[grafo.indice[p] for p in ocultar if p in grafo.indice]] = False
+        nos = np.flatnonzero(visiveis)
+        posicoes = np.full((len(grafo), 2), np.nan)
+        posicoes[nos] = layout_camadas(grafo.etapa[nos])
+        coo = grafo.A.tocoo()
+        validas = visiveis[coo.row] & visiveis[coo.col]
+        arestas = np.column_stack([coo.col[validas], coo.row[validas]])
+        return {'nos': nos, 'posicoes': posicoes, 'arestas': arestas}
+
+    return grafo.cache(('layout_fluxograma', tuple(ocultar)), construir)
+
+def desenhar(posicoes, arestas, nomes, destacados=None, titulo="Fluxo Produtivo",
+             arquivo=None, ax=None, rotulos=None, tamanho=(16, 10), dpi=100):
+    """
+    Draws nodes and edges with batched collections.
+
+    Args:
+        posicoes (ndarray): (N, 2) node positions.
+        arestas (ndarray): (E, 2) pairs of node indices (origin, destination).
+        nomes (list): Node labels.
+        destacados (array): Boolean mask of highlighted nodes (drawn in red).
+        arquivo (str): Saves the figure there (headless) instead of returning it for display.
+        ax (Axes): Draws into an existing axes.
+        rotulos (bool): Draws labels (default: only when there are at most LIMITE_ROTULOS nodes).
+
+    Returns:
+        Figure: The figure drawn on.
+    """
+    from matplotlib.collections import LineCollection
+
+    if ax is None:
+        if arquivo is not None:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            fig = Figure(figsize=tamanho, dpi=dpi)
+            FigureCanvasAgg(fig)
+        else:
+            import matplotlib.pyplot as plt
+            fig = plt.figure(figsize=tamanho, dpi=dpi)
+        ax = fig.add_subplot(111)
+    fig = ax.figure
+
+    posicoes = np.asarray(posicoes, dtype=np.float64)
+    arestas = np.asarray(arestas, dtype=np.int64).reshape(-1, 2)
+    if destacados is None:
+        destacados = np.zeros(len(posicoes), dtype=bool)
+    rotulos = len(posicoes) <= LIMITE_ROTULOS if rotulos is None else rotulos
+
+    # Node size from the widest row: the points available per node across the figure
+    _, por_linha = np.unique(posicoes[:, 1], return_counts=True) if len(posicoes) else (None, np.array([1]))
+    largura = fig.get_figwidth() * 72 * 0.9 / por_linha.max()
+    diametro = min(45.0, 0.8 * largura)
+    fonte = min(12.0, max(3.0, diametro / 3))
+
+    ax.add_collection(LineCollection(posicoes[arestas], colors='gray', linewidths=0.5, alpha=0.5, zorder=1))
+    cores = np.where(destacados, 'red', 'lightblue')
+    ax.scatter(posicoes[:, 0], posicoes[:, 1], s=diametro ** 2, c=cores, edgecolors='none', zorder=2)
+    if rotulos:
+        # Crowded rows get vertical labels
+        rotacao = 90 if largura < 60 else 0
+        for (x, y), nome in zip(posicoes, nomes):
+            ax.text(x, y, nome, fontsize=fonte, rotation=rotacao, ha='center', va='center', zorder=3)
+
+    ax.set_title(titulo, fontsize=16)
+    ax.margins(0.05)
+    ax.autoscale_view()
+    ax.set_axis_off()
+    if arquivo is not None:
+        fig.savefig(arquivo, bbox_inches='tight')
+    return fig
+
+def desenhar_fluxograma(grafo, destacados=(), titulo="Fluxo Produtivo", arquivo=None, ocultar=INSUMOS_BASICOS, **opcoes):
+    """
+    Renders the production flowchart of a compiled product graph.
+
+    Args:
+        grafo (GrafoProdutos): Compiled product graph.
+        destacados (iterable): Product names to highlight.
+        arquivo (str): Output image (PNG/SVG/...); rendered headless.
+        ocultar (tuple): Products left out of the picture (Agua/Energia feed every recipe).
+
+    Returns:
+        Figure: The figure drawn on.
+    """
+    layout = layout_fluxograma(grafo, ocultar)
+    nos = layout['nos']
+    local = np.full(len(grafo), -1, dtype=np.int64)
+    local[nos] = np.arange(len(nos))
+    marcados = np.zeros(len(grafo), dtype=bool)
+    marcados[[grafo.indice[p] for p in destacados if p in grafo.indice]] = True
+    return desenhar(
+        layout['posicoes'][nos], local[layout['arestas']], [grafo.produtos[i] for i in nos],
+        destacados=marcados[nos], titulo=titulo, arquivo=arquivo, **opcoes,
+    )
+
+def saltos(grafo, origens, sentido='acima', ocultar=INSUMOS_BASICOS):
+    """
+    Hop distance from each origin product to every product along the visible edges.
+
+    Args:
+        origens (array): Product indices.
+        sentido (str): 'acima' follows inputs (upstream), 'abaixo' follows consumers (downstream).
+
+    Returns:
+        ndarray: (len(origens), P) hop counts (inf = unreachable).
+    """
+    if sentido not in ('acima', 'abaixo'):
+        raise ValueError(f"Sentido inválido: {sentido} (use 'acima' ou 'abaixo')")
+
+    def adjacencia():
+        arestas = layout_fluxograma(grafo, ocultar)['arestas']
+        # arestas are (input, product); upstream walks product -> input
+        acima = sparse.csr_matrix(
+            (np.ones(len(arestas)), (arestas[:, 1], arestas[:, 0])), shape=(len(grafo), len(grafo)),
+        )
+        return {'acima': acima, 'abaixo': acima.T.tocsr()}
+
+    matriz = grafo.cache(('adjacencia_fluxograma', tuple(ocultar)), adjacencia)[sentido]
+    origens = np.atleast_1d(np.asarray(origens, dtype=np.int64))
+    if len(grafo) <= LIMITE_ALCANCE_DENSO:
+        todas = grafo.cache(
+            ('saltos_fluxograma', tuple(ocultar), sentido),
+            lambda: csgraph.shortest_path(matriz, unweighted=True),
+        )
+        return todas[origens]
+    return csgraph.shortest_path(matriz, unweighted=True, indices=origens)
+
+def extrair_subgrafo(grafo, produtos, acima=True, abaixo=True, profundidade=None, ocultar=INSUMOS_BASICOS):
+    """
+    Products within `profundidade` hops upstream and/or downstream of the given products
+    (names missing from the catalogue are ignored, as in desenhar_fluxograma).
+
+    Returns:
+        dict: 'nos' (product indices), 'sementes' (the given products' indices) and
+              'distancia' (hops from the nearest given product, aligned with 'nos').
+    """
+    sementes = grafo.indices([p for p in produtos if p in grafo.indice and p not in ocultar])
+    limite = np.inf if profundidade is None else profundidade
+    distancia = np.full(len(grafo), np.inf)
+    if len(sementes):
+        distancia[sementes] = 0
+        for sentido, ativo in (('acima', acima), ('abaixo', abaixo)):
+            if ativo:
+                distancia = np.minimum(distancia, saltos(grafo, sementes, sentido, ocultar).min(axis=0))
+    nos = np.flatnonzero(np.isfinite(distancia) & (distancia <= limite))
+    return {'nos': nos, 'sementes': sementes, 'distancia': distancia[nos]}
+
+def produtos_gargalo(produtos_nao_produzidos, incluir_insumos=True):
+    """
+    Product names from the `produtos_nao_produzidos` list of processar_etapa
+    ((produto, [(insumo, deficit), ...]) pairs): the products and their missing inputs.
+    """
+    nomes = []
+    for produto, insumos in produtos_nao_produzidos:
+        nomes.append(produto)
+        if incluir_insumos:
+            nomes.extend(insumo for insumo, _ in insumos)
+    return list(dict.fromkeys(nomes))
+
+def desenhar_subgrafo(grafo, produtos, acima=True, abaixo=True, profundidade=None, destacados=None,
+                      titulo="Fluxo Produtivo (recorte)", arquivo=None, ocultar=INSUMOS_BASICOS, **opcoes):
+    """
+    Renders only the neighbourhood of the given products, laid out in stage rows.
+    The given products are highlighted unless `destacados` is passed.
+
+    Returns:
+        Figure: The figure drawn on.
+    """
+    recorte = extrair_subgrafo(grafo, produtos, acima, abaixo, profundidade, ocultar)
+    nos = recorte['nos']
+    local = np.full(len(grafo), -1, dtype=np.int64)
+    local[nos] = np.arange(len(nos))
+    arestas = layout_fluxograma(grafo, ocultar)['arestas']
+    arestas = local[arestas[(local[arestas] >= 0).all(axis=1)]]
+    marcados = np.zeros(len(grafo), dtype=bool)
+    if destacados is None:
+        marcados[recorte['sementes']] = True
+    else:
+        marcados[[grafo.indice[p] for p in destacados if p in grafo.indice]] = True
+    return desenhar(
+        layout_camadas(grafo.etapa[nos]), arestas, [grafo.produtos[i] for i in nos],
+        destacados=marcados[nos], titulo=titulo, arquivo=arquivo, **opcoes,
+    )
+
+def desenhar_gargalos(grafo, produtos_nao_produzidos, profundidade=1, arquivo=None, **opcoes):
+    """Renders the products that were not produced, their missing inputs and what feeds them."""
+    return desenhar_subgrafo(
+        grafo, produtos_gargalo(produtos_nao_produzidos), acima=True, abaixo=False,
+        profundidade=profundidade, titulo="Gargalos de Produção", arquivo=arquivo, **opcoes,
+    )
+
+if __name__ == "__main__":
+    grafo = compilar_grafo(carregar_tabelas('Data_Products.ods'))
+    desenhar_fluxograma(grafo, arquivo='fluxograma.png')
+    print("Arquivo 'fluxograma.png' salvo com sucesso!")
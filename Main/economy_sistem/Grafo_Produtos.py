@@ -0,0 +1,291 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.sparse.linalg import splu
+
+# ==========================================
+# Compiled product graph (vectorized view of the Data_Products tables)
+# ==========================================
+# Every product (including inputs that no table produces) gets an index. The recipe
+# matrix A is sparse: A[p, i] = quantity of input i consumed per unit of product p,
+# covering Agua/Energia (Insumo*) and the other raw materials (Materia*).
+
+ETAPAS = ['Extrativism', 'Beneficiamento', 'Processamento', 'Envase', 'Bens', 'Pesada']
+SEM_ETAPA = "Sem Etapa"
+
+def carregar_tabelas(arquivo='Data_Products.ods', etapas=ETAPAS):
+    """Reads the product tables of every stage."""
+    return {etapa: pd.read_excel(arquivo, sheet_name=etapa) for etapa in etapas}
+
+def colunas_insumos(tabela):
+    """Pairs every Insumo*/Materia* column with the quantity column that follows it."""
+    colunas = list(tabela.columns)
+    pares = []
+    for posicao, coluna in enumerate(colunas):
+        if not (coluna.startswith("Insumo") or coluna.startswith("Materia")):
+            continue
+        seguinte = colunas[posicao + 1] if posicao + 1 < len(colunas) else None
+        coluna_qtd = seguinte if seguinte is not None and seguinte.startswith("Qtd") else f"Qtd{coluna[-1]}"
+        if coluna_qtd in tabela.columns:
+            pares.append((coluna, coluna_qtd))
+    return pares
+
+class GrafoProdutos:
+    """Arrays describing the products, their industries and the recipe matrix."""
+    def __init__(self, produtos, etapa, industrias, industria_de, A,
+                 demanda_popular, demanda_direta, mao_obra, dificuldade, disponibilidade):
+        self.produtos = produtos
+        self.indice = {produto: i for i, produto in enumerate(produtos)}
+        self.etapa = etapa                  # int array: position in ETAPAS (len(ETAPAS) = Sem Etapa)
+        self.industrias = industrias        # industry names
+        self.industria_de = industria_de    # int array: industry index of each product (-1 = none)
+        self.A = A                          # csr_matrix (P x P)
+        self.demanda_popular = demanda_popular
+        self.demanda_direta = demanda_direta
+        self.mao_obra = mao_obra
+        self.dificuldade = dificuldade
+        self.disponibilidade = disponibilidade
+        self.versao = 0                     # bumped on every recipe change
+        self._caches = {}
+
+    def __len__(self):
+        return len(self.produtos)
+
+    @property
+    def nomes_etapas(self):
+        return ETAPAS + [SEM_ETAPA]
+
+    def indices(self, produtos):
+        """Product names -> index array."""
+        return np.array([self.indice[p] for p in produtos], dtype=np.int64)
+
+    def vetor(self, valores, padrao=0.0):
+        """Dict {produto: valor} -> dense vector aligned with self.produtos."""
+        vetor = np.full(len(self), padrao, dtype=np.float64)
+        for produto, valor in valores.items():
+            if produto in self.indice:
+                vetor[self.indice[produto]] = valor
+        return vetor
+
+    def para_dict(self, vetor, apenas_positivos=True):
+        """Dense vector -> dict {produto: valor}."""
+        return {
+            produto: float(valor) for produto, valor in zip(self.produtos, vetor)
+            if not apenas_positivos or valor > 0
+        }
+
+    def cache(self, chave, construir):
+        """Returns a derived structure (layouts, indexes...) built once per compiled graph."""
+        if chave not in self._caches:
+            self._caches[chave] = construir()
+        return self._caches[chave]
+
+    def atualizar_receita(self, produto, insumos):
+        """
+        Replaces the recipe of a product and drops every derived structure.
+
+        Args:
+            produto (str): Product whose recipe changes.
+            insumos (dict): Input name -> quantity per unit (inputs must already be in the graph).
+        """
+        desconhecidos = [nome for nome in list(insumos) + [produto] if nome not in self.indice]
+        if desconhecidos:
+            raise ValueError(f"Produtos desconhecidos na receita: {desconhecidos}")
+        A = self.A.tolil()
+        p = self.indice[produto]
+        A.rows[p] = []
+        A.data[p] = []
+        for nome, quantidade in insumos.items():
+            A[p, self.indice[nome]] = float(quantidade)
+        self.A = A.tocsr()
+        self.versao += 1
+        self._caches.clear()
+
+def compilar_grafo(tabelas):
+    """
+    Compiles the stage tables into a GrafoProdutos.
+
+    Args:
+        tabelas (dict): Stage name -> DataFrame (as loaded by carregar_tabelas).
+
+    Returns:
+        GrafoProdutos: The compiled graph. A product defined in more than one row keeps its first row.
+    """
+    produtos = []
+    indice = {}
+
+    def indexar(produto):
+        if produto not in indice:
+            indice[produto] = len(produtos)
+            produtos.append(produto)
+        return indice[produto]
+
+    linhas = []
+    for etapa, tabela in tabelas.items():
+        pares = colunas_insumos(tabela)
+        for linha in tabela.to_dict('records'):
+            produto = linha['Produto']
+            if pd.isna(produto):
+                continue
+            p = indexar(produto)
+            insumos = [
+                (indexar(linha[col]), linha.get(col_qtd))
+                for col, col_qtd in pares
+                if pd.notna(linha.get(col))
+            ]
+            linhas.append((p, etapa, linha, insumos))
+
+    n = len(produtos)
+    etapa = np.full(n, len(ETAPAS), dtype=np.int8)
+    industria_de = np.full(n, -1, dtype=np.int64)
+    campos = {nome: np.zeros(n) for nome in ['demanda_popular', 'demanda_direta', 'mao_obra', 'dificuldade', 'disponibilidade']}
+    industrias = []
+    indice_industria = {}
+    definido = np.zeros(n, dtype=bool)
+    origem, destino, quantidade = [], [], []
+
+    def numero(valor):
+        return float(valor) if pd.notna(valor) else 0.0
+
+    for p, nome_etapa, linha, insumos in linhas:
+        if definido[p]:
+            continue
+        definido[p] = True
+        etapa[p] = ETAPAS.index(nome_etapa) if nome_etapa in ETAPAS else len(ETAPAS)
+        nome_industria = linha.get('Industria')
+        if pd.notna(nome_industria):
+            if nome_industria not in indice_industria:
+                indice_industria[nome_industria] = len(industrias)
+                industrias.append(nome_industria)
+            industria_de[p] = indice_industria[nome_industria]
+        campos['demanda_popular'][p] = numero(linha.get('Demanda_Popular'))
+        campos['demanda_direta'][p] = numero(linha.get('Demanda'))
+        campos['mao_obra'][p] = numero(linha.get('Mao_Obra'))
+        campos['dificuldade'][p] = numero(linha.get('Dificuldade'))
+        campos['disponibilidade'][p] = numero(linha.get('Disponibilidade'))
+        for i, qtd in insumos:
+            origem.append(p)
+            destino.append(i)
+            quantidade.append(numero(qtd))
+
+    A = sparse.csr_matrix((quantidade, (origem, destino)), shape=(n, n))
+    A.sum_duplicates()
+    return GrafoProdutos(produtos, etapa, industrias, industria_de, A, **campos)
+
+def demanda_final(grafo, populacao, incluir_direta=True):
+    """
+    Final (non-propagated) demand: Demanda_Popular per 1000 inhabitants plus the direct Demanda.
+
+    Args:
+        populacao (float or array): Population, or an array of populations (one row per region).
+        incluir_direta (bool): Adds the direct 'Demanda' column (to every row).
+
+    Returns:
+        ndarray: (P,) for a scalar population, (R, P) for an array.
+    """
+    populacao = np.asarray(populacao, dtype=np.float64)
+    demanda = np.multiply.outer(populacao / 1000, grafo.demanda_popular)
+    return demanda + grafo.demanda_direta if incluir_direta else demanda
+
+def componentes_demanda(grafo):
+    """
+    Strongly connected components of the recipe graph (product -> input), grouped in
+    levels so that every product comes after all products that consume it.
+    Cached on the compiled graph.
+
+    Returns:
+        dict: 'niveis' (list of product index arrays), 'ciclos' (list of (level,
+              products, LU factorization of (I - A_cc)^T)) and 'A_fora' (A without the
+              edges inside a component).
+    """
+    def construir():
+        A = grafo.A.tocsr()
+        n_comp, rotulo = csgraph.connected_components(A, directed=True, connection='strong')
+
+        # Condensed graph and longest-path level of every component (Kahn)
+        coo = A.tocoo()
+        externo = rotulo[coo.row] != rotulo[coo.col]
+        condensado = sparse.csr_matrix(
+            (np.ones(externo.sum()), (rotulo[coo.row[externo]], rotulo[coo.col[externo]])),
+            shape=(n_comp, n_comp),
+        )
+        condensado.sum_duplicates()
+        entrada = np.bincount(condensado.indices, minlength=n_comp)
+        nivel = np.zeros(n_comp, dtype=np.int64)
+        fila = list(np.flatnonzero(entrada == 0))
+        while fila:
+            c = fila.pop()
+            for d in condensado.indices[condensado.indptr[c]:condensado.indptr[c + 1]]:
+                nivel[d] = max(nivel[d], nivel[c] + 1)
+                entrada[d] -= 1
+                if entrada[d] == 0:
+                    fila.append(d)
+
+        nivel_produto = nivel[rotulo]
+        niveis = [np.flatnonzero(nivel_produto == k) for k in range(nivel.max(initial=-1) + 1)]
+
+        ciclos = []
+        tamanho = np.bincount(rotulo, minlength=n_comp)
+        laco = np.zeros(n_comp, dtype=bool)
+        laco[rotulo[coo.row[coo.row == coo.col]]] = True
+        for c in np.flatnonzero((tamanho > 1) | laco):
+            produtos = np.flatnonzero(rotulo == c)
+            A_cc = A[produtos][:, produtos]
+            try:
+                fator = splu((sparse.identity(len(produtos), format='csc') - A_cc).T.tocsc())
+            except RuntimeError:
+                # Exactly singular: the loop consumes as much as it produces (gain 1)
+                nomes = [grafo.produtos[i] for i in produtos]
+                raise ValueError(f"Ciclo de receitas sem solução (consome tanto quanto produz): {nomes}") from None
+            ciclos.append((nivel[c], produtos, A_cc, fator))
+
+        A_fora = sparse.csr_matrix((coo.data[externo], (coo.row[externo], coo.col[externo])), shape=A.shape)
+        return {'niveis': niveis, 'ciclos': ciclos, 'A_fora': A_fora}
+
+    return grafo.cache('componentes_demanda', construir)
+
+def resolver_ciclo(produtos, A_cc, fator, entrada, tolerancia=1e-9):
+    """
+    Total demand inside a recipe loop (`produtos`: names of its products, for the
+    error message): solves X_c = B_c + X_c A_cc for every row.
+    Raises ValueError when the loop consumes at least as much as it produces (no
+    finite non-negative solution).
+    """
+    solucao = fator.solve(np.ascontiguousarray(entrada.T)).T
+    residuo = solucao - entrada - (A_cc.T @ solucao.T).T
+    escala = max(float(np.abs(entrada).max(initial=0.0)), 1.0)
+    if (not np.all(np.isfinite(solucao)) or solucao.min(initial=0.0) < -tolerancia * escala
+            or np.abs(residuo).max(initial=0.0) > tolerancia * escala * len(produtos)):
+        raise ValueError(f"Ciclo de receitas sem solução não negativa (consome mais do que produz): {list(produtos)}")
+    return np.maximum(solucao, 0.0)
+
+def propagar_demanda(grafo, demanda):
+    """
+    Propagates final demand to every input, for one vector or a matrix of rows:
+    X = D + X A, the total requirement of every product.
+
+    Acyclic parts are solved by propagation in topological order (a level at a time);
+    recipe loops (strongly connected components) with a sparse linear solve. The
+    result does not depend on stages or on the row order of the sheet.
+    """
+    demanda = np.array(demanda, dtype=np.float64)
+    escalar = demanda.ndim == 1
+    X = np.atleast_2d(demanda)
+    estrutura = componentes_demanda(grafo)
+    A_fora = estrutura['A_fora']
+    ciclos_por_nivel = {}
+    for nivel, produtos, A_cc, fator in estrutura['ciclos']:
+        ciclos_por_nivel.setdefault(nivel, []).append((produtos, A_cc, fator))
+
+    for nivel, produtos in enumerate(estrutura['niveis']):
+        # Every consumer of this level is done: close the loops, then push to the inputs
+        for produtos_ciclo, A_cc, fator in ciclos_por_nivel.get(nivel, ()):
+            nomes = [grafo.produtos[i] for i in produtos_ciclo]
+            X[:, produtos_ciclo] = resolver_ciclo(nomes, A_cc, fator, X[:, produtos_ciclo])
+        X += (A_fora[produtos].T @ X[:, produtos].T).T
+    return X[0] if escalar else X
+
+def calcular_demanda_vetorizada(grafo, populacao):
+    """Accumulated demand of every product for a population (scalar or one per region)."""
+    return propagar_demanda(grafo, demanda_final(grafo, populacao))
@@ -0,0 +1,135 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from Grafo_Produtos import carregar_tabelas, compilar_grafo, propagar_demanda
+
+# ==========================================
+# Bill of materials: total requirements per unit of product
+# ==========================================
+# T = (I - A)^-1, so row p of T is everything (direct and indirect) one unit of p
+# consumes, including 1 unit of p itself. Small catalogues keep T dense and answer
+# by row lookup; large ones explode one product at a time and keep the most recent
+# explosions in an LRU cache. Both are dropped when a recipe changes (grafo.versao).
+
+LIMITE_DENSO = 4000
+
+class ListaMateriais:
+    """
+    Bill-of-materials queries over a compiled product graph.
+
+    Args:
+        grafo (GrafoProdutos): Compiled product graph.
+        limite_denso (int): Largest catalogue for which the full matrix T is precomputed.
+        tamanho_cache (int): Explosions kept by the LRU cache (sparse mode).
+    """
+    def __init__(self, grafo, limite_denso=LIMITE_DENSO, tamanho_cache=1024):
+        self.grafo = grafo
+        self.limite_denso = limite_denso
+        self.tamanho_cache = tamanho_cache
+        self._versao = None
+        self._total = None
+        self._explosoes = OrderedDict()
+        self._brutos = None
+
+    @property
+    def denso(self):
+        return len(self.grafo) <= self.limite_denso
+
+    def invalidar(self):
+        """Drops the precomputed matrix and every cached explosion."""
+        self._versao = None
+        self._total = None
+        self._explosoes.clear()
+        self._brutos = None
+
+    def _validar(self):
+        if self._versao != self.grafo.versao:
+            self.invalidar()
+            self._versao = self.grafo.versao
+
+    @property
+    def brutos(self):
+        """Boolean mask of raw products (no recipe)."""
+        self._validar()
+        if self._brutos is None:
+            self._brutos = np.diff(self.grafo.A.tocsr().indptr) == 0
+        return self._brutos
+
+    @property
+    def total(self):
+        """Dense total-requirements matrix T (P x P); only in dense mode."""
+        self._validar()
+        if self._total is None:
+            if not self.denso:
+                raise ValueError(f"Catálogo com {len(self.grafo)} produtos excede o limite denso ({self.limite_denso})")
+            self._total = propagar_demanda(self.grafo, np.identity(len(self.grafo)))
+            self._total.flags.writeable = False
+        return self._total
+
+    def _indice(self, produto):
+        return produto if isinstance(produto, (int, np.integer)) else self.grafo.indice[produto]
+
+    def requisitos(self, produto):
+        """Total requirement vector (P,) of one unit of a product (name or index). Read only."""
+        p = self._indice(produto)
+        if self.denso:
+            return self.total[p]
+        self._validar()
+        if p in self._explosoes:
+            self._explosoes.move_to_end(p)
+            return self._explosoes[p]
+        unitario = np.zeros(len(self.grafo))
+        unitario[p] = 1.0
+        vetor = propagar_demanda(self.grafo, unitario)
+        vetor.flags.writeable = False
+        self._explosoes[p] = vetor
+        if len(self._explosoes) > self.tamanho_cache:
+            self._explosoes.popitem(last=False)
+        return vetor
+
+    def explodir(self, produto, quantidade=1.0, apenas_brutos=False):
+        """
+        Everything needed to make `quantidade` units of a product.
+
+        Returns:
+            dict: {produto: quantidade} of the positive requirements (the product itself
+                  excluded; only raw products when apenas_brutos).
+        """
+        vetor = self.requisitos(produto) * quantidade
+        mascara = vetor > 0
+        mascara[self._indice(produto)] = False
+        if apenas_brutos:
+            mascara &= self.brutos
+        return {self.grafo.produtos[i]: float(vetor[i]) for i in np.flatnonzero(mascara)}
+
+    def explodir_lote(self, pedidos, apenas_brutos=False):
+        """
+        Total requirements of a batch of orders.
+
+        Args:
+            pedidos (dict): {produto: quantidade}.
+
+        Returns:
+            ndarray: (P,) total requirements (orders included), raw products only when apenas_brutos.
+        """
+        quantidades = self.grafo.vetor(pedidos)
+        if self.denso:
+            ativos = np.flatnonzero(quantidades)
+            vetor = quantidades[ativos] @ self.total[ativos]
+        else:
+            self._validar()
+            vetor = propagar_demanda(self.grafo, quantidades)
+        return np.where(self.brutos, vetor, 0.0) if apenas_brutos else vetor
+
+    def tabela(self, produtos, insumos=None):
+        """Requirements per unit of several products as a DataFrame (products x inputs)."""
+        linhas = np.array([self.requisitos(p) for p in produtos])
+        tabela = pd.DataFrame(linhas, index=list(produtos), columns=self.grafo.produtos)
+        return tabela[list(insumos)] if insumos is not None else tabela
+
+if __name__ == "__main__":
+    lista = ListaMateriais(compilar_grafo(carregar_tabelas('Data_Products.ods')))
+    print(lista.tabela(['Vidro', 'Latao'], ['Ferro-ore', 'Agua', 'Energia']))
+    print(lista.explodir('Latao', apenas_brutos=True))
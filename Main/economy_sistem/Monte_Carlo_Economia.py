@@ -0,0 +1,265 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from Grafo_Produtos import GrafoProdutos, carregar_tabelas, compilar_grafo, demanda_final, propagar_demanda
+from Simulador_Vetorizado import produtividade_plena, simular_producao
+
+# ==========================================
+# Monte Carlo runs of the economy
+# ==========================================
+# Every run draws multiplicative factors for the uncertain inputs of every product
+# and goes through one vectorized production tick; a batch of runs is one (R x P)
+# simulation. Workers attach the compiled arrays from shared memory (nothing large
+# is pickled per task), draw each run from its own seed (SeedSequence spawn key =
+# run number, so results do not depend on batching or worker count) and send back
+# only fixed-size histograms, merged as they arrive: memory does not grow with the
+# number of runs.
+
+# Field of GrafoProdutos -> (distribution, parameter) of the multiplicative factor
+DISTRIBUICOES = {
+    'dificuldade': ('lognormal', 0.10),
+    'mao_obra': ('normal', 0.10),
+    'disponibilidade': ('uniforme', 0.20),
+    'demanda_popular': ('lognormal', 0.15),
+}
+
+# Log-spaced bins shared by every product (plus one bin for zero)
+BORDAS_HISTOGRAMA = np.concatenate([[0.0], np.logspace(-6, 15, 2101)])
+
+_ARRAYS_GRAFO = ['etapa', 'industria_de', 'demanda_popular', 'demanda_direta', 'mao_obra', 'dificuldade', 'disponibilidade']
+_GRAFO = None
+_CONFIG = None
+_MEMORIAS = []
+
+def sortear_fatores(rng, distribuicao, parametro, tamanho):
+    """Multiplicative factors (mean ~1, never negative) for one input field."""
+    if distribuicao == 'lognormal':
+        return rng.lognormal(-parametro ** 2 / 2, parametro, tamanho)
+    if distribuicao == 'normal':
+        return np.maximum(rng.normal(1.0, parametro, tamanho), 0.0)
+    if distribuicao == 'uniforme':
+        return rng.uniform(1.0 - parametro, 1.0 + parametro, tamanho)
+    if distribuicao == 'fixa':
+        return np.ones(tamanho)
+    raise ValueError(f"Distribuição desconhecida: {distribuicao}")
+
+class HistogramaProdutos:
+    """Mergeable per-product histogram over fixed log-spaced bins, with exact moments."""
+    def __init__(self, n_produtos, bordas=BORDAS_HISTOGRAMA):
+        self.bordas = bordas
+        self.contagens = np.zeros((n_produtos, len(bordas)), dtype=np.int64)
+        self.n = 0
+        self.soma = np.zeros(n_produtos)
+        self.soma_quadrados = np.zeros(n_produtos)
+        self.minimo = np.full(n_produtos, np.inf)
+        self.maximo = np.full(n_produtos, -np.inf)
+
+    def adicionar(self, valores):
+        """Adds a (runs x products) block."""
+        valores = np.maximum(np.atleast_2d(valores), 0.0)
+        caixa = np.searchsorted(self.bordas, valores, side='right') - 1
+        caixa = np.where(valores <= 0, 0, np.clip(caixa, 1, len(self.bordas) - 1))
+        produtos = np.broadcast_to(np.arange(valores.shape[1]), valores.shape)
+        np.add.at(self.contagens, (produtos.ravel(), caixa.ravel()), 1)
+        self.n += len(valores)
+        self.soma += valores.sum(axis=0)
+        self.soma_quadrados += (valores ** 2).sum(axis=0)
+        self.minimo = np.minimum(self.minimo, valores.min(axis=0))
+        self.maximo = np.maximum(self.maximo, valores.max(axis=0))
+
+    def juntar(self, outro):
+        self.contagens += outro.contagens
+        self.n += outro.n
+        self.soma += outro.soma
+        self.soma_quadrados += outro.soma_quadrados
+        self.minimo = np.minimum(self.minimo, outro.minimo)
+        self.maximo = np.maximum(self.maximo, outro.maximo)
+        return self
+
+    def quantis(self, qs):
+        """(len(qs), P) quantiles, interpolated geometrically inside the bin and clipped to min/max."""
+        acumulado = np.cumsum(self.contagens, axis=1)
+        resultado = np.zeros((len(qs), len(self.contagens)))
+        for k, q in enumerate(qs):
+            alvo = q * self.n
+            caixa = np.minimum((acumulado < alvo).sum(axis=1), len(self.bordas) - 1)
+            antes = np.where(caixa > 0, acumulado[np.arange(len(caixa)), np.maximum(caixa - 1, 0)], 0)
+            dentro = self.contagens[np.arange(len(caixa)), caixa]
+            fracao = np.where(dentro > 0, (alvo - antes) / np.maximum(dentro, 1), 0.0)
+            inferior = self.bordas[caixa]
+            superior = self.bordas[np.minimum(caixa + 1, len(self.bordas) - 1)]
+            valor = np.where(caixa == 0, 0.0, inferior * (superior / np.where(inferior > 0, inferior, 1.0)) ** fracao)
+            resultado[k] = np.clip(valor, self.minimo, self.maximo)
+        return resultado
+
+    def media(self):
+        return self.soma / max(self.n, 1)
+
+    def desvio(self):
+        media = self.media()
+        return np.sqrt(np.maximum(self.soma_quadrados / max(self.n, 1) - media ** 2, 0.0))
+
+# ------------------------------------------
+# Shared memory for the compiled graph
+# ------------------------------------------
+def _compartilhar(arrays):
+    """Copies arrays into shared memory blocks; returns (blocks, {name: (block name, shape, dtype)})."""
+    blocos, descricao = [], {}
+    for nome, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        bloco = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=bloco.buf)[...] = array
+        blocos.append(bloco)
+        descricao[nome] = (bloco.name, array.shape, array.dtype.str)
+    return blocos, descricao
+
+def _anexar(descricao):
+    """Read-only numpy views over shared memory blocks (the blocks are kept alive in _MEMORIAS)."""
+    arrays = {}
+    for nome, (bloco_nome, forma, dtype) in descricao.items():
+        bloco = shared_memory.SharedMemory(name=bloco_nome)
+        _MEMORIAS.append(bloco)
+        array = np.ndarray(forma, dtype=np.dtype(dtype), buffer=bloco.buf)
+        array.flags.writeable = False
+        arrays[nome] = array
+    return arrays
+
+def _arrays_grafo(grafo):
+    A = grafo.A.tocsr()
+    arrays = {nome: getattr(grafo, nome) for nome in _ARRAYS_GRAFO}
+    arrays.update({'A_data': A.data, 'A_indices': A.indices, 'A_indptr': A.indptr})
+    return arrays
+
+def _montar_grafo(produtos, industrias, arrays):
+    n = len(produtos)
+    A = sparse.csr_matrix((arrays['A_data'], arrays['A_indices'], arrays['A_indptr']), shape=(n, n), copy=False)
+    return GrafoProdutos(produtos, industrias=industrias, A=A, **{nome: arrays[nome] for nome in _ARRAYS_GRAFO})
+
+def _iniciar_worker(produtos, industrias, descricao, config):
+    global _GRAFO, _CONFIG
+    _GRAFO = _montar_grafo(produtos, industrias, _anexar(descricao))
+    _CONFIG = config
+
+def _executar_lote_worker(inicio, fim):
+    return executar_lote(_GRAFO, inicio, fim, **_CONFIG)
+
+# ------------------------------------------
+# Runs
+# ------------------------------------------
+def executar_lote(grafo, inicio, fim, produtividade, populacao, distribuicoes, semente):
+    """
+    Runs [inicio, fim) as one vectorized tick.
+
+    Returns:
+        tuple: (stock histogram, shortage histogram) of the batch.
+    """
+    R, P = fim - inicio, len(grafo)
+    fatores = {campo: np.empty((R, P)) for campo in distribuicoes}
+    for linha, execucao in enumerate(range(inicio, fim)):
+        rng = np.random.default_rng(np.random.SeedSequence(semente, spawn_key=(execucao,)))
+        for campo, (distribuicao, parametro) in distribuicoes.items():
+            fatores[campo][linha] = sortear_fatores(rng, distribuicao, parametro, P)
+
+    def campo(nome):
+        base = getattr(grafo, nome)
+        return base * fatores[nome] if nome in fatores else np.broadcast_to(base, (R, P))
+
+    demanda_popular = campo('demanda_popular')
+    final = np.multiply.outer(np.full(R, populacao / 1000), np.ones(P)) * demanda_popular + grafo.demanda_direta
+    demanda = propagar_demanda(grafo, final)
+
+    mao_obra, dificuldade = campo('mao_obra'), campo('dificuldade')
+    tem_industria = grafo.industria_de >= 0
+    por_produto = np.zeros((R, P))
+    por_produto[:, tem_industria] = produtividade[grafo.industria_de[tem_industria]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        capacidade = np.where(dificuldade > 0, por_produto * mao_obra / dificuldade, 0.0)
+
+    estoque = np.zeros((R, P))
+    resultado = simular_producao(grafo, estoque, capacidade, demanda, np.array(campo('disponibilidade')))
+
+    extrativo = (np.diff(grafo.A.indptr) == 0) & (grafo.etapa == 0)
+    falta = np.where(extrativo, 0.0, np.maximum(demanda - resultado['producao'], 0.0))
+    hist_estoque, hist_falta = HistogramaProdutos(P), HistogramaProdutos(P)
+    hist_estoque.adicionar(estoque)
+    hist_falta.adicionar(falta)
+    return hist_estoque, hist_falta
+
+def simular_monte_carlo(grafo, n_execucoes, populacao, distribuicoes=None, taxa=1.0, lote=256,
+                        processos=None, semente=0, quantis=(0.05, 0.5, 0.95)):
+    """
+    Monte Carlo runs of one production tick under uncertain inputs.
+
+    Args:
+        n_execucoes (int): Number of runs.
+        populacao (float): Population used for the popular demand.
+        distribuicoes (dict): Field -> (distribution, parameter); default DISTRIBUICOES.
+        taxa (float): Installed fraction of the full productivity of the baseline.
+        lote (int): Runs per vectorized batch (task).
+        processos (int): Worker processes (None/1 = serial).
+        semente (int): Root seed; run i always uses SeedSequence(semente, spawn_key=(i,)).
+
+    Returns:
+        DataFrame: Per product, mean and quantiles of the final stock and of the shortage.
+    """
+    distribuicoes = DISTRIBUICOES if distribuicoes is None else distribuicoes
+    base = propagar_demanda(grafo, demanda_final(grafo, populacao))
+    config = {
+        'produtividade': produtividade_plena(grafo, base, taxa),
+        'populacao': float(populacao),
+        'distribuicoes': distribuicoes,
+        'semente': semente,
+    }
+    lotes = [(inicio, min(inicio + lote, n_execucoes)) for inicio in range(0, n_execucoes, lote)]
+    estoque, falta = HistogramaProdutos(len(grafo)), HistogramaProdutos(len(grafo))
+
+    if processos is None or processos <= 1:
+        for inicio, fim in lotes:
+            parcial_estoque, parcial_falta = executar_lote(grafo, inicio, fim, **config)
+            estoque.juntar(parcial_estoque)
+            falta.juntar(parcial_falta)
+    else:
+        blocos, descricao = _compartilhar(_arrays_grafo(grafo))
+        try:
+            with ProcessPoolExecutor(
+                max_workers=processos, initializer=_iniciar_worker,
+                initargs=(grafo.produtos, grafo.industrias, descricao, config),
+            ) as executor:
+                # At most two batches in flight per worker, merged as they complete
+                pendentes = set()
+                proximos = iter(lotes)
+                for inicio, fim in proximos:
+                    pendentes.add(executor.submit(_executar_lote_worker, inicio, fim))
+                    if len(pendentes) >= 2 * processos:
+                        feito = next(as_completed(pendentes))
+                        pendentes.remove(feito)
+                        parcial_estoque, parcial_falta = feito.result()
+                        estoque.juntar(parcial_estoque)
+                        falta.juntar(parcial_falta)
+                for feito in as_completed(pendentes):
+                    parcial_estoque, parcial_falta = feito.result()
+                    estoque.juntar(parcial_estoque)
+                    falta.juntar(parcial_falta)
+        finally:
+            for bloco in blocos:
+                bloco.close()
+                bloco.unlink()
+
+    colunas = {'Estoque_Media': estoque.media(), 'Falta_Media': falta.media(), 'Falta_Desvio': falta.desvio()}
+    for q, valores in zip(quantis, estoque.quantis(quantis)):
+        colunas[f'Estoque_Q{int(round(q * 100)):02d}'] = valores
+    for q, valores in zip(quantis, falta.quantis(quantis)):
+        colunas[f'Falta_Q{int(round(q * 100)):02d}'] = valores
+    return pd.DataFrame(colunas, index=pd.Index(grafo.produtos, name='Produto'))
+
+if __name__ == "__main__":
+    from Demanda_Regional import populacao_total
+
+    grafo = compilar_grafo(carregar_tabelas('Data_Products.ods'))
+    resumo = simular_monte_carlo(grafo, 2000, populacao_total(), taxa=0.95, processos=os.cpu_count())
+    print(resumo.sort_values('Falta_Media', ascending=False).head(15))
@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+
+from Grafo_Produtos import carregar_tabelas, compilar_grafo, calcular_demanda_vetorizada, demanda_final
+from Simulador_Vetorizado import capacidade_produtos, produtividade_plena, simular_producao
+
+# ==========================================
+# Shortage report and capacity sensitivities
+# ==========================================
+# Everything comes out of one vectorized production tick (simular_producao with
+# registrar_limites): unmet demand, the binding constraint of every product and how
+# much of a product's shortfall reappears as shortfall of the products that consume
+# it. Sensitivities rerun the tick once with one row per candidate (capacity of that
+# product raised), so the whole ranking is a single batched simulation.
+
+LIMITES = {-1: 'Capacidade', -2: 'Demanda', -3: 'Disponibilidade'}
+
+def tabela_nao_produzidos(produtos_nao_produzidos):
+    """
+    The (produto, [(insumo, deficit), ...]) list of processar_etapa as a DataFrame.
+    A product reported without inputs keeps one row (Insumo=None, Deficit=0).
+    """
+    linhas = [
+        {'Produto': produto, 'Insumo': insumo, 'Deficit': deficit}
+        for produto, insumos in produtos_nao_produzidos
+        for insumo, deficit in (insumos or [(None, 0)])
+    ]
+    return pd.DataFrame(linhas, columns=['Produto', 'Insumo', 'Deficit'])
+
+def relatorio_escassez(grafo, resultado, demanda, linha=0):
+    """
+    Per-product shortage report of one row of a production tick.
+
+    Args:
+        resultado (dict): Output of simular_producao(..., registrar_limites=True).
+        demanda (array): (P,) or (R, P) accumulated demand used in the tick.
+        linha (int): Row (region/scenario) to report.
+
+    Returns:
+        DataFrame: Demanda, Producao, Nao_Atendida, Atendimento, Limite (binding
+            constraint or input), Falta_Propria (shortfall not caused by an input),
+            Repassado (downstream output lost with this product as binding input) and
+            Parcela_Repassada (share of the shortfall that reappears downstream).
+    """
+    if 'limite' not in resultado:
+        raise ValueError("O resultado precisa de registrar_limites=True")
+    demanda = np.atleast_2d(np.asarray(demanda, dtype=np.float64))
+    demanda = demanda[linha] if len(demanda) > 1 else demanda[0]
+    producao = resultado['producao'][linha]
+    limite = resultado['limite'][linha]
+
+    extrativo = (np.diff(grafo.A.tocsr().indptr) == 0) & (grafo.etapa == 0)
+    nao_atendida = np.where(extrativo, 0.0, np.maximum(demanda - producao, 0.0))
+    por_insumo = limite >= 0
+
+    # Shortfall of a consumer q bound by input p, converted back into units of p
+    coo = grafo.A.tocoo()
+    presos = por_insumo[coo.row] & (limite[coo.row] == coo.col)
+    repassado_unidades = np.bincount(coo.col[presos], weights=coo.data[presos] * nao_atendida[coo.row[presos]], minlength=len(grafo))
+    repassado = np.bincount(limite[por_insumo], weights=nao_atendida[por_insumo], minlength=len(grafo))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        atendimento = np.where(demanda > 0, np.minimum(producao / demanda, 1.0), np.nan)
+        parcela = np.where(nao_atendida > 0, np.minimum(repassado_unidades / nao_atendida, 1.0), 0.0)
+
+    nomes_limite = np.array([
+        LIMITES.get(codigo, grafo.produtos[codigo] if codigo >= 0 else '') for codigo in limite
+    ], dtype=object)
+    return pd.DataFrame({
+        'Etapa': np.array(grafo.nomes_etapas, dtype=object)[grafo.etapa],
+        'Demanda': demanda,
+        'Producao': producao,
+        'Nao_Atendida': nao_atendida,
+        'Atendimento': atendimento,
+        'Limite': nomes_limite,
+        'Falta_Propria': np.where(por_insumo, 0.0, nao_atendida),
+        'Repassado': repassado,
+        'Parcela_Repassada': parcela,
+    }, index=pd.Index(grafo.produtos, name='Produto'))
+
+def valor_final(producao, demanda_final_produtos, pesos=None):
+    """Final demand met by a production matrix: sum of min(production, final demand), optionally weighted."""
+    atendida = np.minimum(producao, demanda_final_produtos)
+    return atendida @ pesos if pesos is not None else atendida.sum(axis=-1)
+
+def sensibilidades(grafo, estoque, capacidade, demanda, demanda_final_produtos, disponibilidade=None,
+                   candidatos=None, incremento=0.1, pesos=None):
+    """
+    Ranks capacity increases by the final output they unlock, with one batched tick.
+
+    Args:
+        estoque (array): (P,) stock at the start of the tick (not modified).
+        capacidade, demanda (array): (P,) capacity and accumulated demand of the tick.
+        demanda_final_produtos (array): (P,) final demand used to value the output.
+        disponibilidade (array): (P,) remaining natural availability.
+        candidatos (array): Product indices to test (default: every product bound by its
+            own capacity with unmet demand).
+        incremento (float): Relative capacity increase tested.
+        pesos (array): Optional (P,) value of a unit of each product (prices).
+
+    Returns:
+        DataFrame: Produto, Industria, Aumento, Ganho and Ganho_por_Unidade, best first.
+    """
+    estoque = np.asarray(estoque, dtype=np.float64)
+    capacidade = np.asarray(capacidade, dtype=np.float64)
+    disponibilidade = grafo.disponibilidade if disponibilidade is None else np.asarray(disponibilidade, dtype=np.float64)
+
+    if candidatos is None:
+        base = simular_producao(grafo, estoque[None].copy(), capacidade, demanda, disponibilidade[None].copy(), registrar_limites=True)
+        nao_atendida = np.asarray(demanda) - base['producao'][0]
+        candidatos = np.flatnonzero((base['limite'][0] == -1) & (nao_atendida > 1e-9) & (capacidade > 0))
+    candidatos = np.asarray(candidatos, dtype=np.int64)
+
+    # Row 0 is the baseline, row k + 1 raises the capacity of candidate k
+    R = len(candidatos) + 1
+    capacidades = np.repeat(capacidade[None], R, axis=0)
+    aumento = capacidade[candidatos] * incremento
+    capacidades[np.arange(1, R), candidatos] += aumento
+    resultado = simular_producao(
+        grafo, np.repeat(estoque[None], R, axis=0), capacidades, demanda, np.repeat(disponibilidade[None], R, axis=0),
+    )
+    valores = valor_final(resultado['producao'], demanda_final_produtos, pesos)
+    ganho = valores[1:] - valores[0]
+
+    industrias = np.array(grafo.industrias + [''], dtype=object)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        por_unidade = np.where(aumento > 0, ganho / aumento, 0.0)
+    ranking = pd.DataFrame({
+        'Produto': [grafo.produtos[i] for i in candidatos],
+        'Industria': industrias[grafo.industria_de[candidatos]],
+        'Aumento': aumento,
+        'Ganho': ganho,
+        'Ganho_por_Unidade': por_unidade,
+    })
+    return ranking.sort_values('Ganho', ascending=False, kind='stable').reset_index(drop=True)
+
+def analisar_tick(grafo, estoque, capacidade, demanda, demanda_final_produtos, disponibilidade=None, incremento=0.1, pesos=None):
+    """
+    Runs one tick from `estoque` (not modified) and returns (report, sensitivity ranking).
+    """
+    estoque = np.asarray(estoque, dtype=np.float64)
+    disponibilidade = grafo.disponibilidade if disponibilidade is None else np.asarray(disponibilidade, dtype=np.float64)
+    resultado = simular_producao(grafo, estoque[None].copy(), capacidade, demanda, disponibilidade[None].copy(), registrar_limites=True)
+    relatorio = relatorio_escassez(grafo, resultado, demanda)
+    candidatos = np.flatnonzero((resultado['limite'][0] == -1) & (relatorio['Nao_Atendida'].to_numpy() > 1e-9) & (np.asarray(capacidade) > 0))
+    ranking = sensibilidades(
+        grafo, estoque, capacidade, demanda, demanda_final_produtos, disponibilidade,
+        candidatos=candidatos, incremento=incremento, pesos=pesos,
+    )
+    return relatorio, ranking
+
+if __name__ == "__main__":
+    from Demanda_Regional import populacao_total
+
+    grafo = compilar_grafo(carregar_tabelas('Data_Products.ods'))
+    populacao = populacao_total()
+    demanda = calcular_demanda_vetorizada(grafo, populacao)
+    capacidade = capacidade_produtos(grafo, produtividade_plena(grafo, demanda, taxa=0.5))
+    relatorio, ranking = analisar_tick(grafo, np.zeros(len(grafo)), capacidade, demanda, demanda_final(grafo, populacao))
+    print(relatorio[relatorio['Nao_Atendida'] > 0].sort_values('Nao_Atendida', ascending=False).head(15))
+    print(ranking.head(10))
@@ -0,0 +1,169 @@
+import numpy as np
+
+from Grafo_Produtos import ETAPAS
+
+# ==========================================
+# Vectorized production tick
+# ==========================================
+# Same rules as Industria.produzir / processar_etapa, applied to a matrix of rows at
+# once (R rows = regions, scenarios or candidate parameter sets):
+#   - extractive products (no inputs): min(capacity, remaining availability);
+#   - every other product: min(capacity, demand, stock of each input / quantity).
+# Products are processed in blocks with no dependency inside a block. When several
+# products of a block share an input, their production is scaled down so the stock
+# never goes negative.
+
+def capacidade_produtos(grafo, produtividade):
+    """
+    Production capacity of each product: Produtividade(industry) * Mao_Obra / Dificuldade.
+
+    Args:
+        produtividade (array): (I,) or (R, I) productivity per industry (grafo.industrias order).
+
+    Returns:
+        ndarray: (P,) or (R, P) capacity (zero for products without an industry).
+    """
+    produtividade = np.asarray(produtividade, dtype=np.float64)
+    tem_industria = grafo.industria_de >= 0
+    por_produto = np.zeros(produtividade.shape[:-1] + (len(grafo),))
+    por_produto[..., tem_industria] = produtividade[..., grafo.industria_de[tem_industria]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fator = np.where(grafo.dificuldade > 0, grafo.mao_obra / grafo.dificuldade, 0.0)
+    return por_produto * fator
+
+def produtividade_plena(grafo, demanda_acumulada, taxa=1.0):
+    """
+    Productivity each industry needs to meet the accumulated demand of all its products
+    (max of Demanda * Dificuldade / Mao_Obra, as in calcular_produtividade_minima).
+
+    Args:
+        demanda_acumulada (array): (P,) or (R, P) accumulated demand.
+        taxa (float): Fraction of the full productivity actually installed.
+
+    Returns:
+        ndarray: (I,) or (R, I) productivity per industry (grafo.industrias order).
+    """
+    demanda_acumulada = np.asarray(demanda_acumulada, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        necessaria = np.where(grafo.mao_obra > 0, demanda_acumulada * grafo.dificuldade / grafo.mao_obra, 0.0)
+    tem_industria = grafo.industria_de >= 0
+    produtividade = np.zeros(demanda_acumulada.shape[:-1] + (len(grafo.industrias),))
+    np.maximum.at(
+        np.moveaxis(produtividade, -1, 0), grafo.industria_de[tem_industria],
+        np.moveaxis(necessaria[..., tem_industria], -1, 0),
+    )
+    return produtividade * taxa
+
+def blocos_producao(grafo):
+    """
+    Product blocks in processing order: stage by stage and, inside a stage, by the
+    depth of the intra-stage input chain. Cached on the compiled graph.
+    """
+    def construir():
+        A = grafo.A.tocsr()
+        blocos = []
+        for codigo in range(len(ETAPAS)):
+            produtos = np.flatnonzero(grafo.etapa == codigo)
+            if not len(produtos):
+                continue
+            na_etapa = np.zeros(len(grafo), dtype=bool)
+            na_etapa[produtos] = True
+            profundidade = np.zeros(len(grafo), dtype=np.int64)
+            # Longest intra-stage chain; bounded so feedback loops cannot spin forever
+            for _ in range(len(produtos)):
+                anterior = profundidade.copy()
+                for p in produtos:
+                    insumos = A.indices[A.indptr[p]:A.indptr[p + 1]]
+                    insumos = insumos[na_etapa[insumos] & (insumos != p)]
+                    if len(insumos):
+                        profundidade[p] = anterior[insumos].max() + 1
+                if np.array_equal(anterior, profundidade):
+                    break
+            for nivel in np.unique(profundidade[produtos]):
+                blocos.append(produtos[profundidade[produtos] == nivel])
+        return blocos
+
+    return grafo.cache('blocos_producao', construir)
+
+def _minimo_por_linha(valores, indptr, vazio=np.inf):
+    """Minimum over each CSR row segment of `valores` (R x nnz) -> (R x n_rows)."""
+    n_linhas = len(indptr) - 1
+    resultado = np.full((valores.shape[0], n_linhas), vazio)
+    preenchidas = np.flatnonzero(np.diff(indptr) > 0)
+    if len(preenchidas):
+        resultado[:, preenchidas] = np.minimum.reduceat(valores, indptr[preenchidas], axis=1)
+    return resultado
+
+def simular_producao(grafo, estoque, capacidade, demanda, disponibilidade=None, registrar_limites=False):
+    """
+    Runs one production tick for every row.
+
+    Args:
+        estoque (ndarray): (R, P) stock, updated in place.
+        capacidade (ndarray): (P,) or (R, P) capacity (see capacidade_produtos).
+        demanda (ndarray): (P,) or (R, P) accumulated demand (cap for non-extractive products).
+        disponibilidade (ndarray): (R, P) remaining natural availability, updated in place.
+        registrar_limites (bool): Also returns which constraint bound each product.
+
+    Returns:
+        dict: 'producao' (R, P) and, optionally, 'limite' (R, P): -1 = capacity,
+              -2 = demand, -3 = availability, otherwise the index of the binding input.
+    """
+    R, P = estoque.shape
+    capacidade = np.broadcast_to(capacidade, (R, P))
+    demanda = np.broadcast_to(demanda, (R, P))
+    if disponibilidade is None:
+        disponibilidade = np.broadcast_to(grafo.disponibilidade, (R, P)).copy()
+
+    A = grafo.A.tocsr()
+    producao = np.zeros((R, P))
+    limite = np.full((R, P), -1, dtype=np.int64) if registrar_limites else None
+
+    for bloco in blocos_producao(grafo):
+        A_bloco = A[bloco]
+        indptr, insumos, qtds = A_bloco.indptr, A_bloco.indices, A_bloco.data
+        sem_insumos = np.diff(indptr) == 0
+        extrativo = sem_insumos & (grafo.etapa[bloco] == 0)
+
+        cap = capacidade[:, bloco]
+        dem = demanda[:, bloco]
+
+        # Limit imposed by each input of each product (R x nnz), then the minimum per product
+        with np.errstate(divide='ignore', invalid='ignore'):
+            por_insumo = np.where(qtds > 0, estoque[:, insumos] / qtds, np.inf)
+        lim_insumos = _minimo_por_linha(por_insumo, indptr)
+
+        alvo = np.where(extrativo, disponibilidade[:, bloco], dem)
+        quantidade = np.maximum(np.minimum(np.minimum(cap, alvo), lim_insumos), 0.0)
+
+        # Products of the block sharing an input: scale down to the available stock
+        consumo = (A_bloco.T @ quantidade.T).T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fator_insumo = np.where(consumo > estoque, estoque / consumo, 1.0)
+        fator = np.minimum(_minimo_por_linha(fator_insumo[:, insumos], indptr, vazio=1.0), 1.0)
+        quantidade *= fator
+        consumo = (A_bloco.T @ quantidade.T).T
+
+        estoque -= consumo
+        np.maximum(estoque, 0.0, out=estoque)
+        estoque[:, bloco] += quantidade
+        disponibilidade[:, bloco[extrativo]] -= quantidade[:, extrativo]
+        producao[:, bloco] = quantidade
+
+        if registrar_limites:
+            motivo = np.where(cap <= np.minimum(alvo, lim_insumos), -1, np.where(extrativo, -3, -2))
+            if len(insumos):
+                # Binding input: the one whose limit equals the product's input limit
+                preso = lim_insumos < np.minimum(cap, alvo)
+                posicao = np.repeat(np.arange(len(bloco)), np.diff(indptr))
+                empate = por_insumo <= lim_insumos[:, posicao]
+                primeiro = np.full((R, len(bloco)), -1, dtype=np.int64)
+                linhas, nz = np.nonzero(empate)
+                primeiro[linhas[::-1], posicao[nz[::-1]]] = insumos[nz[::-1]]
+                motivo = np.where(preso & (primeiro >= 0), primeiro, motivo)
+            limite[:, bloco] = motivo
+
+    resultado = {'producao': producao, 'disponibilidade': disponibilidade}
+    if registrar_limites:
+        resultado['limite'] = limite
+    return resultado
@@ -1,5 +1,17 @@
+import os
+import sys
+
 import pandas as pd
 
+from Demanda_Regional import ARQUIVO_IDADES, ARQUIVO_MUNICIPIOS, populacao_total
+from Calibracao_Produtividade import calibrar_tabelas
+from Grafo_Produtos import carregar_tabelas, calcular_demanda_vetorizada, compilar_grafo
+from Relatorio_Escassez import tabela_nao_produzidos
+
+# The stage cache lives next to the subsystem folders
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Cache_Etapas import Arquivo, em_cache
+
 # Classes Básicas
 class Produto:
     def __init__(self, nome, dificuldade, disponibilidade, mao_de_obra):
@@ -176,45 +188,11 @@ def processar_etapa(industria, estoque, tabela, etapa, demanda_acumulada):
 def calcular_demanda(tabelas, populacao):
     """
     Calcula a demanda acumulada para cada produto, incluindo Água e Energia.
+    Usa o grafo compilado, então insumos da mesma etapa (ou de etapas posteriores)
+    e ciclos de receitas são contabilizados, independente da ordem das linhas.
     """
-    demanda_acumulada = {}
-    fator_populacao = populacao / 1000
-
-    # Incluir demanda popular e direta
-    for tabela in tabelas.values():
-        for _, linha in tabela.iterrows():
-            produto = linha['Produto']
-            demanda_popular = linha.get('Demanda_Popular', 0)
-            if pd.notna(demanda_popular):
-                demanda_acumulada[produto] = demanda_acumulada.get(produto, 0) + demanda_popular * fator_populacao
-
-    # Propagar demandas através das etapas
-    for etapa in reversed(list(tabelas.keys())):
-        tabela = tabelas[etapa]
-        for _, linha in tabela.iterrows():
-            produto = linha['Produto']
-            demanda_direta = linha.get('Demanda', 0)
-            if pd.notna(demanda_direta):
-                demanda_acumulada[produto] = demanda_acumulada.get(produto, 0) + demanda_direta
-
-            # Água e Energia (Insumo1 e Insumo2)
-            insumo1, qtd1 = linha.get('Insumo1'), linha.get('Qtd1', 0)
-            insumo2, qtd2 = linha.get('Insumo2'), linha.get('Qtd2', 0)
-            if pd.notna(insumo1):
-                demanda_acumulada[insumo1] = demanda_acumulada.get(insumo1, 0) + demanda_acumulada.get(produto, 0) * qtd1
-            if pd.notna(insumo2):
-                demanda_acumulada[insumo2] = demanda_acumulada.get(insumo2, 0) + demanda_acumulada.get(produto, 0) * qtd2
-
-            # Outras matérias-primas
-            materia_colunas = [col for col in tabela.columns if col.startswith("Materia")]
-            qtd_colunas = [f"Qtd{col[-1]}" for col in materia_colunas]
-            for materia_coluna, qtd_coluna in zip(materia_colunas, qtd_colunas):
-                materia = linha.get(materia_coluna, None)
-                qtd = linha.get(qtd_coluna, 0)
-                if pd.notna(materia):
-                    demanda_acumulada[materia] = demanda_acumulada.get(materia, 0) + demanda_acumulada.get(produto, 0) * qtd
-
-    return demanda_acumulada
+    grafo = compilar_grafo(tabelas)
+    return grafo.para_dict(calcular_demanda_vetorizada(grafo, populacao), apenas_positivos=False)
 
 def calcular_produtividade_minima(tabelas, demanda_acumulada):
     """
@@ -255,9 +233,13 @@ def calcular_produtividade_minima(tabelas, demanda_acumulada):
 
     return produtividade_minima
 
-def processar_industrias(tabelas, produtividade_minima):
+def processar_industrias(tabelas, produtividade_minima, taxa_pp=0.5):
     """
     Cria um DataFrame consolidado com informações das indústrias, incluindo Água e Energia.
+
+    Args:
+        taxa_pp (float or dict): Fração da produtividade plena usada como produtividade,
+            única ou por indústria ({industria: taxa}, ex.: Calibracao_Produtividade).
     """
     industrias_info = []
 
@@ -279,7 +261,7 @@ def processar_industrias(tabelas, produtividade_minima):
                 produtividade_minima['Industria'] == industria_nome
             ]['Produtividade_Minima'].max()
 
-            taxa_pp = 0.5                              #############Setando Produtividade como metade da PP
+            taxa = taxa_pp.get(industria_nome, 0.5) if isinstance(taxa_pp, dict) else taxa_pp
             
             max_prod = max_produtividade if not pd.isna(max_produtividade) else 0
             industrias_info.append({
@@ -290,7 +272,7 @@ def processar_industrias(tabelas, produtividade_minima):
                 "Insumos": list(insumos),
                 "Len_Insumos": len(insumos),
                 "Produtividade_Plena": max_prod,
-                "Produtividade" : max_prod * taxa_pp    ############Setando Produtividade como metade da produtividade plena
+                "Produtividade" : max_prod * taxa    ############Setando Produtividade como fração da produtividade plena
             })
 
     # Adicionar Água e Energia como indústrias separadas
@@ -311,24 +293,32 @@ def processar_industrias(tabelas, produtividade_minima):
     return pd.DataFrame(industrias_info)
 
 # Função Main
-def main():
-    populacao = 193000
+def main(populacao=None, cache=None, taxa_pp=0.5, calibrar=False, alvo=0.95):
+    """
+    Args:
+        taxa_pp (float or dict): Fração da produtividade plena de cada indústria (ver processar_industrias).
+        calibrar (bool): Calcula taxa_pp com Calibracao_Produtividade (a menor taxa que atinge `alvo`).
+        alvo (float or dict): Satisfação desejada na calibração.
+    """
+    # A população vem dos municípios do gerador de cidadãos quando não é informada
+    if populacao is None:
+        populacao = em_cache(
+            cache, populacao_total, Arquivo(ARQUIVO_MUNICIPIOS), Arquivo(ARQUIVO_IDADES),
+        )
     
-    tabelas = {
-        'Extrativism': pd.read_excel('Data_Products.ods', sheet_name='Extrativism'),
-        'Beneficiamento': pd.read_excel('Data_Products.ods', sheet_name='Beneficiamento'),
-        'Processamento': pd.read_excel('Data_Products.ods', sheet_name='Processamento'),
-        'Envase': pd.read_excel('Data_Products.ods', sheet_name='Envase'),
-        'Bens': pd.read_excel('Data_Products.ods', sheet_name='Bens'),
-        'Pesada': pd.read_excel('Data_Products.ods', sheet_name='Pesada'),
-    }
+    tabelas = em_cache(cache, carregar_tabelas, Arquivo('Data_Products.ods'))
 
     #Definindo produtividade#################
+    # Com um CacheEtapas, as etapas cujas entradas não mudaram são lidas do disco
 
-    demanda_acumulada = calcular_demanda(tabelas, populacao)
-    produtividade_minima = calcular_produtividade_minima(tabelas, demanda_acumulada)
+    demanda_acumulada = em_cache(
+        cache, calcular_demanda, tabelas, populacao,
+    )
+    produtividade_minima = em_cache(cache, calcular_produtividade_minima, tabelas, demanda_acumulada)
     
-    industrias_info = processar_industrias(tabelas, produtividade_minima)
+    if calibrar:
+        taxa_pp = em_cache(cache, calibrar_tabelas, tabelas, populacao, alvo)
+    industrias_info = em_cache(cache, processar_industrias, tabelas, produtividade_minima, taxa_pp)
 
     # Salvar o resultado
     industrias_info.to_excel('industrias_info.ods', index=False)
@@ -357,11 +347,12 @@ def main():
     # Exibir produtos não produzidos
     if produtos_nao_produzidos_geral:
         print("\n--- Produtos Não Produzidos ---")
-        for produto, insumos in produtos_nao_produzidos_geral:
-            print(f"Produto: {produto}")
-            for insumo, deficit in insumos:
-                print(f" - Insumo faltante: {insumo}, Quantidade insuficiente: {deficit}")
+        print(tabela_nao_produzidos(produtos_nao_produzidos_geral).to_string(index=False))
+
+    # Gargalos podem ser desenhados com Fluxograma.desenhar_gargalos
+    return estoque, produtos_nao_produzidos_geral
 
 # Executar
-main()
+if __name__ == "__main__":
+    main()
 
@@ -0,0 +1,8 @@
+# ==========================================
+# Default input files of the military subsystem
+# ==========================================
+# Kept apart from Main (which loads pandas) so light readers such as
+# Snapshot_Hierarquia can use them without importing it.
+
+ARQUIVO_UNIDADES = 'Main/military_sistem/Data_Military_Units.ods'
+ARQUIVO_CIDADES = 'Main/citizen_generator/Filtered_Pop_Municipio.ods'
@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# Conscription: fill regiments with citizens of their home municipality
+# ==========================================
+# Everything is a bulk sort-merge over integer codes: eligible citizens are sorted by
+# (municipality, random key) and ranked inside their municipality; regiments are
+# sorted by municipality with the cumulative strength they need; a single
+# searchsorted maps every citizen rank to the regiment whose slot range contains it.
+
+NIVEIS = ["Força", "Exército", "Divisão", "Brigada", "Regimento"]
+
+def achatar_hierarquia(forcas):
+    """Flattens the tree (breadth first) into a unit list and the parent index of each unit."""
+    unidades = list(forcas.values())
+    superior = [-1] * len(unidades)
+    i = 0
+    while i < len(unidades):
+        unidades.extend(unidades[i].subordinados)
+        superior.extend([i] * len(unidades[i].subordinados))
+        i += 1
+    return unidades, np.array(superior, dtype=np.int64)
+
+def ancestrais_por_nivel(unidades, superior, indices):
+    """For the given units, returns {level: index of the ancestor at that level (-1 if none)}."""
+    nivel = np.array([NIVEIS.index(u.nivel) for u in unidades], dtype=np.int8)
+    ancestrais = {nome: np.full(len(indices), -1, dtype=np.int64) for nome in NIVEIS}
+    atual = np.asarray(indices, dtype=np.int64)
+    while True:
+        validos = atual >= 0
+        if not validos.any():
+            return ancestrais
+        for codigo, nome in enumerate(NIVEIS):
+            mascara = validos.copy()
+            mascara[validos] = nivel[atual[validos]] == codigo
+            ancestrais[nome][mascara] = atual[mascara]
+        atual = np.where(validos, superior[np.maximum(atual, 0)], -1)
+
+def recrutar(forcas, populacao, idade_min=18, idade_max=45, semente=None, rng=None):
+    """
+    Assigns eligible citizens to the regiments of their home municipality.
+
+    Args:
+        forcas (dict): Tree from processar_hierarquia, with `efetivo` (Contagem_Unidades)
+            and `cidade` on every unit.
+        populacao (DataFrame): Citizens with 'Municipio' and 'Idade' (optionally 'Nome'
+            and 'Peso', the number of people a sampled citizen represents).
+        idade_min, idade_max (int): Eligible age band (inclusive).
+        semente (int) / rng (numpy.random.Generator): Source of the random draft order.
+
+    Returns:
+        dict: 'alocacao' (citizen index -> unit index), 'preenchimento' (strength per
+              regiment), 'comandantes' (commander of every unit) and 'unidades'
+              (the flattened unit list the indices refer to).
+    """
+    rng = rng if rng is not None else np.random.default_rng(semente)
+    unidades, superior = achatar_hierarquia(forcas)
+
+    regimentos = np.array([i for i, u in enumerate(unidades) if u.nivel == "Regimento"], dtype=np.int64)
+    cidades_reg = pd.Series([unidades[i].cidade for i in regimentos], dtype=object)
+    demanda = np.array([unidades[i].efetivo for i in regimentos], dtype=np.int64)
+
+    # Shared municipality codes for citizens and regiments
+    idades = populacao['Idade'].to_numpy()
+    elegiveis = np.flatnonzero((idades >= idade_min) & (idades <= idade_max))
+    categorias = pd.Index(pd.unique(pd.concat([cidades_reg.dropna(), populacao['Municipio'].iloc[elegiveis]])))
+    muni_cid = categorias.get_indexer(populacao['Municipio'].iloc[elegiveis])
+    muni_reg = categorias.get_indexer(cidades_reg)
+
+    # Citizens: sort by (municipality, random draft order), cumulative weight inside the municipality
+    ordem = np.lexsort((rng.random(len(elegiveis)), muni_cid))
+    cidadaos = elegiveis[ordem]
+    muni_cid = muni_cid[ordem]
+    if 'Peso' in populacao.columns:
+        peso = populacao['Peso'].to_numpy(dtype=np.float64)[cidadaos]
+    else:
+        peso = np.ones(len(cidadaos))
+    acumulado = np.cumsum(peso)
+    inicio_muni = np.searchsorted(muni_cid, muni_cid, side='left')
+    base = np.where(inicio_muni > 0, acumulado[inicio_muni - 1], 0.0)
+    posicao = acumulado - peso - base  # strength already drafted in the municipality before this citizen
+
+    # Regiments: sort by municipality, cumulative strength needed inside the municipality
+    ordem_reg = np.lexsort((np.arange(len(regimentos)), muni_reg))
+    ordem_reg = ordem_reg[muni_reg[ordem_reg] >= 0]
+    reg_ordenados = regimentos[ordem_reg]
+    muni_reg_ord = muni_reg[ordem_reg]
+    fim_reg = np.cumsum(demanda[ordem_reg]).astype(np.float64)
+    inicio_bloco = np.searchsorted(muni_reg_ord, muni_reg_ord, side='left')
+    fim_reg -= np.where(inicio_bloco > 0, fim_reg[inicio_bloco - 1], 0.0)
+
+    # Sort-merge on (municipality, position): offset each municipality by more than any position
+    escala = max(float(fim_reg.max(initial=0.0)), float(posicao.max(initial=0.0))) + 1.0
+    chave_reg = muni_reg_ord * escala + fim_reg
+    chave_cid = muni_cid * escala + posicao
+    destino = np.searchsorted(chave_reg, chave_cid, side='right')
+    alocado = destino < len(chave_reg)
+    alocado[alocado] = muni_reg_ord[destino[alocado]] == muni_cid[alocado]
+
+    alocacao = pd.DataFrame({
+        'Cidadao': populacao.index.values[cidadaos[alocado]],
+        'Unidade': reg_ordenados[destino[alocado]],
+        'Municipio': categorias.values[muni_cid[alocado]],
+        'Idade': idades[cidadaos[alocado]],
+        'Peso': peso[alocado],
+    })
+    if 'Nome' in populacao.columns:
+        alocacao['Nome'] = populacao['Nome'].to_numpy()[cidadaos[alocado]]
+
+    # Strength report per regiment
+    alocados = alocacao.groupby('Unidade')['Peso'].sum().reindex(regimentos, fill_value=0.0).to_numpy()
+    preenchimento = pd.DataFrame({
+        'Unidade': regimentos,
+        'Regimento': [unidades[i].nome for i in regimentos],
+        'Municipio': cidades_reg.values,
+        'Efetivo': demanda,
+        'Alocados': alocados,
+        'Deficit': np.maximum(demanda - alocados, 0.0),
+    })
+
+    comandantes = escolher_comandantes(unidades, superior, alocacao)
+    return {
+        'alocacao': alocacao,
+        'preenchimento': preenchimento,
+        'comandantes': comandantes,
+        'unidades': unidades,
+    }
+
+def escolher_comandantes(unidades, superior, alocacao):
+    """
+    Picks the commander of every unit: the oldest citizen drafted into its subtree
+    who does not already command a higher unit (levels are resolved top-down).
+    """
+    if alocacao.empty:
+        return pd.DataFrame(columns=['Unidade', 'Nivel', 'Nome_Unidade', 'Cidadao', 'Idade'])
+
+    ordem = alocacao.sort_values('Idade', ascending=False, kind='stable')
+    ancestrais = ancestrais_por_nivel(unidades, superior, ordem['Unidade'].to_numpy())
+    cidadaos = ordem['Cidadao'].to_numpy()
+    idades = ordem['Idade'].to_numpy()
+    usados = np.zeros(len(ordem), dtype=bool)
+
+    partes = []
+    for nivel in NIVEIS:
+        unidade = ancestrais[nivel]
+        candidatos = np.flatnonzero(~usados & (unidade >= 0))
+        # First (oldest) unused candidate of every unit of this level
+        _, primeiros = np.unique(unidade[candidatos], return_index=True)
+        escolhidos = candidatos[primeiros]
+        usados[escolhidos] = True
+        partes.append(pd.DataFrame({
+            'Unidade': unidade[escolhidos],
+            'Nivel': nivel,
+            'Nome_Unidade': [unidades[i].nome for i in unidade[escolhidos]],
+            'Cidadao': cidadaos[escolhidos],
+            'Idade': idades[escolhidos],
+        }))
+
+    comandantes = pd.concat(partes, ignore_index=True)
+    if 'Nome' in alocacao.columns:
+        nomes = alocacao.set_index('Cidadao')['Nome']
+        comandantes['Nome'] = nomes.reindex(comandantes['Cidadao']).to_numpy()
+    return comandantes
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# Vectorized strength (manpower) counting engine
+# ==========================================
+# Columns whose product gives the number of soldiers of one regiment of a given type
+MULTIPLICADORES = [
+    "Qtd_Base",
+    "Multiplicador_Segunda",
+    "Multiplicador_Terceira",
+    "Multiplicador_Quarta",
+    "Multiplicador_Quinta",
+]
+
+# Hierarchy level name (as used by the Unidade classes) -> column in the 'Ativas' sheet
+NIVEIS_HIERARQUIA = [
+    ("Força", "Force"),
+    ("Exército", "Exercito"),
+    ("Divisão", "Divizao"),
+    ("Brigada", "Brigada"),
+]
+
+def calcular_total_nivel_quinto(df_unidades):
+    """Returns the total of units at the fifth level for every regiment type (column product)."""
+    return df_unidades[MULTIPLICADORES].prod(axis=1, skipna=False)
+
+def efetivo_por_tipo(df_unidades):
+    """Returns a Series mapping regiment type ('Tipo') to its manpower."""
+    if "Regimento_Total_Unidades_Quinto" in df_unidades.columns:
+        totais = df_unidades["Regimento_Total_Unidades_Quinto"]
+    else:
+        totais = calcular_total_nivel_quinto(df_unidades)
+    totais = pd.Series(totais.values, index=df_unidades["Tipo"].values, name="Efetivo")
+    # Same rule as a dict built from the sheet: the last row of a repeated type wins
+    return totais[~totais.index.duplicated(keep="last")]
+
+def derreter_regimentos(df):
+    """Melts the Regimento_* columns into a Series of regiment types indexed by the original row."""
+    colunas = [col for col in df.columns if col.startswith("Regimento_")]
+    return df[colunas].melt(ignore_index=False, value_name="Tipo")["Tipo"].dropna()
+
+def efetivo_por_linha(df, df_unidades):
+    """Sums the manpower of the Regimento_* columns of every row (unknown types count as zero)."""
+    longo = derreter_regimentos(df).to_frame().join(efetivo_por_tipo(df_unidades), on="Tipo")
+    # The join leaves NaN for unknown types, so the sum is float: back to whole soldiers
+    return longo["Efetivo"].fillna(0).groupby(level=0).sum().reindex(df.index, fill_value=0).astype(np.int64)
+
+def contar_efetivos(df_ativas, df_unidades):
+    """
+    Aggregates the manpower bottom-up through the hierarchy.
+
+    Args:
+        df_ativas (DataFrame): Active units, one row per brigade with Regimento_* columns.
+        df_unidades (DataFrame): Regiment types with Qtd_Base and Multiplicador_* columns.
+
+    Returns:
+        dict: Level name -> Series of manpower indexed by the hierarchy path
+              (e.g. totais["Divisão"][(forca, exercito, divisao)]).
+    """
+    niveis = [(nivel, col) for nivel, col in NIVEIS_HIERARQUIA if col in df_ativas.columns]
+    colunas = [col for _, col in niveis]
+
+    efetivo = efetivo_por_linha(df_ativas, df_unidades)
+    base = efetivo.groupby([df_ativas[col] for col in colunas], sort=False).sum()
+
+    totais = {}
+    for profundidade in range(len(niveis), 0, -1):
+        nivel = niveis[profundidade - 1][0]
+        if profundidade == len(niveis):
+            totais[nivel] = base
+        else:
+            totais[nivel] = base.groupby(level=list(range(profundidade)), sort=False).sum()
+    return totais
+
+def aplicar_efetivos(forcas, df_ativas, df_unidades):
+    """Stores the manpower of every unit of the processar_hierarquia tree in `unidade.efetivo`."""
+    totais = contar_efetivos(df_ativas, df_unidades)
+    por_tipo = efetivo_por_tipo(df_unidades)
+
+    def visitar(unidade, caminho):
+        caminho = caminho + (unidade.nome,)
+        if unidade.nivel == "Regimento":
+            unidade.efetivo = int(por_tipo.get(unidade.nome, 0))
+        elif unidade.nivel in totais:
+            chave = caminho if len(caminho) > 1 else caminho[0]
+            unidade.efetivo = int(totais[unidade.nivel].get(chave, 0))
+        for subordinado in unidade.subordinados:
+            visitar(subordinado, caminho)
+
+    for forca in forcas.values():
+        visitar(forca, ())
+    return totais
@@ -0,0 +1,228 @@
+import os
+
+from KML_Tiles import chave_tile, escrever_documento_raiz, escrever_tiles, nome_arquivo_tile, tarefa_tile
+from Main import DIVISOR_RAIO, LOD_NIVEIS, gerar_coordenadas_subarvore, ponto_unidade
+
+# ==========================================
+# Mutable hierarchy with incremental layout, roll-ups and KML tiles
+# ==========================================
+ORDEM_NIVEIS = ["Força", "Exército", "Divisão", "Brigada", "Regimento"]
+
+def iterar_subarvore(unidade):
+    """Yields a unit and all of its subordinates (depth first)."""
+    pilha = [unidade]
+    while pilha:
+        atual = pilha.pop()
+        yield atual
+        pilha.extend(reversed(atual.subordinados))
+
+def caminho_superior(unidade):
+    """Returns the names of the superior units, from the force down to the direct superior."""
+    nomes = []
+    superior = unidade.superior
+    while superior is not None:
+        nomes.append(superior.nome)
+        superior = superior.superior
+    return nomes[::-1]
+
+class HierarquiaMilitar:
+    """
+    Mutable view over the tree built by processar_hierarquia.
+
+    Every operation only re-lays out the affected subtree, updates the manpower of
+    the ancestors by the delta and marks the KML tiles it touched, so a turn costs
+    O(changed units) instead of a full rebuild.
+    """
+    def __init__(self, forcas, niveis=None, lod_niveis=None, raio_inicial=0.01, efetivo_por_tipo=None):
+        self.forcas = forcas
+        self.niveis = niveis or ORDEM_NIVEIS[1:]
+        self.lod_niveis = lod_niveis or LOD_NIVEIS
+        self.raio_inicial = raio_inicial
+        self.efetivo_por_tipo = dict(efetivo_por_tipo) if efetivo_por_tipo is not None else {}
+
+        self._tiles = {}     # (nivel, chave) -> {id(unidade): unidade}
+        self._tile_de = {}   # id(unidade) -> (nivel, chave)
+        self._sujos = set()  # tiles to rewrite on the next export
+        self._raiz_suja = True
+
+        for forca in forcas.values():
+            for unidade in iterar_subarvore(forca):
+                self._indexar(unidade)
+
+    # ------------------------------------------
+    # Queries
+    # ------------------------------------------
+    def buscar(self, *nomes):
+        """Finds a unit by its path of names (or id_unico), starting at the force."""
+        unidade = self.forcas.get(nomes[0])
+        for nome in nomes[1:]:
+            if unidade is None:
+                return None
+            unidade = next((s for s in unidade.subordinados if s.nome == nome or s.id_unico == nome), None)
+        return unidade
+
+    # ------------------------------------------
+    # Operations
+    # ------------------------------------------
+    def adicionar(self, superior, unidade):
+        """Raises a new unit (with its optional subtree) under `superior`."""
+        self._validar_nivel(superior, unidade)
+        self._somar_efetivos(unidade)
+        self._anexar(superior, unidade)
+        return unidade
+
+    def remover(self, unidade):
+        """Disbands a unit and its whole subtree."""
+        for membro in iterar_subarvore(unidade):
+            self._desindexar(membro)
+
+        superior = unidade.superior
+        if superior is None:
+            self.forcas.pop(unidade.nome, None)
+            return unidade
+
+        superior.remover_subordinado(unidade)
+        self._propagar_efetivo(superior, -unidade.efetivo)
+        self._relayout(superior)
+        return unidade
+
+    def mover(self, unidade, novo_superior):
+        """Transfers a unit (and its subtree) to another superior of the level above."""
+        self._validar_nivel(novo_superior, unidade)
+        antigo = unidade.superior
+        antigo.remover_subordinado(unidade)
+        self._propagar_efetivo(antigo, -unidade.efetivo)
+        self._relayout(antigo)
+        unidade.posicao_fixa = False  # Joins the circle of its new superior
+        self._anexar(novo_superior, unidade)
+        return unidade
+
+    def rebasear(self, unidade, lat, lon, cidade=None):
+        """
+        Moves a unit to new coordinates (garrison `cidade`) and re-lays out only its subtree.
+        The position is fixed: later changes to its siblings do not pull it back to the
+        superior's circle. Subordinates that shared the old garrison follow it.
+        """
+        antiga = unidade.cidade
+        for membro in iterar_subarvore(unidade):
+            if membro is unidade or membro.cidade == antiga:
+                membro.cidade = cidade
+        unidade.lat, unidade.lon = lat, lon
+        unidade.posicao_fixa = True
+        self._relayout(unidade)
+        return unidade
+
+    # ------------------------------------------
+    # KML export
+    # ------------------------------------------
+    def exportar_alteracoes(self, output_dir, processos=None):
+        """
+        Rewrites only the tiles touched since the last export, removes the tiles that
+        became empty and rewrites the root document when tiles appeared or vanished.
+
+        Returns:
+            int: Number of tile files rewritten.
+        """
+        os.makedirs(os.path.join(output_dir, "tiles"), exist_ok=True)
+
+        tarefas = []
+        for nivel, chave in self._sujos:
+            membros = self._tiles.get((nivel, chave))
+            if not membros:
+                caminho = os.path.join(output_dir, nome_arquivo_tile(nivel, chave))
+                if os.path.exists(caminho):
+                    os.remove(caminho)
+                continue
+            pontos = [ponto_unidade(u, caminho_superior(u)) for u in membros.values()]
+            tarefas.append(tarefa_tile(output_dir, nivel, chave, self.lod_niveis[nivel], pontos))
+        escrever_tiles(tarefas, processos)
+
+        if self._raiz_suja:
+            camadas = {nivel: self.lod_niveis[nivel] for nivel in self.niveis}
+            indice = {nivel: set() for nivel in self.niveis}
+            for nivel, chave in self._tiles:
+                indice[nivel].add(chave)
+            escrever_documento_raiz(output_dir, camadas, indice)
+
+        self._sujos.clear()
+        self._raiz_suja = False
+        return len(tarefas)
+
+    def exportar_completo(self, output_dir, processos=None):
+        """Writes every tile and the root document."""
+        self._sujos.update(self._tiles)
+        self._raiz_suja = True
+        return self.exportar_alteracoes(output_dir, processos=processos)
+
+    # ------------------------------------------
+    # Internal helpers
+    # ------------------------------------------
+    def _validar_nivel(self, superior, unidade):
+        nivel_superior = ORDEM_NIVEIS.index(superior.nivel)
+        if ORDEM_NIVEIS.index(unidade.nivel) != nivel_superior + 1:
+            raise ValueError(
+                f"Uma unidade de nível '{unidade.nivel}' não pode subordinar-se a '{superior.nivel}'."
+            )
+
+    def _anexar(self, superior, unidade):
+        unidade.id_unico = max((s.id_unico for s in superior.subordinados), default=0) + 1
+        superior.adicionar_subordinado(unidade)
+        self._propagar_efetivo(superior, unidade.efetivo)
+        if unidade.lat is None or unidade.lon is None:
+            unidade.lat, unidade.lon = superior.lat, superior.lon
+        # Siblings are arranged in a circle, so the whole superior subtree moves; forces do not lay out armies
+        self._relayout(superior if superior.nivel in DIVISOR_RAIO else unidade)
+
+    def _relayout(self, unidade):
+        gerar_coordenadas_subarvore(unidade, self.raio_inicial)
+        for membro in iterar_subarvore(unidade):
+            self._indexar(membro)
+
+    def _somar_efetivos(self, unidade):
+        """Computes the manpower of a new subtree bottom-up (regiments come from their type)."""
+        for membro in reversed(list(iterar_subarvore(unidade))):
+            if membro.subordinados:
+                membro.efetivo = sum(sub.efetivo for sub in membro.subordinados)
+            elif membro.nivel == "Regimento" and not membro.efetivo:
+                membro.efetivo = int(self.efetivo_por_tipo.get(membro.nome, 0))
+
+    def _propagar_efetivo(self, unidade, delta):
+        # The superior's description (subordinates, manpower) changes even when delta is zero
+        while unidade is not None:
+            unidade.efetivo += delta
+            self._marcar(unidade)
+            unidade = unidade.superior
+
+    def _chave(self, unidade):
+        if unidade.nivel not in self.niveis or unidade.lat is None or unidade.lon is None:
+            return None
+        return unidade.nivel, chave_tile(unidade.lat, unidade.lon, self.lod_niveis[unidade.nivel]['tamanho_tile'])
+
+    def _marcar(self, unidade):
+        chave = self._tile_de.get(id(unidade))
+        if chave is not None:
+            self._sujos.add(chave)
+
+    def _indexar(self, unidade):
+        nova = self._chave(unidade)
+        antiga = self._tile_de.get(id(unidade))
+        if antiga is not None and antiga != nova:
+            self._desindexar(unidade)
+        if nova is not None:
+            if nova not in self._tiles:
+                self._tiles[nova] = {}
+                self._raiz_suja = True
+            self._tiles[nova][id(unidade)] = unidade
+            self._tile_de[id(unidade)] = nova
+            self._sujos.add(nova)
+
+    def _desindexar(self, unidade):
+        antiga = self._tile_de.pop(id(unidade), None)
+        if antiga is None:
+            return
+        membros = self._tiles[antiga]
+        membros.pop(id(unidade), None)
+        if not membros:
+            del self._tiles[antiga]
+            self._raiz_suja = True
+        self._sujos.add(antiga)
@@ -0,0 +1,152 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+# ==========================================
+# Spatial index over laid-out units and municipalities
+# ==========================================
+# Points are projected onto the unit sphere (x, y, z), so the KD-tree's Euclidean
+# (chord) distance is monotonic with the great-circle distance: radius and k-nearest
+# queries are exact anywhere on the globe, with no projection distortion.
+
+RAIO_TERRA_KM = 6371.0088
+
+def para_cartesiano(lat, lon):
+    """Converts latitude/longitude arrays (degrees) into unit-sphere (N, 3) coordinates."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+def km_para_corda(distancia_km):
+    """Great-circle distance (km) -> chord length on the unit sphere."""
+    return 2.0 * np.sin(np.minimum(np.asarray(distancia_km, dtype=np.float64) / RAIO_TERRA_KM, np.pi) / 2.0)
+
+def corda_para_km(corda):
+    """Chord length on the unit sphere -> great-circle distance (km)."""
+    return 2.0 * RAIO_TERRA_KM * np.arcsin(np.clip(np.asarray(corda) / 2.0, 0.0, 1.0))
+
+def pontos_no_poligono(poligono, lat, lon):
+    """Boolean mask of the points (arrays) inside a Shapely polygon (or multipolygon)."""
+    import shapely
+
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    oeste, sul, leste, norte = poligono.bounds
+    mascara = (lon >= oeste) & (lon <= leste) & (lat >= sul) & (lat <= norte)
+    if mascara.any():
+        shapely.prepare(poligono)
+        mascara[mascara] = shapely.contains_xy(poligono, lon[mascara], lat[mascara])
+    return mascara
+
+class IndiceEspacial:
+    """
+    KD-tree over a set of points with batched radius, k-nearest and polygon queries.
+
+    Args:
+        lat, lon (array): Coordinates (degrees) of the indexed points.
+        itens (list): Optional objects (units, snapshot indices, names) aligned with the points.
+        rotulos (list): Optional names used by `posicao` (e.g. municipality names).
+    """
+    def __init__(self, lat, lon, itens=None, rotulos=None):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.itens = itens if itens is not None else list(range(len(self.lat)))
+        self.rotulos = rotulos
+        self._posicoes = None
+        self.arvore = cKDTree(para_cartesiano(self.lat, self.lon))
+
+    def __len__(self):
+        return len(self.lat)
+
+    # ------------------------------------------
+    # Constructors
+    # ------------------------------------------
+    @classmethod
+    def de_unidades(cls, forcas, niveis=None):
+        """Indexes the units of the processar_hierarquia tree (optionally only some levels)."""
+        unidades = []
+        pilha = list(forcas.values())
+        while pilha:
+            unidade = pilha.pop()
+            if (niveis is None or unidade.nivel in niveis) and unidade.lat is not None and unidade.lon is not None:
+                unidades.append(unidade)
+            pilha.extend(unidade.subordinados)
+        return cls(
+            [u.lat for u in unidades], [u.lon for u in unidades],
+            itens=unidades, rotulos=[u.nome for u in unidades],
+        )
+
+    @classmethod
+    def de_snapshot(cls, snapshot, niveis=None):
+        """Indexes the units of a SnapshotHierarquia; items are snapshot indices."""
+        if niveis is None:
+            indices = np.flatnonzero(~np.isnan(snapshot.lat))
+        else:
+            indices = np.concatenate([snapshot.unidades_do_nivel(nivel) for nivel in niveis])
+            indices = indices[~np.isnan(snapshot.lat[indices])]
+        return cls(snapshot.lat[indices], snapshot.lon[indices], itens=indices)
+
+    @classmethod
+    def de_municipios(cls, cidades_df):
+        """Indexes municipalities (columns Nome, Latitude, Longitude)."""
+        cidades = cidades_df.dropna(subset=['Latitude', 'Longitude'])
+        return cls(
+            cidades['Latitude'].astype(float).values, cidades['Longitude'].astype(float).values,
+            itens=cidades.index.values, rotulos=cidades['Nome'].tolist(),
+        )
+
+    def posicao(self, rotulo):
+        """Returns (lat, lon) of the first point with the given label."""
+        if self._posicoes is None:
+            self._posicoes = {}
+            for i, nome in enumerate(self.rotulos or ()):
+                self._posicoes.setdefault(nome, i)
+        i = self._posicoes[rotulo]
+        return self.lat[i], self.lon[i]
+
+    # ------------------------------------------
+    # Queries (scalars or arrays of query points)
+    # ------------------------------------------
+    def no_raio(self, lat, lon, raio_km):
+        """
+        Points within `raio_km` of each query point.
+
+        Returns:
+            list: One array of point indices per query point (a single array for a scalar query).
+        """
+        escalar = np.ndim(lat) == 0
+        consultas = para_cartesiano(np.atleast_1d(lat), np.atleast_1d(lon))
+        resultado = self.arvore.query_ball_point(consultas, km_para_corda(raio_km), return_sorted=True)
+        resultado = [np.asarray(indices, dtype=np.intp) for indices in resultado]
+        return resultado[0] if escalar else resultado
+
+    def contar_no_raio(self, lat, lon, raio_km):
+        """Number of points within `raio_km` of each query point."""
+        consultas = para_cartesiano(np.atleast_1d(lat), np.atleast_1d(lon))
+        return self.arvore.query_ball_point(consultas, km_para_corda(raio_km), return_length=True)
+
+    def k_proximos(self, lat, lon, k=1, raio_max_km=None):
+        """
+        The k nearest points of each query point.
+
+        Returns:
+            tuple: (distances in km, point indices), each shaped (n_queries, k);
+                   missing neighbours have distance inf and index len(self).
+        """
+        consultas = para_cartesiano(np.atleast_1d(lat), np.atleast_1d(lon))
+        limite = np.inf if raio_max_km is None else km_para_corda(raio_max_km)
+        cordas, indices = self.arvore.query(consultas, k=k, distance_upper_bound=limite)
+        cordas = np.asarray(cordas).reshape(len(consultas), k)
+        indices = np.asarray(indices).reshape(len(consultas), k)
+        distancias = np.where(np.isinf(cordas), np.inf, corda_para_km(np.where(np.isinf(cordas), 0.0, cordas)))
+        return distancias, indices
+
+    def dentro_do_poligono(self, poligono):
+        """Indices of the indexed points inside a Shapely polygon (e.g. from a KMZ)."""
+        return np.flatnonzero(pontos_no_poligono(poligono, self.lat, self.lon))
+
+    def selecionar(self, indices):
+        """Maps point indices back to the indexed items."""
+        if isinstance(self.itens, np.ndarray):
+            return self.itens[indices]
+        return [self.itens[i] for i in indices]
@@ -0,0 +1,153 @@
+import math
+import os
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+
+# ==========================================
+# Tiled KML output with Region/Lod and NetworkLinks
+# ==========================================
+# Each layer ("camada") is a list of points plus a tile size (degrees) and the
+# minimum/maximum Lod pixels at which its tiles become visible. The root KML only
+# holds NetworkLinks; Google Earth loads a tile when its Region becomes active.
+#
+# A point is a dict with the keys: name, lat, lon, description and, optionally,
+# icon (href) and scale.
+
+
+def slug(texto):
+    """Converts a layer name into an ASCII token usable in file names."""
+    ascii_texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode('ascii')
+    return ''.join(c if c.isalnum() else '_' for c in ascii_texto).strip('_') or 'camada'
+
+
+def chave_tile(lat, lon, tamanho):
+    """Returns the (row, column) index of the tile that contains the coordinate."""
+    return math.floor(lat / tamanho), math.floor(lon / tamanho)
+
+
+def limites_tile(chave, tamanho):
+    """Returns (north, south, east, west) of a tile."""
+    linha, coluna = chave
+    sul, oeste = linha * tamanho, coluna * tamanho
+    return sul + tamanho, sul, oeste + tamanho, oeste
+
+
+def nome_arquivo_tile(camada, chave):
+    """File name (relative to the output directory) of a tile."""
+    return os.path.join("tiles", f"{slug(camada)}_{chave[0]}_{chave[1]}.kml")
+
+
+def agrupar_em_tiles(pontos, tamanho):
+    """Groups points by tile key."""
+    tiles = {}
+    for ponto in pontos:
+        tiles.setdefault(chave_tile(ponto['lat'], ponto['lon'], tamanho), []).append(ponto)
+    return tiles
+
+
+def _aplicar_regiao(feature, chave, tamanho, min_lod, max_lod):
+    norte, sul, leste, oeste = limites_tile(chave, tamanho)
+    feature.region.latlonaltbox.north = norte
+    feature.region.latlonaltbox.south = sul
+    feature.region.latlonaltbox.east = leste
+    feature.region.latlonaltbox.west = oeste
+    feature.region.lod.minlodpixels = min_lod
+    feature.region.lod.maxlodpixels = max_lod
+
+
+def escrever_tile(tarefa):
+    """Writes a single tile file. Runs inside the worker processes."""
+    from simplekml import Kml
+
+    caminho, camada, chave, tamanho, min_lod, max_lod, pontos = tarefa
+    kml = Kml(name=f"{camada} {chave[0]}_{chave[1]}")
+    folder = kml.newfolder(name=camada)
+    _aplicar_regiao(folder, chave, tamanho, min_lod, max_lod)
+
+    for ponto in pontos:
+        marcador = folder.newpoint(name=ponto['name'], coords=[(ponto['lon'], ponto['lat'])])
+        marcador.description = ponto.get('description')
+        if ponto.get('icon'):
+            marcador.style.iconstyle.icon.href = ponto['icon']
+            marcador.style.iconstyle.scale = ponto.get('scale', 1.0)
+
+    kml.save(caminho)
+    return caminho
+
+
+def escrever_documento_raiz(output_dir, camadas, indice, nome_raiz="doc.kml"):
+    """Writes the root KML with one folder per layer and a NetworkLink per tile."""
+    from simplekml import Kml, ViewRefreshMode
+
+    kml = Kml(name=os.path.splitext(nome_raiz)[0])
+
+    for camada, config in camadas.items():
+        folder = kml.newfolder(name=f"Level: {camada}")
+        for chave in sorted(indice.get(camada, ())):
+            link = folder.newnetworklink(name=f"{camada} {chave[0]}_{chave[1]}")
+            link.link.href = nome_arquivo_tile(camada, chave).replace(os.sep, '/')
+            link.link.viewrefreshmode = ViewRefreshMode.onregion
+            _aplicar_regiao(link, chave, config['tamanho_tile'], config.get('min_lod', 0), config.get('max_lod', -1))
+
+    caminho = os.path.join(output_dir, nome_raiz)
+    kml.save(caminho)
+    return caminho
+
+
+def tarefa_tile(output_dir, camada, chave, config, pontos):
+    """Builds the worker task that writes one tile of a layer."""
+    caminho = os.path.join(output_dir, nome_arquivo_tile(camada, chave))
+    return (caminho, camada, chave, config['tamanho_tile'],
+            config.get('min_lod', 0), config.get('max_lod', -1), pontos)
+
+
+def escrever_tiles(tarefas, processos=None):
+    """Writes tile tasks on a process pool (sequentially for 1 process or a single tile)."""
+    if processos == 1 or len(tarefas) < 2:
+        for tarefa in tarefas:
+            escrever_tile(tarefa)
+    else:
+        with ProcessPoolExecutor(max_workers=processos) as executor:
+            chunksize = max(1, len(tarefas) // ((processos or os.cpu_count() or 1) * 4))
+            list(executor.map(escrever_tile, tarefas, chunksize=chunksize))
+
+
+def gerar_kml_tiles(camadas, output_dir, processos=None, apenas_tiles=None, nome_raiz="doc.kml"):
+    """
+    Splits every layer into spatial tiles and writes them in parallel, plus a root
+    KML of NetworkLinks with Region/Lod so viewers only load what is on screen.
+
+    Args:
+        camadas (dict): Layer name -> {'pontos', 'tamanho_tile', 'min_lod', 'max_lod'}.
+        output_dir (str): Directory that receives the root KML and the tiles/ folder.
+        processos (int): Worker processes (None = all cores, 1 = sequential).
+        apenas_tiles (set): Optional set of (camada, chave) to (re)write; the root
+            document is always rewritten so new tiles are linked.
+
+    Returns:
+        dict: Layer name -> set of tile keys present in the output.
+    """
+    os.makedirs(os.path.join(output_dir, "tiles"), exist_ok=True)
+
+    indice = {}
+    tarefas = []
+    for camada, config in camadas.items():
+        tiles = agrupar_em_tiles(config['pontos'], config['tamanho_tile'])
+        indice[camada] = set(tiles)
+        for chave, pontos in tiles.items():
+            if apenas_tiles is not None and (camada, chave) not in apenas_tiles:
+                continue
+            tarefas.append(tarefa_tile(output_dir, camada, chave, config, pontos))
+
+    # Tiles that became empty are removed so stale placemarks do not linger
+    if apenas_tiles is not None:
+        for camada, chave in apenas_tiles:
+            if chave not in indice.get(camada, ()):
+                caminho = os.path.join(output_dir, nome_arquivo_tile(camada, chave))
+                if os.path.exists(caminho):
+                    os.remove(caminho)
+
+    escrever_tiles(tarefas, processos)
+    escrever_documento_raiz(output_dir, camadas, indice, nome_raiz=nome_raiz)
+    return indice
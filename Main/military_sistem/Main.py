@@ -1,8 +1,17 @@
 import random
-from simplekml import Kml
+import os
+import sys
 import pandas as pd
 import math
 
+from Arquivos_Militares import ARQUIVO_CIDADES, ARQUIVO_UNIDADES
+from KML_Tiles import gerar_kml_tiles
+from Contagem_Unidades import aplicar_efetivos
+
+# The stage cache lives next to the subsystem folders
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Cache_Etapas import Arquivo, em_cache
+
 # ==========================================
 # Classe base para representar uma unidade hierárquica
 # ==========================================
@@ -16,17 +25,28 @@ class Unidade:
         self.lon = lon
         self.imagem = imagem  # Link to the image
         self.cargo_comando = cargo_comando  # Command role for the unit
+        self.efetivo = 0  # Manpower of the unit and its subordinates
+        self.superior = None  # Unit this one reports to (None for a force)
+        self.cidade = None  # Home municipality (garrison city)
+        self.posicao_fixa = False  # Set by a rebase: the superior's layout keeps lat/lon
         self.subordinados = []
 
     def adicionar_subordinado(self, unidade):
         """Adds a subordinate unit."""
+        unidade.superior = self
         self.subordinados.append(unidade)
 
+    def remover_subordinado(self, unidade):
+        """Removes a subordinate unit."""
+        self.subordinados = [sub for sub in self.subordinados if sub is not unidade]
+        unidade.superior = None
+
     def gerar_coordenadas(self, lat_base, lon_base, total_subordinados, raio):
-        """Generates coordinates for subordinates arranged in a circle."""
-        if total_subordinados > 0:
-            coordenadas = gerar_coordenadas_circulo((lat_base, lon_base), total_subordinados, raio)
-            for i, unidade in enumerate(self.subordinados):
+        """Generates coordinates for subordinates arranged in a circle (rebased ones keep theirs)."""
+        livres = [u for u in self.subordinados if not getattr(u, 'posicao_fixa', False)]
+        if total_subordinados > 0 and livres:
+            coordenadas = gerar_coordenadas_circulo((lat_base, lon_base), len(livres), raio)
+            for i, unidade in enumerate(livres):
                 unidade.lat, unidade.lon = coordenadas[i]
 
 # ==========================================
@@ -135,6 +155,7 @@ def processar_hierarquia(df_ativas, cidades_df, unidades_df):
         if not exercito:
             cargo_comando = f"{row['Cargo_Exercito']} {exercito_nome}" if 'Cargo_Exercito' in row else None
             exercito = Exercito(exercito_nome, id_unico=len(forcas[forca_nome].subordinados) + 1, coord=coords_ex, imagem=ex_imagem, cargo_comando=cargo_comando)
+            exercito.cidade = row.get('Cidade') if pd.notna(row.get('Cidade')) else None
             forcas[forca_nome].adicionar_subordinado(exercito)
 
         # Add division
@@ -144,8 +165,10 @@ def processar_hierarquia(df_ativas, cidades_df, unidades_df):
             divisao = Divisao(divisao_nome, id_unico=len(exercito.subordinados) + 1, imagem=div_imagem, cargo_comando=cargo_comando)
             if coords_div:
                 divisao.lat, divisao.lon = coords_div['lat'], coords_div['lon']
+                divisao.cidade = row.get('Cidade_Div')
             else:
                 divisao.lat, divisao.lon = exercito.lat, exercito.lon
+                divisao.cidade = exercito.cidade
             exercito.adicionar_subordinado(divisao)
 
         # Add brigade
@@ -155,8 +178,10 @@ def processar_hierarquia(df_ativas, cidades_df, unidades_df):
             brigada = Brigada(brigada_nome, id_unico=len(divisao.subordinados) + 1, imagem=bri_imagem, cargo_comando=cargo_comando)
             if coords_brig:
                 brigada.lat, brigada.lon = coords_brig['lat'], coords_brig['lon']
+                brigada.cidade = row.get('Cidade_Brig')
             else:
                 brigada.lat, brigada.lon = divisao.lat, divisao.lon
+                brigada.cidade = divisao.cidade
             divisao.adicionar_subordinado(brigada)
 
         # Add regiments
@@ -164,15 +189,45 @@ def processar_hierarquia(df_ativas, cidades_df, unidades_df):
             cargo_comando = buscar_cargo_regimento(regimento_nome)
             regimento = Regimento(regimento_nome, id_unico=len(brigada.subordinados) + 1, imagem=reg_imagem, cargo_comando=cargo_comando)
             regimento.lat, regimento.lon = brigada.lat, brigada.lon
+            regimento.cidade = brigada.cidade
             brigada.adicionar_subordinado(regimento)
 
     return forcas
 
+# ==========================================
+# Function to build the placemark description of a unit
+# ==========================================
+def descrever_unidade(unidade, hierarquia_superior=None):
+    """Builds the HTML description and icon path of a unit placemark."""
+    subordinados = [sub.nome for sub in unidade.subordinados]
+
+    description = (
+        f"<b>Unit:</b> {unidade.nome}<br>"
+        f"<b>ID:</b> {unidade.id_unico}<br>"
+        f"<b>Comandante:</b> {unidade.cargo_comando if unidade.cargo_comando else 'None'}<br>"
+        f"<b>Efetivo:</b> {unidade.efetivo}<br>"
+        f"<b>Superior Units:</b><br>{' > '.join(hierarquia_superior) if hierarquia_superior else 'None'}<br>"
+    )
+
+    if subordinados:
+        description += "<b>Subordinate Units:</b><br>" + "<br>".join(subordinados) + "<br>"
+    else:
+        description += "<b>Subordinate Units:</b> Batalhão<br>"
+
+    caminho_completo = None
+    if unidade.imagem:
+        caminho_completo = f"Main/military_sistem/{unidade.imagem}"
+        description += f"<br><img src='{caminho_completo}' width='200'/>"
+
+    return description, caminho_completo
+
 # ==========================================
 # Function to generate a KML file with hierarchical layers
 # ==========================================
 def gerar_kml_com_camadas(forcas, niveis, output_file):
     """Generates a single KML containing layers (folders) for each specified level."""
+    from simplekml import Kml
+
     kml = Kml()
 
     def adicionar_unidades_por_nivel(unidade, nivel, folder, hierarquia_superior=None):
@@ -184,24 +239,9 @@ def gerar_kml_com_camadas(forcas, niveis, output_file):
                 name=f"{unidade.nome} (ID: {unidade.id_unico})",
                 coords=[(unidade.lon, unidade.lat)]
             )
-            subordinados = [sub.nome for sub in unidade.subordinados]
-
-            description = (
-                f"<b>Unit:</b> {unidade.nome}<br>"
-                f"<b>ID:</b> {unidade.id_unico}<br>"
-                f"<b>Comandante:</b> {unidade.cargo_comando if unidade.cargo_comando else 'None'}<br>"
-                f"<b>Superior Units:</b><br>{' > '.join(hierarquia_superior) if hierarquia_superior else 'None'}<br>"
-            )
-
-            if subordinados:
-                description += "<b>Subordinate Units:</b><br>" + "<br>".join(subordinados) + "<br>"
-            else:
-                description += "<b>Subordinate Units:</b> Batalhão<br>"
-
-            if unidade.imagem:
-                caminho_completo = f"Main/military_sistem/{unidade.imagem}"
-                description += f"<br><img src='{caminho_completo}' width='200'/>"
+            description, caminho_completo = descrever_unidade(unidade, hierarquia_superior)
 
+            if caminho_completo:
                 ponto.style.iconstyle.icon.href = caminho_completo
                 ponto.style.iconstyle.scale = 1.0
             ponto.description = description
@@ -217,51 +257,118 @@ def gerar_kml_com_camadas(forcas, niveis, output_file):
     kml.save(output_file)
     print(f"KML '{output_file}' generated with specified levels.")
 
+# ==========================================
+# Tiled (Region/Lod + NetworkLink) KML output
+# ==========================================
+# Tile size in degrees and minimum Lod pixels per level: higher levels use large,
+# always-visible tiles; regiments only load when the viewer is zoomed in.
+LOD_NIVEIS = {
+    "Exército": {'tamanho_tile': 8.0, 'min_lod': 0},
+    "Divisão": {'tamanho_tile': 2.0, 'min_lod': 128},
+    "Brigada": {'tamanho_tile': 0.5, 'min_lod': 256},
+    "Regimento": {'tamanho_tile': 0.1, 'min_lod': 512},
+}
+
+def ponto_unidade(unidade, hierarquia_superior=None):
+    """Returns the placemark data (as used by KML_Tiles) of a unit."""
+    description, caminho_completo = descrever_unidade(unidade, hierarquia_superior)
+    return {
+        'name': f"{unidade.nome} (ID: {unidade.id_unico})",
+        'lat': unidade.lat,
+        'lon': unidade.lon,
+        'description': description,
+        'icon': caminho_completo,
+    }
+
+def coletar_pontos_por_nivel(forcas, niveis):
+    """Collects the placemark data of every positioned unit, grouped by level."""
+    pontos = {nivel: [] for nivel in niveis}
+
+    def visitar(unidade, hierarquia_superior):
+        if unidade.nivel in pontos and unidade.lat is not None and unidade.lon is not None:
+            pontos[unidade.nivel].append(ponto_unidade(unidade, hierarquia_superior))
+        for subordinado in unidade.subordinados:
+            visitar(subordinado, hierarquia_superior + [unidade.nome])
+
+    for forca in forcas.values():
+        visitar(forca, [])
+    return pontos
+
+def gerar_kml_em_tiles(forcas, niveis, output_dir, lod_niveis=None, processos=None):
+    """Generates a tiled KML (root doc.kml + NetworkLinked tiles) for the specified levels."""
+    lod_niveis = lod_niveis or LOD_NIVEIS
+    pontos = coletar_pontos_por_nivel(forcas, niveis)
+    camadas = {
+        nivel: {**lod_niveis.get(nivel, LOD_NIVEIS["Regimento"]), 'pontos': pontos[nivel]}
+        for nivel in niveis
+    }
+    indice = gerar_kml_tiles(camadas, output_dir, processos=processos)
+    print(f"Tiled KML generated in '{output_dir}' ({sum(len(t) for t in indice.values())} tiles).")
+    return indice
+
 # ==========================================
 # Function to generate coordinates for all hierarchical levels
 # ==========================================
+# Divisor of the initial radius used when a unit of each level lays out its subordinates
+DIVISOR_RAIO = {"Exército": 1, "Divisão": 2, "Brigada": 3, "Regimento": 4}
+
+def gerar_coordenadas_subarvore(unidade, raio_inicial=0.01):
+    """Generates coordinates for the subordinates of a unit and, recursively, their subtrees."""
+    divisor = DIVISOR_RAIO.get(unidade.nivel)
+    if divisor is not None:
+        unidade.gerar_coordenadas(unidade.lat, unidade.lon, len(unidade.subordinados), raio_inicial / divisor)
+
+    for subordinado in unidade.subordinados:
+        if subordinado.lat is None or subordinado.lon is None:
+            subordinado.lat, subordinado.lon = unidade.lat, unidade.lon
+        gerar_coordenadas_subarvore(subordinado, raio_inicial)
+
 def gerar_coordenadas_todos_niveis(forcas, raio_inicial=0.01):
     """Generates coordinates for all units in all hierarchical levels."""
     for forca in forcas.values():
         if forca.lat is None or forca.lon is None:
             forca.lat, forca.lon = 0.0, 0.0
-
-        for exercito in forca.subordinados:
-            if exercito.lat is None or exercito.lon is None:
-                exercito.lat, exercito.lon = forca.lat, forca.lon
-            exercito.gerar_coordenadas(exercito.lat, exercito.lon, len(exercito.subordinados), raio_inicial)
-
-            for divisao in exercito.subordinados:
-                if divisao.lat is None or divisao.lon is None:
-                    divisao.lat, divisao.lon = exercito.lat, exercito.lon
-                divisao.gerar_coordenadas(divisao.lat, divisao.lon, len(divisao.subordinados), raio_inicial / 2)
-
-                for brigada in divisao.subordinados:
-                    if brigada.lat is None or brigada.lon is None:
-                        brigada.lat, brigada.lon = divisao.lat, divisao.lon
-                    brigada.gerar_coordenadas(brigada.lat, brigada.lon, len(brigada.subordinados), raio_inicial / 3)
-
-                    for regimento in brigada.subordinados:
-                        if regimento.lat is None or regimento.lon is None:
-                            regimento.lat, regimento.lon = brigada.lat, brigada.lon
-                        regimento.gerar_coordenadas(regimento.lat, regimento.lon, len(regimento.subordinados), raio_inicial / 4)
+        gerar_coordenadas_subarvore(forca, raio_inicial)
 
 # ==========================================
 # Load data and process the hierarchy
 # ==========================================
-df_ativas = pd.read_excel('Main/military_sistem/Data_Military_Units.ods', sheet_name='Ativas')
-cidades_df = pd.read_excel('Main/citizen_generator/Filtered_Pop_Municipio.ods', sheet_name='Main')
-unidades_df = pd.read_excel('Main/military_sistem/Data_Military_Units.ods', sheet_name='Unidades')
+def carregar_dados(arquivo_unidades=ARQUIVO_UNIDADES, arquivo_cidades=ARQUIVO_CIDADES):
+    """Reads the active units, the cities and the regiment types."""
+    df_ativas = pd.read_excel(arquivo_unidades, sheet_name='Ativas')
+    cidades_df = pd.read_excel(arquivo_cidades, sheet_name='Main')
+    unidades_df = pd.read_excel(arquivo_unidades, sheet_name='Unidades')
+
+    # Fix coordinate format in city DataFrame
+    cidades_df['Latitude'] = cidades_df['Latitude'].apply(lambda x: float(str(x).replace(',', '.')))
+    cidades_df['Longitude'] = cidades_df['Longitude'].apply(lambda x: float(str(x).replace(',', '.')))
+    return df_ativas, cidades_df, unidades_df
+
+def construir_hierarquia(df_ativas, cidades_df, unidades_df, raio_inicial=0.01):
+    """Builds the hierarchy with manpower roll-ups and laid-out coordinates."""
+    forcas = processar_hierarquia(df_ativas, cidades_df, unidades_df)
+    aplicar_efetivos(forcas, df_ativas, unidades_df)
+    gerar_coordenadas_todos_niveis(forcas, raio_inicial)
+    return forcas
+
+def main(tiles=False, arquivo_unidades=ARQUIVO_UNIDADES, arquivo_cidades=ARQUIVO_CIDADES,
+         output_file="unidades.kml", output_dir="unidades_tiles", cache=None):
+    df_ativas, cidades_df, unidades_df = em_cache(cache, carregar_dados, Arquivo(arquivo_unidades), Arquivo(arquivo_cidades))
 
-# Fix coordinate format in city DataFrame
-cidades_df['Latitude'] = cidades_df['Latitude'].apply(lambda x: float(str(x).replace(',', '.')))
-cidades_df['Longitude'] = cidades_df['Longitude'].apply(lambda x: float(str(x).replace(',', '.')))
+    # Process the hierarchy and generate KML
+    forcas = em_cache(
+        cache, construir_hierarquia, df_ativas, cidades_df, unidades_df,
+    )
 
-# Process the hierarchy and generate KML
-forcas = processar_hierarquia(df_ativas, cidades_df, unidades_df)
-gerar_coordenadas_todos_niveis(forcas)
+    # Specify levels for KML
+    niveis = ["Exército", "Divisão", "Brigada", "Regimento"]
 
-# Specify levels for KML
-niveis = ["Exército", "Divisão", "Brigada", "Regimento"]
+    # The tiled output (Region/Lod) replaces the single flat file
+    if tiles:
+        gerar_kml_em_tiles(forcas, niveis, output_dir=output_dir)
+    else:
+        gerar_kml_com_camadas(forcas, niveis, output_file=output_file)
+    return forcas
 
-gerar_kml_com_camadas(forcas, niveis, output_file="unidades.kml")
+if __name__ == "__main__":
+    main(tiles="--tiles" in sys.argv)
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+
+from Arquivos_Militares import ARQUIVO_CIDADES, ARQUIVO_UNIDADES
+
+# The code version helper lives next to the subsystem folders
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Versao_Codigo import versao_arquivos
+
+# ==========================================
+# Versioned binary snapshot of the built hierarchy
+# ==========================================
+# The snapshot is a directory of .npy arrays (opened with mmap_mode='r') plus a
+# manifest. Units are stored in breadth-first order, so the subordinates of unit i
+# are the contiguous range [primeiro_subordinado[i], primeiro_subordinado[i] + n_subordinados[i]).
+# Strings (names, command roles, images) are kept in a UTF-8 vocabulary table.
+# Reading a snapshot needs only numpy: no pandas and no ODF parsing.
+
+VERSAO_SNAPSHOT = 1
+NIVEIS = ["Força", "Exército", "Divisão", "Brigada", "Regimento"]
+COLUNAS_TEXTO = ["nome", "cargo_comando", "imagem"]
+# Code that builds the hierarchy (Main and the project modules it imports) and writes the snapshot
+ARQUIVOS_CODIGO = [os.path.join(os.path.dirname(os.path.abspath(__file__)), nome)
+                   for nome in ('Main.py', 'Snapshot_Hierarquia.py')]
+
+def hash_arquivo(caminho, bloco=1 << 20):
+    """Returns the SHA-256 of a file's contents."""
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for parte in iter(lambda: arquivo.read(bloco), b''):
+            sha.update(parte)
+    return sha.hexdigest()
+
+def chave_snapshot(arquivos_entrada, parametros=None):
+    """
+    Key of a snapshot: format version + hashes of the input files + build parameters +
+    version of the code that builds it (read from the sources, nothing is imported).
+    """
+    hashes = {os.path.basename(caminho): hash_arquivo(caminho) for caminho in arquivos_entrada}
+    conteudo = json.dumps(
+        {'versao': VERSAO_SNAPSHOT, 'codigo': versao_arquivos(*ARQUIVOS_CODIGO), 'entradas': hashes,
+         'parametros': parametros or {}},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()[:16], hashes
+
+def _vocabulario(valores):
+    """Encodes strings (None allowed) as codes into a vocabulary of unique strings."""
+    indices = {}
+    codigos = np.full(len(valores), -1, dtype=np.int32)
+    for i, valor in enumerate(valores):
+        if valor is None or (isinstance(valor, float) and np.isnan(valor)):
+            continue
+        codigos[i] = indices.setdefault(str(valor), len(indices))
+
+    textos = [texto.encode('utf-8') for texto in indices]
+    offsets = np.zeros(len(textos) + 1, dtype=np.int64)
+    np.cumsum([len(texto) for texto in textos], out=offsets[1:])
+    dados = np.frombuffer(b''.join(textos), dtype=np.uint8)
+    return codigos, offsets, dados
+
+def salvar_snapshot(forcas, diretorio, hashes_entrada=None):
+    """Flattens the hierarchy (breadth first) and writes it atomically as a snapshot directory."""
+    unidades = list(forcas.values())
+    superior = [-1] * len(unidades)
+    primeiro = []
+    quantidade = []
+
+    # Breadth-first flattening: children of each unit are appended contiguously
+    i = 0
+    while i < len(unidades):
+        unidade = unidades[i]
+        primeiro.append(len(unidades))
+        quantidade.append(len(unidade.subordinados))
+        unidades.extend(unidade.subordinados)
+        superior.extend([i] * len(unidade.subordinados))
+        i += 1
+
+    arrays = {
+        'id_unico': np.array([u.id_unico for u in unidades], dtype=np.int32),
+        'nivel': np.array([NIVEIS.index(u.nivel) for u in unidades], dtype=np.int8),
+        'superior': np.array(superior, dtype=np.int32),
+        'primeiro_subordinado': np.array(primeiro, dtype=np.int32),
+        'n_subordinados': np.array(quantidade, dtype=np.int32),
+        'lat': np.array([np.nan if u.lat is None else u.lat for u in unidades], dtype=np.float64),
+        'lon': np.array([np.nan if u.lon is None else u.lon for u in unidades], dtype=np.float64),
+        'efetivo': np.array([getattr(u, 'efetivo', 0) for u in unidades], dtype=np.int64),
+    }
+    for coluna in COLUNAS_TEXTO:
+        codigos, offsets, dados = _vocabulario([getattr(u, coluna) for u in unidades])
+        arrays[f'{coluna}_codigo'] = codigos
+        arrays[f'{coluna}_offsets'] = offsets
+        arrays[f'{coluna}_dados'] = dados
+
+    temporario = f"{diretorio}.tmp{os.getpid()}"
+    shutil.rmtree(temporario, ignore_errors=True)
+    os.makedirs(temporario)
+    for nome, array in arrays.items():
+        np.save(os.path.join(temporario, f'{nome}.npy'), array)
+
+    manifesto = {
+        'versao': VERSAO_SNAPSHOT,
+        'n_unidades': len(unidades),
+        'niveis': NIVEIS,
+        'entradas': hashes_entrada or {},
+        'arrays': sorted(arrays),
+    }
+    with open(os.path.join(temporario, 'manifest.json'), 'w', encoding='utf-8') as arquivo:
+        json.dump(manifesto, arquivo, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(diretorio, ignore_errors=True)
+    os.replace(temporario, diretorio)
+    return diretorio
+
+class SnapshotHierarquia:
+    """Read-only, memory-mapped view of a hierarchy snapshot."""
+    def __init__(self, diretorio):
+        with open(os.path.join(diretorio, 'manifest.json'), encoding='utf-8') as arquivo:
+            self.manifesto = json.load(arquivo)
+        if self.manifesto['versao'] != VERSAO_SNAPSHOT:
+            raise ValueError(
+                f"Snapshot versão {self.manifesto['versao']} incompatível (esperada {VERSAO_SNAPSHOT})."
+            )
+        self.diretorio = diretorio
+        self.arrays = {
+            nome: np.load(os.path.join(diretorio, f'{nome}.npy'), mmap_mode='r')
+            for nome in self.manifesto['arrays']
+        }
+        self._indice_nomes = None
+
+    def __len__(self):
+        return self.manifesto['n_unidades']
+
+    def __getattr__(self, nome):
+        arrays = self.__dict__.get('arrays', {})
+        if nome in arrays:
+            return arrays[nome]
+        raise AttributeError(nome)
+
+    def texto(self, coluna, i):
+        """Decodes the string of column `coluna` ('nome', 'cargo_comando', 'imagem') for unit i."""
+        codigo = self.arrays[f'{coluna}_codigo'][i]
+        if codigo < 0:
+            return None
+        offsets = self.arrays[f'{coluna}_offsets']
+        return bytes(self.arrays[f'{coluna}_dados'][offsets[codigo]:offsets[codigo + 1]]).decode('utf-8')
+
+    def nome(self, i):
+        return self.texto('nome', i)
+
+    def subordinados(self, i):
+        """Indices of the direct subordinates of unit i."""
+        inicio = int(self.primeiro_subordinado[i])
+        return np.arange(inicio, inicio + int(self.n_subordinados[i]))
+
+    def superiores(self, i):
+        """Indices of the superiors of unit i, from the direct superior up to the force."""
+        cadeia = []
+        i = int(self.superior[i])
+        while i >= 0:
+            cadeia.append(i)
+            i = int(self.superior[i])
+        return cadeia
+
+    def unidades_do_nivel(self, nivel):
+        """Indices of all units of a level (e.g. "Regimento")."""
+        return np.flatnonzero(self.nivel == NIVEIS.index(nivel))
+
+    def buscar(self, nome):
+        """Indices of the units with a given name."""
+        if self._indice_nomes is None:
+            # Built once from the vocabulary: name -> contiguous slice of units sorted by name code
+            codigos = self.arrays['nome_codigo']
+            offsets = self.arrays['nome_offsets']
+            dados = self.arrays['nome_dados']
+            ordem = np.argsort(codigos, kind='stable')
+            limites = np.searchsorted(codigos[ordem], np.arange(len(offsets)))
+            self._indice_nomes = {
+                bytes(dados[offsets[c]:offsets[c + 1]]).decode('utf-8'): ordem[limites[c]:limites[c + 1]]
+                for c in range(len(offsets) - 1)
+            }
+        return self._indice_nomes.get(nome, np.array([], dtype=np.int64))
+
+    def registro(self, i):
+        """Returns a dict with every field of unit i."""
+        return {
+            'indice': int(i),
+            'nome': self.nome(i),
+            'nivel': NIVEIS[self.nivel[i]],
+            'id_unico': int(self.id_unico[i]),
+            'lat': float(self.lat[i]),
+            'lon': float(self.lon[i]),
+            'efetivo': int(self.efetivo[i]),
+            'cargo_comando': self.texto('cargo_comando', i),
+            'imagem': self.texto('imagem', i),
+            'superior': int(self.superior[i]),
+        }
+
+def carregar_ou_construir(diretorio_base, arquivo_unidades=None, arquivo_cidades=None, raio_inicial=0.01):
+    """
+    Opens the snapshot that matches the current input files, building it first if
+    it does not exist. Only the build path imports pandas (through Main) and reads the workbooks.
+    """
+    arquivo_unidades = arquivo_unidades or ARQUIVO_UNIDADES
+    arquivo_cidades = arquivo_cidades or ARQUIVO_CIDADES
+    chave, hashes = chave_snapshot([arquivo_unidades, arquivo_cidades], {'raio_inicial': raio_inicial})
+    diretorio = os.path.join(diretorio_base, chave)
+
+    if not os.path.exists(os.path.join(diretorio, 'manifest.json')):
+        from Main import carregar_dados, construir_hierarquia
+
+        forcas = construir_hierarquia(*carregar_dados(arquivo_unidades, arquivo_cidades), raio_inicial=raio_inicial)
+        salvar_snapshot(forcas, diretorio, hashes_entrada=hashes)
+    return SnapshotHierarquia(diretorio)
+
+if __name__ == "__main__":
+    snapshot = carregar_ou_construir(sys.argv[1] if len(sys.argv) > 1 else "snapshot_hierarquia")
+    print(f"Snapshot '{snapshot.diretorio}' com {len(snapshot)} unidades.")
@@ -0,0 +1,281 @@
+import argparse
+import os
+import sys
+
+# ==========================================
+# statesim: single command line for every subsystem
+# ==========================================
+# Only argparse/os/sys are imported here. Every subcommand imports its own
+# dependencies inside its handler (pandas for counting, geopandas/pykml for the
+# city filter, simplekml for the KML writers, matplotlib for the flowchart), so
+# `--help` and the light commands start without paying for the heavy ones.
+# The scripts read their data with paths relative to their own folder, so each
+# handler resolves the user's paths first and then runs inside that folder.
+#
+#   python statesim.py economy --populacao 200000
+#   python statesim.py population --saida populacao.ods
+#   python statesim.py population --escala 1 --mmap populacao_mmap   (out-of-core, 1:1)
+#   python statesim.py population --consulta "Municipio=Brasília Idade=18:30 Atributo_Ath=71:"
+#   python statesim.py filter-cities --tiles
+#   python statesim.py military --tiles
+#   python statesim.py flowchart --arquivo fluxograma.png --produtos Vidro Papel --profundidade 2
+#   python statesim.py counting Dados_M_OSM.ods
+#   python statesim.py bench-imports
+#   python statesim.py --cache /tmp/statesim population   (stages reused between runs)
+#   python statesim.py cache --limpar
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+PASTAS = {
+    'economia': os.path.join(RAIZ, 'economy_sistem'),
+    'cidadaos': os.path.join(RAIZ, 'citizen_generator'),
+    'militar': os.path.join(RAIZ, 'military_sistem'),
+}
+LIMITE_PARTIDA_MS = 300
+
+# Modules each subcommand imports when it runs (measured by bench-imports)
+MODULOS_SUBCOMANDO = {
+    'economy': ('economia', ['Test_Fabrica_Completo']),
+    'population': ('cidadaos', ['Population_Generator']),
+    'filter-cities': ('cidadaos', ['Filter_City_KMZ', 'geopandas', 'pykml.parser', 'simplekml']),
+    'military': ('militar', ['Main', 'simplekml']),
+    'flowchart': ('economia', ['Fluxograma', 'matplotlib.figure', 'matplotlib.backends.backend_agg']),
+    'counting': ('militar', ['Contagem_Unidades']),
+}
+
+# Import budget of every subcommand in ms (pandas/scipy alone take most of it; about 2x the measured time)
+LIMITE_IMPORT_MS = {
+    'economy': 2000,
+    'population': 2000,
+    'filter-cities': 2000,
+    'military': 1600,
+    'flowchart': 3000,
+    'counting': 1500,
+}
+
+def _absoluto(caminho):
+    return None if caminho is None else os.path.abspath(caminho)
+
+def _entrar(pasta, diretorio=None):
+    """Makes the subsystem folders importable and moves into the folder the script expects."""
+    for caminho in PASTAS.values():
+        if caminho not in sys.path:
+            sys.path.append(caminho)
+    os.chdir(diretorio or PASTAS[pasta])
+
+def _cache(args):
+    """Stage cache selected by the global options (None with --sem-cache)."""
+    if args.sem_cache:
+        return None
+    from Cache_Etapas import CacheEtapas
+
+    return CacheEtapas(_absoluto(args.cache), int(args.cache_limite_mb * 1024 ** 2))
+
+def _relatar_cache(cache):
+    if cache is not None:
+        print(f"Cache de etapas: {cache.acertos} reaproveitadas, {cache.falhas} executadas ({cache.diretorio})")
+
+# ------------------------------------------
+# Subcommands
+# ------------------------------------------
+def comando_economy(args):
+    cache = _cache(args)
+    _entrar('economia')
+    from Test_Fabrica_Completo import main
+
+    main(populacao=args.populacao, cache=cache, taxa_pp=args.taxa_pp, calibrar=args.calibrar, alvo=args.alvo)
+    _relatar_cache(cache)
+
+def comando_population(args):
+    saida = _absoluto(args.saida)
+    cache = _cache(args)
+    _entrar('cidadaos')
+    from Population_Generator import main
+
+    mapeada = _absoluto(args.mmap)
+    populacao = main(output_file=saida, semente=args.semente, cache=cache, scale=args.escala,
+                     households=args.domicilios, age_effects=args.efeitos_idade,
+                     mmap_dir=mapeada, block_rows=args.linhas_bloco)
+    if args.consulta:
+        from Population_Store import PopulationStore, interpretar_filtros
+
+        store = populacao.store() if mapeada is not None else PopulationStore(populacao)
+        for expressao in args.consulta:
+            filtros = interpretar_filtros(expressao)
+            print(f"{expressao}: {store.count(**filtros)} cidadãos, {store.count(weighted=True, **filtros):.0f} pessoas")
+    _relatar_cache(cache)
+
+def comando_filter_cities(args):
+    cache = _cache(args)
+    _entrar('cidadaos')
+    from Filter_City_KMZ import main
+
+    main(tiles=args.tiles, cache=cache)
+    _relatar_cache(cache)
+
+def comando_military(args):
+    unidades, cidades = _absoluto(args.unidades), _absoluto(args.cidades)
+    saida = _absoluto(args.saida or ('unidades_tiles' if args.tiles else 'unidades.kml'))
+    cache = _cache(args)
+    # Main.py reads its default data paths relative to the repository root
+    _entrar('militar', os.path.dirname(RAIZ))
+    from Main import ARQUIVO_CIDADES, ARQUIVO_UNIDADES, main
+
+    main(
+        tiles=args.tiles, arquivo_unidades=unidades or ARQUIVO_UNIDADES, arquivo_cidades=cidades or ARQUIVO_CIDADES,
+        output_file=saida, output_dir=saida, cache=cache,
+    )
+    _relatar_cache(cache)
+
+def comando_flowchart(args):
+    arquivo = _absoluto(args.arquivo)
+    _entrar('economia')
+    from Grafo_Produtos import carregar_tabelas, compilar_grafo
+    from Fluxograma import desenhar_fluxograma, desenhar_subgrafo
+
+    grafo = compilar_grafo(carregar_tabelas('Data_Products.ods'))
+    if args.produtos and args.profundidade is not None:
+        desenhar_subgrafo(grafo, args.produtos, profundidade=args.profundidade, arquivo=arquivo)
+    else:
+        desenhar_fluxograma(grafo, args.produtos or (), arquivo=arquivo)
+    print(f"Fluxograma salvo em '{arquivo}'")
+
+def comando_counting(args):
+    arquivo = _absoluto(args.arquivo)
+    saida = _absoluto(args.saida)
+    _entrar('militar')
+    import pandas as pd
+    from Contagem_Unidades import calcular_total_nivel_quinto, efetivo_por_linha
+
+    df_unidades = pd.read_excel(arquivo, sheet_name='Unidades')
+    df_unidades["Regimento_Total_Unidades_Quinto"] = calcular_total_nivel_quinto(df_unidades)
+    print(df_unidades[["Tipo", "Regimento_Total_Unidades_Quinto"]].to_string(index=False))
+    if args.brigadas:
+        df_brigadas = pd.read_excel(arquivo, sheet_name=args.brigadas)
+        df_brigadas["Total_Brigada"] = efetivo_por_linha(df_brigadas, df_unidades)
+        print(df_brigadas[["Brigada", "Total_Brigada"]].to_string(index=False))
+    if saida is not None:
+        df_unidades.to_excel(saida, index=False)
+
+def comando_cache(args):
+    from Cache_Etapas import CacheEtapas
+
+    cache = CacheEtapas(_absoluto(args.cache), int(args.cache_limite_mb * 1024 ** 2))
+    if args.limpar:
+        cache.limpar()
+        print(f"Cache '{cache.diretorio}' esvaziado")
+        return
+    entradas = cache.entradas()
+    print(f"{cache.diretorio}: {len(entradas)} entradas, {entradas['Bytes'].sum() / 1024 ** 2:.1f} MB")
+    if len(entradas):
+        print(entradas[['Nome', 'Bytes', 'Chave']].to_string(index=False))
+
+def _medir_ms(comando, repeticoes):
+    """Median wall time (ms) of a fresh interpreter running `comando`."""
+    import statistics
+    import subprocess
+    import time
+
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        subprocess.run(comando, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=RAIZ)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos)
+
+def comando_bench_imports(args):
+    """
+    Cold-start benchmark: `statesim <sub> --help` (the CLI itself) and the imports of
+    every subcommand, each in a fresh interpreter. Missing optional modules are reported.
+    Returns 1 when the CLI exceeds LIMITE_PARTIDA_MS or an import exceeds its LIMITE_IMPORT_MS.
+    """
+    import importlib.util
+
+    base = _medir_ms([sys.executable, '-c', 'pass'], args.repeticoes)
+    print(f"{'Alvo':<34}{'ms':>9}  (interpretador vazio: {base:.0f} ms, limite CLI: {LIMITE_PARTIDA_MS} ms)")
+    estourou = False
+    for nome in MODULOS_SUBCOMANDO:
+        tempo = _medir_ms([sys.executable, os.path.abspath(__file__), nome, '--help'], args.repeticoes)
+        estourou |= tempo > LIMITE_PARTIDA_MS
+        print(f"{'statesim ' + nome + ' --help':<34}{tempo:>9.0f}{'  ACIMA DO LIMITE' if tempo > LIMITE_PARTIDA_MS else ''}")
+
+    for nome, (pasta, modulos) in MODULOS_SUBCOMANDO.items():
+        sys.path.insert(0, PASTAS[pasta])
+        faltando = [m for m in modulos if importlib.util.find_spec(m.split('.')[0]) is None]
+        sys.path.pop(0)
+        if faltando:
+            print(f"{'import ' + nome:<34}{'-':>9}  (não instalado: {', '.join(faltando)})")
+            continue
+        codigo = f"import sys; sys.path[:0] = {list(PASTAS.values())!r}; " + '; '.join(f"import {m}" for m in modulos)
+        tempo = _medir_ms([sys.executable, '-c', codigo], args.repeticoes)
+        limite = LIMITE_IMPORT_MS[nome]
+        estourou |= tempo > limite
+        print(f"{'import ' + nome:<34}{tempo:>9.0f}{f'  ACIMA DO LIMITE ({limite} ms)' if tempo > limite else ''}")
+    return 1 if estourou else 0
+
+# ------------------------------------------
+# Parser
+# ------------------------------------------
+def criar_parser():
+    parser = argparse.ArgumentParser(prog='statesim', description="Simulação de estado: economia, população e forças militares")
+    parser.add_argument('--cache', default=None, help="Pasta do cache de etapas (padrão: $STATESIM_CACHE ou Main/.cache_etapas)")
+    parser.add_argument('--sem-cache', action='store_true', help="Executa todas as etapas sem usar o cache")
+    parser.add_argument('--cache-limite-mb', type=float, default=2048, help="Tamanho máximo do cache (LRU)")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p = sub.add_parser('economy', help="Simulação de produção (Test_Fabrica_Completo)")
+    p.add_argument('--populacao', type=float, default=None, help="População atendida (padrão: total dos municípios)")
+    p.add_argument('--taxa-pp', type=float, default=0.5, help="Fração da produtividade plena de todas as indústrias")
+    p.add_argument('--calibrar', action='store_true', help="Calibra a taxa de cada indústria (Calibracao_Produtividade)")
+    p.add_argument('--alvo', type=float, default=0.95, help="Satisfação desejada na calibração")
+    p.set_defaults(funcao=comando_economy)
+
+    p = sub.add_parser('population', help="Gera a população com nomes e atributos")
+    p.add_argument('--saida', default=None, help="Salva a população (.ods/.xlsx)")
+    p.add_argument('--semente', type=int, default=None, help="Semente raiz dos geradores (padrão: 0)")
+    p.add_argument('--escala', type=float, default=1000, help="Pessoas representadas por cidadão gerado (1 = população completa)")
+    p.add_argument('--domicilios', action='store_true', help="Agrupa os cidadãos em domicílios (famílias)")
+    p.add_argument('--efeitos-idade', action='store_true', help="Atributos dependentes da idade (Int e Ath)")
+    p.add_argument('--mmap', default=None, help="Grava os cidadãos em blocos numa pasta colunar mapeada em memória")
+    p.add_argument('--linhas-bloco', type=int, default=1_000_000, help="Cidadãos por bloco com --mmap")
+    p.add_argument('--consulta', action='append', default=None,
+                   help="Conta os cidadãos filtrados, ex.: 'Municipio=Brasília Idade=18:30 Atributo_Ath=71:' (repetível)")
+    p.set_defaults(funcao=comando_population)
+
+    p = sub.add_parser('filter-cities', help="Filtra os municípios pelo polígono do KMZ e gera o KML")
+    p.add_argument('--tiles', action='store_true', help="KML em tiles (Region/Lod)")
+    p.set_defaults(funcao=comando_filter_cities)
+
+    p = sub.add_parser('military', help="Monta a hierarquia militar e gera o KML")
+    p.add_argument('--tiles', action='store_true', help="KML em tiles (Region/Lod)")
+    p.add_argument('--unidades', default=None, help="Planilha das unidades militares")
+    p.add_argument('--cidades', default=None, help="Planilha dos municípios")
+    p.add_argument('--saida', default=None, help="Arquivo KML (ou pasta, com --tiles)")
+    p.set_defaults(funcao=comando_military)
+
+    p = sub.add_parser('flowchart', help="Desenha o fluxograma de produção")
+    p.add_argument('--arquivo', default='fluxograma.png', help="Imagem de saída (PNG/SVG/PDF)")
+    p.add_argument('--produtos', nargs='*', default=None, help="Produtos destacados")
+    p.add_argument('--profundidade', type=int, default=None, help="Desenha só a vizinhança dos produtos")
+    p.set_defaults(funcao=comando_flowchart)
+
+    p = sub.add_parser('counting', help="Efetivo por tipo de regimento (e por brigada)")
+    p.add_argument('arquivo', help="Planilha com a aba 'Unidades'")
+    p.add_argument('--brigadas', default=None, help="Aba das brigadas (colunas Regimento_*)")
+    p.add_argument('--saida', default=None, help="Salva a tabela das unidades")
+    p.set_defaults(funcao=comando_counting)
+
+    p = sub.add_parser('cache', help="Lista ou esvazia o cache de etapas")
+    p.add_argument('--limpar', action='store_true')
+    p.set_defaults(funcao=comando_cache)
+
+    p = sub.add_parser('bench-imports', help="Mede o tempo de partida do CLI e dos imports de cada subcomando")
+    p.add_argument('--repeticoes', type=int, default=5)
+    p.set_defaults(funcao=comando_bench_imports)
+    return parser
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    return args.funcao(args) or 0
+
+if __name__ == "__main__":
+    sys.exit(main())